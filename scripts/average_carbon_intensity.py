@@ -1,28 +1,39 @@
-import json
-from datetime import datetime
-from collections import defaultdict
+import os
 
-with open('carbon_intensity.json') as f:
-    records = json.load(f)
+from hourly_aggregate import STATE_FILE, HourlyAggregate, hourly_average_dict, hourly_ordinal_dict, write_json
+from intensity_log import HISTORY_JSON, STORE_DIR, pending_entries
+from intensity_store import load_store, store_exists
+from zone_ranking import INDEX_FILE, RankingIndex
 
-# Create a dictionary to store running totals and counts
-hourly_stats = defaultdict(lambda: defaultdict(lambda: {"sum": 0, "count": 0}))
+# Resume from the running sums and counts of the previous run, if any, so only
+# the records collected since its high-water mark are read
+if os.path.exists(STATE_FILE):
+    aggregate = HourlyAggregate.load(STATE_FILE)
+else:
+    aggregate = HourlyAggregate()
+if store_exists(STORE_DIR):
+    # data.py in 'log' mode: the store is memory-mapped, so only its columns
+    # after the high-water mark are read
+    added = aggregate.update(load_store(STORE_DIR))
+elif os.path.exists(HISTORY_JSON):
+    # 'json' mode, or 'log' mode before the first compaction: stream
+    # carbon_intensity.json from where the previous run stopped
+    added = aggregate.update_json(HISTORY_JSON)
+else:
+    added = 0
+# Samples of 'log' mode not compacted into the store yet
+added += aggregate.update_records(pending_entries())
+aggregate.save(STATE_FILE)
+print(f"Folded in {added} new records")
 
-for rec in records:
-    # Parse the timestamp and extract the hour (as a zero-padded string)
-    dt = datetime.strptime(rec["time"], "%Y-%m-%d %H:%M:%S")
-    hour = dt.strftime("%H")
-    for zone, value in rec["data"].items():
-        hourly_stats[hour][zone]["sum"] += value
-        hourly_stats[hour][zone]["count"] += 1
+# Write the averages and the per-zone ranking of hours to JSON files
+write_json(hourly_average_dict(aggregate), 'hourly_average.json')
+write_json(hourly_ordinal_dict(aggregate), 'hourly_average_ordinal.json')
 
-# Compute averages
-averages = {}
-for hour, zones in hourly_stats.items():
-    averages[hour] = {}
-    for zone, stats in zones.items():
-        averages[hour][zone] = stats["sum"] / stats["count"]
-
-# Write to a new JSON file
-with open('hourly_average.json', 'w') as out:
-    json.dump(averages, out, indent=4)
+# Refresh the presorted cleanest-zone index, re-sorting only the changed hours
+if os.path.exists(INDEX_FILE):
+    ranking = RankingIndex.load(INDEX_FILE)
+    print(f"Re-sorted buckets: {ranking.update(aggregate)}")
+else:
+    ranking = RankingIndex.from_aggregate(aggregate)
+ranking.save(INDEX_FILE)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+
+import requests
+
+from fake_electricitymaps import start_server
+from zone_fetcher import ZoneFetcher, ZoneListCache
+
+# Compares the old one-connection-per-zone loop with the pooled concurrent
+# fetcher against the local stand-in server.
+
+
+def sequential_fetch(base_url, zone_ids):
+    """
+    The original data.py loop: one fresh connection per zone, no retries.
+    """
+    result = {}
+    for zone_id in zone_ids:
+        response = requests.get(f'{base_url}/carbon-intensity/latest?zone={zone_id}')
+        if response.ok:
+            result[zone_id] = response.json().get('carbonIntensity')
+    return result
+
+
+def run_benchmark(latency=0.02, failure_rate=0.05, worker_counts=(1, 8, 32, 64)):
+    server = start_server(latency=latency, failure_rate=failure_rate)
+    try:
+        zone_ids = server.zones
+
+        start = time.perf_counter()
+        result = sequential_fetch(server.base_url, zone_ids)
+        elapsed = time.perf_counter() - start
+        print(f"{'sequential':<14} {elapsed:7.2f}s  {len(zone_ids) / elapsed:8.1f} zones/s  "
+              f"{len(result)}/{len(zone_ids)} zones")
+
+        for workers in worker_counts:
+            fetcher = ZoneFetcher(base_url=server.base_url, max_workers=workers, rate=1000, backoff=0.01)
+            start = time.perf_counter()
+            result = fetcher.get_zone_carbon_intensity_dict(zone_ids)
+            elapsed = time.perf_counter() - start
+            fetcher.close()
+            print(f"{f'pool x{workers}':<14} {elapsed:7.2f}s  {len(zone_ids) / elapsed:8.1f} zones/s  "
+                  f"{len(result)}/{len(zone_ids)} zones")
+
+        # Zone list: first call downloads, second is served from the TTL cache,
+        # an expired cache is revalidated with If-None-Match (304)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ZoneListCache(os.path.join(tmp, 'zones.json'), ttl=0)
+            fetcher = ZoneFetcher(base_url=server.base_url, zone_cache=cache)
+            before = server.requests_served
+            zones = fetcher.get_zone_ids()
+            zones_again = fetcher.get_zone_ids()
+            fetcher.close()
+            print(f"zone list: {len(zones)} zones, revalidated copy identical: {zones == zones_again}, "
+                  f"{server.requests_served - before} requests")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
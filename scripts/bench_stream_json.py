@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Compares peak RSS and wall time of json.load against the streaming reader on
+# synthetic carbon_intensity.json files. Each measurement runs in a fresh
+# interpreter so ru_maxrss reflects only that loader.
+#
+# Example usage: python bench_stream_json.py 100 1000 5000   (sizes in MB)
+
+N_ZONES = 228
+
+_MEASURE = r'''
+import json, resource, sys, time
+sys.path.insert(0, {scripts_dir!r})
+start = time.perf_counter()
+if {mode!r} == 'json.load':
+    with open({path!r}) as f:
+        records = json.load(f)
+    from hourly_aggregate import HourlyAggregate
+    from intensity_store import frame_from_records
+    HourlyAggregate().update(frame_from_records(records))
+else:
+    from hourly_aggregate import HourlyAggregate
+    from stream_json import iter_records
+    HourlyAggregate().update_records(iter_records({path!r}))
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+
+def write_synthetic_file(path, size_mb, seed=0):
+    """
+    Writes a pretty-printed list-of-dicts file of roughly `size_mb` megabytes,
+    formatted like carbon_intensity.json (indent=4, hourly samples).
+    """
+    rng = np.random.default_rng(seed)
+    zones = [f"Z{i:03d}" for i in range(N_ZONES)]
+    start = np.datetime64('2024-07-01T00:00:00')
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'w') as f:
+        f.write('[\n')
+        hour = 0
+        while written < target:
+            values = rng.integers(10, 900, size=N_ZONES).tolist()
+            entry = {"time": str(start + np.timedelta64(hour, 'h')).replace('T', ' '),
+                     "data": dict(zip(zones, values))}
+            text = ('' if hour == 0 else ',\n') + '\n'.join(
+                '    ' + line for line in json.dumps(entry, indent=4).splitlines())
+            f.write(text)
+            written += len(text)
+            hour += 1
+        f.write('\n]')
+
+
+def measure(mode, path):
+    code = _MEASURE.format(scripts_dir=os.path.dirname(os.path.abspath(__file__)), mode=mode, path=path)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run_benchmark(sizes_mb):
+    print(f"{'size':>8} {'loader':<10} {'seconds':>9} {'peak RSS':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes_mb:
+            path = os.path.join(tmp, f'synthetic_{size_mb}mb.json')
+            write_synthetic_file(path, size_mb)
+            for mode in ('json.load', 'stream'):
+                try:
+                    result = measure(mode, path)
+                except subprocess.CalledProcessError as e:
+                    # json.load on multi-GB files can be killed for running out of memory
+                    print(f"{size_mb:>6}MB {mode:<10} failed: {e.returncode}")
+                    continue
+                print(f"{size_mb:>6}MB {mode:<10} {result['seconds']:>8.2f}s {result['max_rss_kb'] / 1024:>8.0f}MB")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 500, 1000, 5000]
+    run_benchmark(sizes)
@@ -1,23 +1,21 @@
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np  # Import numpy for calculating the mean
 
-def plot_zones_boxplot(file_path, zones):
-    # Load the JSON data from the file
-    with open(file_path, 'r') as file:
-        json_data = json.load(file)
+from intensity_log import load_collected
+from intensity_query import IntensityQuery
+
+def plot_zones_boxplot(file_path, zones, month_day="07-08"):
+    # Load the history (JSON file, append log, columnar store or a loaded frame)
+    query = IntensityQuery.open(file_path)
     
-    # Initialize a dictionary to hold values for each zone
-    zone_values = {zone: [] for zone in zones}
+    # Select the samples taken on the given calendar day via the time index
+    data = query.select_month_day(month_day)
     
     # Extract the values for the specified zones
-    for entry in json_data:
-        if "07-08" in entry.get("time", ''):
-            data = entry.get("data", {})
-            for zone in zones:
-                if zone in data:
-                    zone_values[zone].append(data[zone])
+    zone_values = {}
+    for zone in zones:
+        row = data.zone_index(zone)
+        zone_values[zone] = data.values[row][data.mask[row]].tolist() if row is not None else []
     
     # Filter out zones with no data
     zone_values = {zone: values for zone, values in zone_values.items() if values}
@@ -59,4 +57,4 @@ def plot_zones_boxplot(file_path, zones):
 
 # Example usage:
 #plot_zones_boxplot('carbon_intensity.json', ['US-CAL-CISO','US-TEX-ERCO',"US-NY-NYIS","AU","NZ"])
-plot_zones_boxplot('carbon_intensity.json', ['SE',"FR","GB","DE","IT"])
\ No newline at end of file
+plot_zones_boxplot(load_collected(), ['SE',"FR","GB","DE","IT"])
\ No newline at end of file
@@ -0,0 +1,240 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from intensity_log import LOG_FILE, STORE_DIR, append_entry, collected_times, compact
+from intensity_store import TIME_FORMAT
+
+# Hourly collection for data.py without drift or silent gaps.
+#
+# Samples are taken right after each wall-clock hour boundary (local time,
+# like the rest of the dataset) and labelled with the hour itself, e.g.
+# '2024-07-01 10:00:00'. The wait is recomputed from the clock every minute,
+# so slow fetches, suspends and clock changes do not shift later samples.
+#
+# After every sample the hours of the last `backfill_window` hours that have
+# no entry in the store or log are fetched from the history endpoint (all
+# zones concurrently) and appended. Hours that could not be recovered are
+# listed in missing_hours.json. HourlyAggregate also folds in unseen samples
+# up to BACKFILL_WINDOW hours before its high-water mark, so backfilled hours
+# reach hourly_average.json and the zone ranking on the next run of
+# average_carbon_intensity.py even though they are older than the samples
+# before them.
+
+MISSING_FILE = 'missing_hours.json'
+BACKFILL_WINDOW = 24        # hours covered by the history endpoint
+MAX_SLEEP = 60
+
+
+def hour_floor(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def sleep_until(target, clock=time.time, sleep=time.sleep):
+    """
+    Sleeps until the unix time `target`, re-reading the clock at least every
+    MAX_SLEEP seconds.
+    """
+    while True:
+        remaining = target - clock()
+        if remaining <= 0:
+            return
+        sleep(min(remaining, MAX_SLEEP))
+
+
+def missing_hours(times, start, end):
+    """
+    Hours in [start, end) without a sample.
+
+    :param times: datetime64 sample times
+    :param start: First hour (datetime or datetime64)
+    :param end: Hour after the last one
+    :return: Sorted datetime64[h] array
+    """
+    expected = np.arange(np.datetime64(start, 'h'), np.datetime64(end, 'h'), dtype='datetime64[h]')
+    return np.setdiff1d(expected, np.asarray(times).astype('datetime64[h]'))
+
+
+def local_hour(iso_utc):
+    """
+    Local hour (datetime64[h]) of a UTC ISO datetime such as '2024-07-01T10:00:00.000Z'.
+    """
+    moment = datetime.fromisoformat(iso_utc.replace('Z', '+00:00')).astimezone().replace(tzinfo=None)
+    return np.datetime64(moment, 'h')
+
+
+def _utc_iso(hour):
+    moment = hour.astype('datetime64[s]').astype(datetime)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def backfill_entries(fetcher, hours, zone_ids=None, now=None, window=BACKFILL_WINDOW):
+    """
+    Fetches the history of every zone and builds log entries for `hours`.
+
+    :param fetcher: ZoneFetcher
+    :param hours: datetime64[h] local hours to recover
+    :param window: Hours served by the history endpoint; older gaps use past-range
+    :return: List of {"time", "data"} entries, one per recovered hour
+    """
+    if not len(hours):
+        return []
+    now = datetime.now() if now is None else now
+    oldest = np.datetime64(hour_floor(now), 'h') - np.timedelta64(window - 1, 'h')
+    if hours.min() >= oldest:
+        history = fetcher.get_zone_history_dict(zone_ids)
+    else:
+        history = fetcher.get_zone_history_dict(zone_ids, start=_utc_iso(hours.min()),
+                                                end=_utc_iso(hours.max() + np.timedelta64(1, 'h')))
+
+    wanted = set(hours.tolist())
+    by_hour = {}
+    for zone, points in history.items():
+        for iso, value in points:
+            hour = local_hour(iso).astype(datetime)
+            if hour in wanted:
+                by_hour.setdefault(hour, {})[zone] = value
+    return [{"time": hour.strftime(TIME_FORMAT), "data": by_hour[hour]} for hour in sorted(by_hour)]
+
+
+class CollectorScheduler:
+    """
+    Hour-aligned collector writing to the append log (see intensity_log.py).
+
+    :param fetcher: ZoneFetcher
+    :param compact_hour: Hour of day at which the log is compacted into the store
+    :param backfill_window: Hours back in which gaps are backfilled
+    :param offset: Seconds after the hour boundary at which to sample
+    :param clock: Unix time source
+    :param sleep: Sleep function
+    :param sketches: SketchStore updated with every appended entry (optional)
+    :param seed_path: History the store starts from on the first compaction,
+                      e.g. intensity_log.HISTORY_JSON (optional)
+    """
+
+    def __init__(self, fetcher, log_path=LOG_FILE, store_path=STORE_DIR, compact_hour=0,
+                 missing_path=MISSING_FILE, backfill_window=BACKFILL_WINDOW, offset=0,
+                 clock=time.time, sleep=time.sleep, sketches=None, seed_path=None):
+        self.fetcher = fetcher
+        self.log_path = log_path
+        self.store_path = store_path
+        self.compact_hour = compact_hour
+        self.missing_path = missing_path
+        self.backfill_window = backfill_window
+        self.offset = offset
+        self.clock = clock
+        self.sleep = sleep
+        self.sketches = sketches
+        self.seed_path = seed_path
+        # Sample times in the store and log, read once and then kept up to
+        # date with every appended entry
+        self._times = None
+
+    def now(self):
+        return datetime.fromtimestamp(self.clock())
+
+    def known_times(self):
+        if self._times is None:
+            self._times = collected_times(self.store_path, self.log_path, self.seed_path)
+        return self._times
+
+    def _append(self, entries):
+        for entry in entries:
+            append_entry(self.log_path, entry)
+        if entries:
+            self._times = np.union1d(self.known_times(),
+                                     np.array([entry["time"] for entry in entries], dtype='datetime64[s]'))
+        self._update_sketches(entries)
+
+    def sample(self, hour):
+        """
+        Fetches every zone and appends the entry labelled with `hour`.
+        """
+        carbon_intensity_dict = self.fetcher.get_zone_carbon_intensity_dict()
+        current_time = hour.strftime(TIME_FORMAT)
+        self._append([{"time": current_time, "data": carbon_intensity_dict}])
+        if hour.hour == self.compact_hour:
+            compacted = compact(self.log_path, self.store_path, seed_path=self.seed_path)
+            print(f"Compacted {compacted} entries into {self.store_path}")
+        print(f"Time: {current_time}, {len(carbon_intensity_dict)} zones")
+
+    def gaps(self, now=None):
+        """
+        Hours of the backfill window before the current hour without a
+        sample. Hours before the first sample ever taken are not gaps.
+        """
+        current = hour_floor(now or self.now())
+        times = self.known_times()
+        start = current - timedelta(hours=self.backfill_window - 1)
+        if len(times):
+            start = max(start, times.min().astype(datetime))
+        return missing_hours(times, start, current)
+
+    def backfill(self, now=None):
+        """
+        Appends history entries for the gaps and records the hours that are
+        still missing.
+
+        :return: Number of recovered hours
+        """
+        now = now or self.now()
+        gaps = self.gaps(now)
+        entries = backfill_entries(self.fetcher, gaps, now=now, window=self.backfill_window)
+        self._append(entries)
+        recovered = {entry["time"] for entry in entries}
+        still_missing = [hour.strftime(TIME_FORMAT) for hour in gaps.astype(datetime).tolist()
+                         if hour.strftime(TIME_FORMAT) not in recovered]
+        self._record_missing(still_missing, now)
+        if len(gaps):
+            print(f"Backfilled {len(entries)} of {len(gaps)} missing hours")
+        return len(entries)
+
+    def _update_sketches(self, entries):
+        if self.sketches is not None and entries:
+            self.sketches.add_entries(entries)
+            self.sketches.save()
+
+    def _record_missing(self, hours, now):
+        with open(self.missing_path + '.tmp', 'w') as f:
+            json.dump({"checked": now.strftime(TIME_FORMAT), "missing": hours}, f, indent=4)
+        os.replace(self.missing_path + '.tmp', self.missing_path)
+
+    def run_forever(self, max_samples=None):
+        """
+        Backfills, samples the current hour if it has no entry yet, then
+        samples every hour boundary.
+
+        :param max_samples: Stop after this many samples (None runs forever)
+        """
+        samples = 0
+        current = hour_floor(self.now())
+        try:
+            self.backfill()
+            if len(missing_hours(self.known_times(), current, current + timedelta(hours=1))):
+                samples += 1
+                self.sample(current)
+        except Exception as e:
+            # Same as in the loop: an outage at startup must not stop the collector
+            print(f"Collection for {current} failed: {e}")
+        while max_samples is None or samples < max_samples:
+            current += timedelta(hours=1)
+            sleep_until(current.timestamp() + self.offset, self.clock, self.sleep)
+            # After a long stall, sample the hour we are in; backfill covers the rest
+            current = max(current, hour_floor(self.now()))
+            try:
+                self.sample(current)
+                self.backfill()
+            except Exception as e:
+                print(f"Collection for {current} failed: {e}")
+            samples += 1
+
+
+if __name__ == "__main__":
+    # Example usage: python collector_scheduler.py http://127.0.0.1:8765/v3
+    from zone_fetcher import API_URL, ZoneFetcher
+    fetcher = ZoneFetcher(base_url=sys.argv[1] if len(sys.argv) > 1 else API_URL)
+    CollectorScheduler(fetcher).run_forever()
@@ -0,0 +1,169 @@
+import sys
+
+import numpy as np
+
+from intensity_query import calendar_keys
+from intensity_store import IntensityFrame
+
+# Completeness of a zone × time matrix. Zones drop in and out of the API, so
+# instead of discarding every zone with a missing sample, the gaps are
+# measured and filled:
+#
+#   'linear'    interpolate in time between the samples around the gap
+#   'ffill'     repeat the last sample before the gap
+#   'seasonal'  use the zone's mean for that hour of day (from the frame
+#               itself or a given HourlyProfile)
+#
+# All methods work on the whole matrix at once: the previous and next
+# collected column of every cell are found with a running maximum/minimum
+# over column positions. Cells before a zone's first or after its last sample
+# are only filled by 'seasonal'.
+
+FILL_METHODS = ('linear', 'ffill', 'seasonal')
+
+
+def _neighbours(mask):
+    """
+    Column of the previous and next collected sample for every cell, -1 and
+    n_times where there is none. Collected cells are their own neighbours.
+    """
+    n_times = mask.shape[1]
+    positions = np.arange(n_times)
+    previous = np.maximum.accumulate(np.where(mask, positions, -1), axis=1)
+    following = np.minimum.accumulate(np.where(mask, positions, n_times)[:, ::-1], axis=1)[:, ::-1]
+    return previous, following
+
+
+def gap_stats(frame):
+    """
+    Gap statistics per zone.
+
+    :param frame: IntensityFrame
+    :return: Dict of arrays, one entry per zone: 'coverage' (share of the
+             timestamps collected), 'missing' (samples), 'gaps' (runs of
+             missing samples between the first and last sample), 'longest_gap'
+             (samples), 'leading' and 'trailing' (missing samples before the
+             first and after the last sample)
+    """
+    mask = np.asarray(frame.mask)
+    n_zones, n_times = mask.shape
+    collected = mask.sum(axis=1)
+    any_collected = collected > 0
+
+    first = np.where(any_collected, mask.argmax(axis=1), n_times)
+    last = np.where(any_collected, n_times - 1 - mask[:, ::-1].argmax(axis=1), -1)
+    positions = np.arange(n_times)
+    interior = ~mask & (positions >= first[:, None]) & (positions <= last[:, None])
+
+    # Runs of interior gaps start where a missing cell follows a collected one
+    starts = interior[:, 1:] & mask[:, :-1]
+    previous, following = _neighbours(mask)
+    lengths = np.where(interior, following - previous - 1, 0)
+
+    return {
+        "zones": list(frame.zones),
+        "coverage": collected / n_times if n_times else np.zeros(n_zones),
+        "missing": n_times - collected,
+        "gaps": starts.sum(axis=1),
+        "longest_gap": lengths.max(axis=1) if n_times else np.zeros(n_zones, dtype=np.int64),
+        "leading": np.minimum(first, n_times),
+        "trailing": n_times - 1 - last,
+    }
+
+
+def incomplete_zones(frame):
+    """
+    Zones with at least one sample but not a sample at every timestamp.
+    """
+    mask = np.asarray(frame.mask)
+    incomplete = mask.any(axis=1) & ~mask.all(axis=1)
+    return [zone for zone, flag in zip(frame.zones, incomplete) if flag]
+
+
+def _seasonal_values(frame, profile):
+    hours = calendar_keys(frame.times)[0]
+    if profile is None:
+        from hourly_aggregate import group_sums
+        sums, counts = group_sums(frame.values, frame.mask, hours, 24)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).T
+    else:
+        rows = np.array([profile.zone_index(zone) for zone in frame.zones], dtype=np.intp)
+        means = np.where((rows >= 0)[:, None], profile.values[rows], np.nan)
+    return means[:, hours]
+
+
+def fill_gaps(frame, method='linear', limit=None, profile=None):
+    """
+    Fills missing samples.
+
+    :param frame: IntensityFrame
+    :param method: 'linear', 'ffill' or 'seasonal'
+    :param limit: Longest gap (in samples) to fill, longer gaps stay missing;
+                  'ffill' fills at most `limit` samples after the last one
+    :param profile: HourlyProfile for 'seasonal' (default: hourly means of the frame)
+    :return: (IntensityFrame with float64 values, boolean matrix of the filled cells)
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method '{method}', expected one of {FILL_METHODS}")
+    mask = np.asarray(frame.mask)
+    values = frame.as_float()
+    n_times = mask.shape[1]
+    rows = np.arange(mask.shape[0])[:, None]
+    previous, following = _neighbours(mask)
+    has_previous = previous >= 0
+    has_following = following < n_times
+    prev_values = values[rows, np.maximum(previous, 0)]
+
+    if method == 'linear':
+        seconds = frame.times.astype('datetime64[s]').astype(np.float64)
+        t_prev = seconds[np.maximum(previous, 0)]
+        t_next = seconds[np.minimum(following, n_times - 1)]
+        next_values = values[rows, np.minimum(following, n_times - 1)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(t_next > t_prev, (seconds - t_prev) / (t_next - t_prev), 0.0)
+        filled = prev_values + weight * (next_values - prev_values)
+        fillable = has_previous & has_following
+        gap_length = following - previous - 1
+    elif method == 'ffill':
+        filled = prev_values
+        fillable = has_previous
+        gap_length = np.arange(n_times) - previous
+    else:
+        filled = _seasonal_values(frame, profile)
+        fillable = ~np.isnan(filled)
+        # A gap without a sample on one side runs to the edge of the frame
+        gap_length = np.where(has_following, following, n_times) - np.where(has_previous, previous, -1) - 1
+
+    fillable &= ~mask
+    if limit is not None:
+        fillable &= gap_length <= limit
+    result = np.where(fillable, filled, values)
+    return IntensityFrame(frame.times, frame.zones, result, mask | fillable), fillable
+
+
+def print_gap_report(frame, top=20):
+    stats = gap_stats(frame)
+    order = np.argsort(stats["coverage"], kind='stable')
+    print(f"{'zone':<14}{'coverage':>10}{'missing':>9}{'gaps':>6}{'longest':>9}")
+    for row in order[:top]:
+        if stats["missing"][row] == 0:
+            break
+        print(f"{stats['zones'][row]:<14}{100 * stats['coverage'][row]:>9.1f}%{stats['missing'][row]:>9}"
+              f"{stats['gaps'][row]:>6}{stats['longest_gap'][row]:>9}")
+
+
+if __name__ == "__main__":
+    # Example usage: python completeness.py carbon_intensity.json linear 3
+    from intensity_query import IntensityQuery
+    path = sys.argv[1] if len(sys.argv) > 1 else 'carbon_intensity.json'
+    method = sys.argv[2] if len(sys.argv) > 2 else 'linear'
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    frame = IntensityQuery.open(path).frame
+    print_gap_report(frame)
+    filled, imputed = fill_gaps(frame, method, limit)
+    complete_before = int(frame.mask.all(axis=1).sum())
+    complete_after = int(filled.mask.all(axis=1).sum())
+    print(f"{method}: filled {int(imputed.sum())} samples, complete zones {complete_before} -> {complete_after} "
+          f"of {len(frame.zones)}")
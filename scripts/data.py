@@ -1,37 +1,50 @@
-import requests
 # import schedule
 import time
 from datetime import datetime
 import json
 import os
 
+from collector_scheduler import CollectorScheduler
+from intensity_log import HISTORY_JSON, LOG_FILE, STORE_DIR, load_collected
+from quantile_sketch import SKETCH_DIR, SketchStore
+from zone_fetcher import ZoneFetcher, ZoneListCache
+
 start = -1
 
+# 'log' appends each sample to carbon_intensity.jsonl and folds the log into the
+# columnar store once a day; 'json' rewrites carbon_intensity.json every hour.
+# The first compaction starts the store from carbon_intensity.json, and the
+# analysis scripts read both modes through intensity_log.load_collected().
+STORAGE_MODE = 'log'
+COMPACT_HOUR = 0
+
+# Per-zone quantile sketches, one per month, updated with every collected hour.
+# Once, the samples collected before the store existed are folded in as well.
+sketches = SketchStore(SKETCH_DIR)
+if not sketches.seeded:
+    sketches.seed([load_collected()])
+    sketches.save()
+
+# One pooled session shared by all zone requests; the zone list is cached on
+# disk for a day and revalidated with its ETag.
+fetcher = ZoneFetcher(
+    api_key="your-api-key",
+    max_workers=16,
+    rate=20,
+    retries=3,
+    zone_cache=ZoneListCache('zones_cache.json', ttl=24 * 3600),
+)
+
 def get_zone_ids():
-    url = 'https://api.electricitymap.org/v3/zones'
-    response = requests.get(url)
-    data = response.json()
-    return list(data.keys())
+    return fetcher.get_zone_ids()
 
 def get_carbon_intensity(zone_id):
-    url = f'https://api.electricitymap.org/v3/carbon-intensity/latest?zone={zone_id}'
-    response = requests.get(url, headers={
-        "auth-token": f"your-api-key"
-    })
-    data = response.json()
-    return data.get('carbonIntensity', None)
+    return fetcher.get_carbon_intensity(zone_id)
 
 def get_zone_carbon_intensity_dict():
-    zone_ids = get_zone_ids()
-    carbon_intensity_dict = {}
-    
-    for zone_id in zone_ids:
-        carbon_intensity = get_carbon_intensity(zone_id)
-        if carbon_intensity is not None:
-            carbon_intensity_dict[zone_id] = carbon_intensity
-    
-    return carbon_intensity_dict
+    return fetcher.get_zone_carbon_intensity_dict()
 
+# Hourly job of the 'json' mode; 'log' mode is collected by CollectorScheduler
 def job():
     # Load existing data
     if os.path.exists('carbon_intensity.json'):
@@ -47,10 +60,12 @@ def job():
 
     # Append new data to existing data
     existing_data.append(new_entry)
+    sketches.add_entries([new_entry])
 
     # Save updated data back to the file
     with open('carbon_intensity.json', 'w') as f:
         json.dump(existing_data, f, indent=4)
+    sketches.save()
 
     print(f"Time: {current_time}")
     print(carbon_intensity_dict)
@@ -61,8 +76,15 @@ schedule.every().hour.do(job)
 '''
 
 # Run the scheduler
-while True:
-    if datetime.now().hour != start:
-        start = datetime.now().hour
-        job()
-    time.sleep(1800)
\ No newline at end of file
+if __name__ == "__main__":
+    if STORAGE_MODE == 'log':
+        # Samples on the hour and backfills missed hours from the history
+        # endpoint; runs forever
+        CollectorScheduler(fetcher, LOG_FILE, STORE_DIR, compact_hour=COMPACT_HOUR, sketches=sketches,
+                           seed_path=HISTORY_JSON).run_forever()
+    else:
+        while True:
+            if datetime.now().hour != start:
+                start = datetime.now().hour
+                job()
+            time.sleep(1800)
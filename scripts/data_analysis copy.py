@@ -1,60 +1,46 @@
-import json
-from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
 
+from intensity_log import load_collected
+from intensity_query import IntensityQuery
+from zone_stats import zone_stats
+
 
 def get_data_by_date_range(file_path, start_date, end_date, include_zones=None, exclude_zones=None):
     """
-    Reads a JSON file and retrieves all data with timestamps within the specified date range.
+    Retrieves all data with timestamps within the specified date range.
 
-    :param file_path: Path to the JSON file
+    :param file_path: Path to the JSON file, append log or columnar store directory,
+                      or an IntensityFrame such as intensity_log.load_collected()
     :param start_date: The start date in 'YYYY-MM-DD' format
     :param end_date: The end date in 'YYYY-MM-DD' format
     :param include_zones: List of zones to include in the data (optional)
     :param exclude_zones: List of zones to exclude from the data (optional)
-    :return: List of entries with timestamps within the specified date range
+    :return: IntensityFrame of the samples within the specified date range
     """
-    # Load the JSON file
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-
-    # Convert the start and end dates to datetime objects
-    start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-    end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+    query = IntensityQuery.open(file_path)
 
-    # Filter data for timestamps within the date range
-    filtered_data = [entry for entry in data if start_date <= datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S').date() <= end_date]
+    # Binary search on the time index; the result is a view, not a copy
+    filtered_data = query.select_date_range(start_date, end_date)
 
     # Filter the data based on include_zones or exclude_zones
-    for entry in filtered_data:
-        if include_zones:
-            entry['data'] = {zone: value for zone, value in entry['data'].items() if zone in include_zones}
-        elif exclude_zones:
-            entry['data'] = {zone: value for zone, value in entry['data'].items() if zone not in exclude_zones}
-
-    return filtered_data
+    return filtered_data.select_zones(include_zones, exclude_zones)
 
 def plot_carbon_intensity(data, zones_to_plot=None):
     """
     Plots the carbon intensity data for the specified zones.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
     :param zones_to_plot: List of zones to specifically plot
     """
     # Extract timestamps and carbon intensity data
-    timestamps = [datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S') for entry in data]
-    intensity_values = {}
-    
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
+    timestamps = data.times.astype('datetime64[s]').astype(object)
     
     # Determine the complete and incomplete zones
-    complete_zones = {region: values for region, values in intensity_values.items() if len(values) == len(timestamps)}
-    incomplete_zones = {region: values for region, values in intensity_values.items() if len(values) != len(timestamps)}
+    complete = data.mask.all(axis=1)
+    collected = data.mask.any(axis=1)
+    complete_zones = {region: data.values[row] for row, region in enumerate(data.zones) if complete[row]}
+    incomplete_zones = [region for row, region in enumerate(data.zones) if collected[row] and not complete[row]]
     
     # Print incomplete zones
     print("Incomplete Zones:")
@@ -79,30 +65,20 @@ def plot_carbon_intensity(data, zones_to_plot=None):
     plt.tight_layout()
     plt.show()
 
-def analyze_standard_deviation(data):
+def analyze_standard_deviation(data, stats=None):
     """
     Analyzes the standard deviation in the carbon intensity data for all complete zones.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
+    :param stats: ZoneStats of `data`, if already computed
     :return: Dictionary of zones with their respective standard deviations
     """
-    # Extract timestamps and carbon intensity data
-    timestamps = [datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S') for entry in data]
-    intensity_values = {}
-    
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
+    stats = stats if stats is not None else zone_stats(data)
     
-    # Determine the complete and incomplete zones
-    complete_zones = {region: values for region, values in intensity_values.items() if len(values) == len(timestamps)}
+    # Determine the complete zones
+    complete = stats['count'] == len(data.times)
     
-    # Calculate standard deviation for each complete zone
-    std_devs = {region: np.std(values) for region, values in complete_zones.items()}
-    
-    return std_devs
+    return {stats.zones[row]: float(stats['std'][row]) for row in np.flatnonzero(complete)}
 
 def plot_standard_deviation(std_devs, threshold=0):
     """
@@ -136,32 +112,25 @@ def plot_standard_deviation(std_devs, threshold=0):
     for region, std in sorted_std_devs.items():
         print(f"{region}: {std}")
 
-def calculate_below_50th_percentile_avg(data):
+def calculate_below_50th_percentile_avg(data, stats=None):
     """
     Calculates the average of all values below the 50th percentile for each region.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
+    :param stats: ZoneStats of `data`, if already computed
     :return: Dictionary of regions with their respective averages of values below the 50th percentile
     """
-    intensity_values = {}
-    
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
+    stats = stats if stats is not None else zone_stats(data)
     
     below_50th_avg = {}
     
-    for region, values in intensity_values.items():
-        values = np.array(values)
-        if np.all(values == values[0]):  # Check if all values are the same
+    for row in np.flatnonzero(stats['count'] > 0):
+        if stats['constant'][row]:  # Check if all values are the same
             avg_below_median = "All values are the same"
         else:
-            median_value = np.percentile(values, 50)
-            below_median_values = values
-            avg_below_median = np.mean(below_median_values) if len(below_median_values) > 0 else "No values below median"
-        below_50th_avg[region] = avg_below_median
+            # Averages every value, not only those below the median
+            avg_below_median = float(stats['mean'][row])
+        below_50th_avg[stats.zones[row]] = avg_below_median
     
     return below_50th_avg
 
@@ -195,43 +164,36 @@ def plot_below_50th_percentile_avg(below_50th_avg):
     for region, avg in below_50th_avg.items():
         print(f"{region}: {avg}")
 
-def rank_zones_by_combined_metric(std_devs, below_50th_avg):
+def rank_zones_by_combined_metric(stats, zones=None, below_weight=0):
     """
     Ranks zones by the sum of their standard deviation and average carbon intensity below the median.
 
-    :param std_devs: Dictionary of zones with their respective standard deviations
-    :param below_50th_avg: Dictionary of zones with their respective averages of values below the 50th percentile
+    :param stats: ZoneStats of the data
+    :param zones: Zones to rank, e.g. the keys of analyze_standard_deviation's result (default: all)
+    :param below_weight: Weight of the average (as in calculate_below_50th_percentile_avg)
     """
-    combined_metrics = {}
-
     # Calculate the sum of standard deviation and average below 50th percentile for each zone
-    for region in std_devs:
-        std_dev = std_devs.get(region, 0)
-        avg_below_50th = below_50th_avg.get(region, 0)
-        
-        if isinstance(avg_below_50th, (int, float)) and isinstance(std_dev, (int, float)):
-            combined_metrics[region] = avg_below_50th*0 + std_dev
-        else:
-            combined_metrics[region] = float('inf')  # Assign infinite if the value is invalid (e.g., "All values are the same")
+    combined_metrics = stats.combined({'std': 1.0, 'mean': below_weight})
     
-    # Sort by the combined metric (ascending order)
-    sorted_combined_metrics = dict(sorted(combined_metrics.items(), key=lambda item: item[1]))
+    # Zones with invalid data (e.g., "All values are the same") are not ranked
+    valid = ~stats['constant']
+    if zones is not None:
+        valid &= np.isin(np.array(stats.zones, dtype=object), list(zones))
+    combined_metrics = np.where(valid, combined_metrics, np.nan)
     
-    # Print the ranked zones
+    # Print the ranked zones (ascending order)
     print(f"{'Rank':<5} {'Zone':<15} {'Std Dev + Avg Below Median'}")
     print("-" * 40)
     
-    rank = 1
-    for region, combined_metric in sorted_combined_metrics.items():
-        if combined_metric != float('inf'):  # Ignore zones with invalid data
-            print(f"{rank:<5} {region:<15} {combined_metric:.2f}")
-            rank += 1
+    for rank, (region, combined_metric) in enumerate(stats.ranked(combined_metrics), start=1):
+        print(f"{rank:<5} {region:<15} {combined_metric:.2f}")
 
 # Example usage
-file_path = 'carbon_intensity.json'
+# Everything data.py has collected, in either storage mode
+history = load_collected()
 start_date = '2022-09-23'
 end_date = '2024-08-28'
-filtered_data = get_data_by_date_range(file_path, start_date, end_date, exclude_zones=["ES-CE",
+filtered_data = get_data_by_date_range(history, start_date, end_date, exclude_zones=["ES-CE",
             "ES-CN-FVLZ",
             "ES-CN-GC",
             "ES-CN-HI",
@@ -334,18 +296,21 @@ filtered_data = get_data_by_date_range(file_path, start_date, end_date, exclude_
   #plot_carbon_intensity(filtered_data)
 
 
+# Statistics of every zone, computed once for the analyses below
+stats = zone_stats(filtered_data)
+
 # Analyze standard deviation for the complete zones
-std_devs = analyze_standard_deviation(filtered_data)
+std_devs = analyze_standard_deviation(filtered_data, stats)
 
 # Plot the standard deviation
   #plot_standard_deviation(std_devs, threshold=50)
 
 # Calculate the average of values below the 50th percentile for each region
-below_50th_avg = calculate_below_50th_percentile_avg(filtered_data)
+below_50th_avg = calculate_below_50th_percentile_avg(filtered_data, stats)
 
 # Plot the average below 50th percentile
   #plot_below_50th_percentile_avg(below_50th_avg)  
 
 
 # Example usage (after calculating standard deviations and below 50th percentile averages)
-rank_zones_by_combined_metric(std_devs, below_50th_avg)
\ No newline at end of file
+rank_zones_by_combined_metric(stats, zones=std_devs)
\ No newline at end of file
@@ -1,73 +1,67 @@
-import json
-from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
 
+from completeness import fill_gaps, incomplete_zones
+from intensity_log import load_collected
+from intensity_query import IntensityQuery
+from intensity_store import IntensityFrame
+from zone_stats import zone_stats
+
 
 def get_data_by_date(file_path, target_date, include_zones=None, exclude_zones=None):
     """
-    Reads a JSON file and retrieves all data with timestamps on the specified date.
+    Retrieves all data with timestamps on the specified date.
 
-    :param file_path: Path to the JSON file
+    :param file_path: Path to the JSON file, append log or columnar store directory,
+                      an IntensityFrame such as intensity_log.load_collected(),
+                      or an iterable of entries such as stream_json.iter_records(path)
     :param target_date: The target date in 'YYYY-MM-DD' format (e.g., '2024-07-05')
     :param include_zones: List of zones to include in the data (optional)
     :param exclude_zones: List of zones to exclude from the data (optional)
-    :return: List of entries with timestamps on the specified date
+    :return: IntensityFrame of the samples on the specified date
     """
-    # Load the JSON file
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    
-    # Convert the target date to a datetime object
-    target_date = datetime.strptime(target_date, '%Y-%m-%d').date()
-    
-    # Filter data for timestamps on the target date
-    filtered_data = [entry for entry in data if datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S').date() == target_date]
-    
+    if isinstance(file_path, (str, IntensityFrame)):
+        query = IntensityQuery.open(file_path)
+    else:
+        # Streamed input: only the entries on the target date are kept in memory
+        query = IntensityQuery.from_records(file_path, target_date, target_date)
+
+    # Binary search on the time index; the result is a view, not a copy
+    filtered_data = query.select_date(target_date)
+
     # Filter the data based on include_zones or exclude_zones
-    for entry in filtered_data:
-        if include_zones:
-            entry['data'] = {zone: value for zone, value in entry['data'].items() if zone in include_zones}
-        elif exclude_zones:
-            entry['data'] = {zone: value for zone, value in entry['data'].items() if zone not in exclude_zones}
-    
-    return filtered_data
+    return filtered_data.select_zones(include_zones, exclude_zones)
 
-def plot_carbon_intensity(data, zones_to_plot=None):
+def plot_carbon_intensity(data, zones_to_plot=None, fill_method='linear', limit=None):
     """
     Plots the carbon intensity data for the specified zones.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
     :param zones_to_plot: List of zones to specifically plot
+    :param fill_method: How gaps of incomplete zones are filled ('linear', 'ffill' or 'seasonal')
+    :param limit: Longest gap (in samples) to fill; longer gaps are left as breaks in the line
     """
     # Extract timestamps and carbon intensity data
-    timestamps = [datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S') for entry in data]
-    intensity_values = {}
+    timestamps = data.times.astype('datetime64[s]').astype(object)
     
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
-    
-    # Determine the complete and incomplete zones
-    complete_zones = {region: values for region, values in intensity_values.items() if len(values) == len(timestamps)}
-    incomplete_zones = {region: values for region, values in intensity_values.items() if len(values) != len(timestamps)}
+    # Fill the gaps of incomplete zones instead of dropping them
+    filled, _ = fill_gaps(data, fill_method, limit)
+    collected = data.mask.any(axis=1)
     
     # Print incomplete zones
-    print("Incomplete Zones:")
-    for region in incomplete_zones:
+    print(f"Incomplete Zones (gaps filled with '{fill_method}'):")
+    for region in incomplete_zones(data):
         print(region)
     
     # Filter zones to plot if specified
-    if zones_to_plot:
-        complete_zones = {region: values for region, values in complete_zones.items() if region in zones_to_plot}
+    rows = [row for row, region in enumerate(data.zones)
+            if collected[row] and (not zones_to_plot or region in zones_to_plot)]
     
     # Plot the data
     plt.figure(figsize=(14, 7))
     
-    for region, values in complete_zones.items():
-        plt.plot(timestamps, values, label=region)
+    for row in rows:
+        plt.plot(timestamps, filled.values[row], label=data.zones[row])
     
     plt.xlabel('Time')
     plt.ylabel('Carbon Intensity')
@@ -77,30 +71,20 @@ def plot_carbon_intensity(data, zones_to_plot=None):
     plt.tight_layout()
     plt.show()
 
-def analyze_standard_deviation(data):
+def analyze_standard_deviation(data, fill_method='linear', limit=None):
     """
-    Analyzes the standard deviation in the carbon intensity data for all complete zones.
+    Analyzes the standard deviation in the carbon intensity data for all zones.
+    Gaps are filled first; samples that cannot be filled are left out.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
+    :param fill_method: 'linear', 'ffill' or 'seasonal'
+    :param limit: Longest gap (in samples) to fill
     :return: Dictionary of zones with their respective standard deviations
     """
-    # Extract timestamps and carbon intensity data
-    timestamps = [datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S') for entry in data]
-    intensity_values = {}
-    
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
+    filled, _ = fill_gaps(data, fill_method, limit)
     
-    # Determine the complete and incomplete zones
-    complete_zones = {region: values for region, values in intensity_values.items() if len(values) == len(timestamps)}
-    
-    # Calculate standard deviation for each complete zone
-    std_devs = {region: np.std(values) for region, values in complete_zones.items()}
-    
-    return std_devs
+    # Zones without any sample have no standard deviation and are left out
+    return zone_stats(filled).column('std')
 
 def plot_standard_deviation(std_devs, threshold=0):
     """
@@ -138,28 +122,21 @@ def calculate_below_50th_percentile_avg(data):
     """
     Calculates the average of all values below the 50th percentile for each region.
 
-    :param data: List of entries with timestamps and carbon intensity data
+    :param data: IntensityFrame with timestamps and carbon intensity data
     :return: Dictionary of regions with their respective averages of values below the 50th percentile
     """
-    intensity_values = {}
-    
-    for entry in data:
-        for region, value in entry['data'].items():
-            if region not in intensity_values:
-                intensity_values[region] = []
-            intensity_values[region].append(value)
+    stats = zone_stats(data)
     
     below_50th_avg = {}
     
-    for region, values in intensity_values.items():
-        values = np.array(values)
-        if np.all(values == values[0]):  # Check if all values are the same
+    for row in np.flatnonzero(stats['count'] > 0):
+        if stats['constant'][row]:  # Check if all values are the same
             avg_below_median = "All values are the same"
+        elif np.isnan(stats['below_median_mean'][row]):
+            avg_below_median = "No values below median"
         else:
-            median_value = np.percentile(values, 50)
-            below_median_values = values[values < median_value]
-            avg_below_median = np.mean(below_median_values) if len(below_median_values) > 0 else "No values below median"
-        below_50th_avg[region] = avg_below_median
+            avg_below_median = float(stats['below_median_mean'][row])
+        below_50th_avg[stats.zones[row]] = avg_below_median
     
     return below_50th_avg
 
@@ -194,9 +171,10 @@ def plot_below_50th_percentile_avg(below_50th_avg):
         print(f"{region}: {avg}")
 
 # Example usage
-file_path = 'carbon_intensity.json'
+# Everything data.py has collected, in either storage mode
+history = load_collected()
 target_date = '2024-07-05'
-filtered_data = get_data_by_date(file_path, target_date, exclude_zones=["ES-CE",
+filtered_data = get_data_by_date(history, target_date, exclude_zones=["ES-CE",
             "ES-CN-FVLZ",
             "ES-CN-GC",
             "ES-CN-HI",
@@ -297,7 +275,7 @@ std_devs = analyze_standard_deviation(filtered_data)
 plot_standard_deviation(std_devs, threshold=50)
 
 # Calculate the average of values below the 50th percentile for each region
-below_50th_avg = calculate_below_50th_percentile_avg(get_data_by_date(file_path, target_date))
+below_50th_avg = calculate_below_50th_percentile_avg(get_data_by_date(history, target_date))
 
 # Plot the average below 50th percentile
 plot_below_50th_percentile_avg(below_50th_avg)  
\ No newline at end of file
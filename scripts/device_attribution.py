@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+from energy_meter import EnergyMeter
+from power_sampler import FakeNvml
+
+# Attribution of measured energy to the GPUs a generation actually uses. On a
+# multi-GPU host the other devices may be idle or running someone else's
+# work, so only the devices of our process (found through NVML's process
+# list, or by matching CUDA device UUIDs) are counted. Generations on
+# different GPUs can be measured at the same time with measure_parallel().
+
+
+def cuda_device_uuids(cuda_indices=None):
+    """
+    UUIDs ('GPU-...') of CUDA devices as numbered by torch in this process
+    (default: the current device).
+    """
+    import torch
+    if cuda_indices is None:
+        cuda_indices = [torch.cuda.current_device()]
+    return ['GPU-' + str(torch.cuda.get_device_properties(i).uuid).removeprefix('GPU-') for i in cuda_indices]
+
+
+def devices_of_process(backend, pid=None):
+    """
+    Backend indices of the devices on which process `pid` (default: this
+    process) has a context.
+    """
+    pid = os.getpid() if pid is None else pid
+    return [i for i in range(backend.device_count()) if pid in backend.process_pids(i)]
+
+
+def devices_of_uuids(backend, uuids):
+    """
+    Backend indices of the devices with the given UUIDs. NVML and CUDA may
+    number devices differently (CUDA_VISIBLE_DEVICES, CUDA_DEVICE_ORDER), so
+    devices are matched by UUID rather than by index.
+    """
+    index = {backend.device_uuid(i): i for i in range(backend.device_count())}
+    return [index[uuid] for uuid in uuids if uuid in index]
+
+
+def process_devices(backend, pid=None, cuda_indices=None):
+    """
+    Devices to attribute this process's energy to: the devices NVML lists for
+    the process, else the CUDA devices it uses, else all devices.
+    """
+    devices = devices_of_process(backend, pid)
+    if devices:
+        return devices
+    try:
+        devices = devices_of_uuids(backend, cuda_device_uuids(cuda_indices))
+    except (ImportError, RuntimeError, AssertionError):
+        devices = []
+    if devices:
+        return devices
+    print("Could not map the process to its GPUs, attributing energy to all devices")
+    return list(range(backend.device_count()))
+
+
+def measure_parallel(meter, jobs):
+    """
+    Runs jobs concurrently, one thread each, measuring each on its own devices.
+
+    :param meter: EnergyMeter
+    :param jobs: List of (devices, callable)
+    :return: List of (Measurement, return value) in job order
+    """
+    results = [None] * len(jobs)
+    errors = []
+
+    def run(i, devices, work):
+        try:
+            with meter.measure(devices) as measurement:
+                value = work()
+            results[i] = (measurement, value)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, devices, work)) for i, (devices, work) in enumerate(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+if __name__ == "__main__":
+    # Example usage: python device_attribution.py sampling
+    # Four simulated GPUs: our generations run on 0 and 2, another tenant on 1
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'auto'
+    fake = FakeNvml(devices=4, idle_w=60.0, load_w=150.0)
+    meter = EnergyMeter(fake, mode=mode)
+
+    def generation(device, seconds):
+        def work():
+            with fake.busy(device):
+                time.sleep(seconds)
+        return work
+
+    with fake.busy(1, pid=1):
+        results = measure_parallel(meter, [([0], generation(0, 1.0)), ([2], generation(2, 0.5))])
+
+    for (measurement, _), device in zip(results, (0, 2)):
+        exact = fake.energy_j(device, measurement.start, measurement.end)
+        print(f"GPU {device} ({meter.mode}): {measurement.energy_j[0]:.1f} J over {measurement.duration:.2f} s, "
+              f"exact {exact:.1f} J")
+    print(f"Devices of this process: {devices_of_process(fake)}")
+    everything = sum(fake.energy_j(i, results[0][0].start, results[0][0].end) for i in range(4))
+    print(f"All devices during the GPU 0 generation: {everything:.1f} J")
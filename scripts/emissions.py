@@ -1,7 +1,8 @@
-import requests
+from intensity_lookup import IntensityLookup
+lookup = IntensityLookup(default_zone="US-CAL-CISO")
 def calc_emissions(power, time, intensity=-1):
     if intensity==-1:
-        intensity = requests.get("https://api.electricitymap.org/v3/carbon-intensity/latest?zone=US-CAL-CISO").json()["carbonIntensity"]
+        intensity = lookup.lookup("US-CAL-CISO", wait=1)[0]
     return (power/1000)*(time/3600)*intensity
 
 print(calc_emissions(150, 16.67656))
\ No newline at end of file
@@ -0,0 +1,284 @@
+import csv
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+
+# Emissions table written by the power_usage scripts, one row per generated
+# image. Rows are buffered in memory and flushed in blocks:
+#
+#   emissions.csv       appended to in place (header written once)
+#   emissions.parquet/  directory of Parquet parts, one per flush
+#   emissions.arrow/    directory of Arrow IPC files, one per flush
+#
+# Every part has the same schema, fixed by the columns (float64 numbers,
+# strings otherwise) rather than inferred from the rows of one flush, so parts
+# can always be concatenated. Each part is written to a temporary name and
+# renamed, so an interrupted run
+# never leaves a half-written part. A small JSON sidecar records the last
+# image number and the table's size/mtime after each flush, so the next image
+# index is found without reading the table; if the sidecar is missing or
+# stale, only the tail of the CSV (or the last part) is read.
+#
+# The columnar formats need pyarrow.
+
+COLUMNS = [
+    'model', 'emissions', 'carbon intensity', 'zone', 'duration',
+    'time', 'power usage', 'gpu', 'prompt', 'image file'
+]
+# One row per configuration of generation_bench.py
+BENCHMARK_COLUMNS = [
+    'model', 'batch size', 'steps', 'height', 'width', 'images', 'duration', 'images/s',
+    'energy', 'joules/image', 'gCO2/image', 'carbon intensity', 'zone', 'gpu', 'measurement', 'time'
+]
+# Columns stored as float64 in the columnar formats; all others are strings
+NUMERIC_COLUMNS = {
+    'emissions', 'carbon intensity', 'duration', 'power usage', 'batch size', 'steps', 'height', 'width',
+    'images', 'images/s', 'energy', 'joules/image', 'gCO2/image'
+}
+FORMATS = ('csv', 'parquet', 'arrow')
+FLUSH_ROWS = 16
+TAIL_BYTES = 64 << 10
+
+
+def table_format(path):
+    ext = os.path.splitext(path.rstrip('/'))[1].lstrip('.')
+    if ext not in FORMATS:
+        raise ValueError(f"Unknown emissions table format '{ext}', expected one of {FORMATS}")
+    return ext
+
+
+def image_number(image_file):
+    return int(str(image_file).split('.')[0])
+
+
+def index_path(path):
+    return path.rstrip('/') + '.index.json'
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def table_schema(columns):
+    """
+    Arrow schema of the columnar formats for `columns`.
+    """
+    import pyarrow as pa
+    return pa.schema([(column, pa.float64() if column in NUMERIC_COLUMNS else pa.string()) for column in columns])
+
+
+def _column_array(values, type):
+    import pyarrow as pa
+    if pa.types.is_floating(type):
+        return pa.array([None if pd.isna(value) else float(value) for value in values], type=type)
+    return pa.array([None if pd.isna(value) else str(value) for value in values], type=type)
+
+
+def _parts(path):
+    if not os.path.isdir(path):
+        return []
+    ext = '.' + table_format(path)
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(ext))
+
+
+class EmissionsWriter:
+    """
+    Buffered writer for the emissions table.
+
+    :param path: Table path; the extension (.csv, .parquet, .arrow) picks the format
+    :param flush_rows: Rows buffered before they are written
+    :param columns: Table columns; tables without 'image file' get no index sidecar
+    """
+
+    def __init__(self, path='emissions.csv', flush_rows=FLUSH_ROWS, columns=COLUMNS):
+        self.path = path
+        self.format = table_format(path)
+        self.flush_rows = flush_rows
+        self.columns = list(columns)
+        self._rows = []
+        self._last_image = None
+        if self.format != 'csv':
+            os.makedirs(path, exist_ok=True)
+
+    def next_image_index(self):
+        """
+        Number for the next image file (1 for an empty table).
+        """
+        if self._last_image is None:
+            self._last_image = last_image_number(self.path)
+        pending = [image_number(row['image file']) for row in self._rows]
+        return max([self._last_image] + pending) + 1
+
+    def append(self, row):
+        """
+        Buffers one row ({column: value}); missing columns are left empty.
+        """
+        self._rows.append({column: row.get(column) for column in self.columns})
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def extend(self, rows):
+        """
+        Buffers several rows, like append() for each.
+        """
+        self._rows.extend({column: row.get(column) for column in self.columns} for row in rows)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        if self.format == 'csv':
+            self._flush_csv()
+        else:
+            self._flush_part()
+        if 'image file' in self.columns:
+            last = max(image_number(row['image file']) for row in self._rows)
+            self._last_image = max(last, self._last_image or 0)
+            self._write_index()
+        self._rows = []
+
+    def _flush_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            writer.writerow(self.columns)
+        writer.writerows([[row[column] for column in self.columns] for row in self._rows])
+        with open(self.path, 'a', newline='') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _flush_part(self):
+        import pyarrow as pa
+
+        schema = table_schema(self.columns)
+        table = pa.Table.from_arrays([_column_array([row[field.name] for row in self._rows], field.type)
+                                      for field in schema], schema=schema)
+        parts = _parts(self.path)
+        number = int(os.path.basename(parts[-1]).split('-')[1].split('.')[0]) + 1 if parts else 0
+        part = os.path.join(self.path, f"part-{number:06d}.{self.format}")
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, part + '.tmp')
+        else:
+            with pa.OSFile(part + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(part + '.tmp', part)
+
+    def _write_index(self):
+        index = {"last_image": self._last_image, "source": _source_key(self.path)}
+        with open(index_path(self.path) + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path(self.path) + '.tmp', index_path(self.path))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _tail_lines(path, tail_bytes=TAIL_BYTES):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - tail_bytes))
+        data = f.read()
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    # The first line is partial unless the whole file was read
+    return lines if size <= tail_bytes else lines[1:]
+
+
+def last_image_number(path):
+    """
+    Largest image number in the table, 0 if it is empty or missing. Uses the
+    sidecar when it matches the table, otherwise reads only the tail.
+    """
+    if not os.path.exists(path):
+        return 0
+    if os.path.exists(index_path(path)):
+        with open(index_path(path), 'r') as f:
+            index = json.load(f)
+        if index.get("source") == _source_key(path):
+            return index["last_image"]
+
+    if table_format(path) == 'csv':
+        tail_bytes = TAIL_BYTES
+        while True:
+            lines = _tail_lines(path, tail_bytes)
+            rows = [row for row in csv.reader(lines) if row and row != COLUMNS]
+            if rows or tail_bytes >= os.path.getsize(path):
+                break
+            tail_bytes *= 4
+        image_col = COLUMNS.index('image file')
+        numbers = [image_number(row[image_col]) for row in rows if len(row) == len(COLUMNS)]
+        return max(numbers) if numbers else 0
+
+    parts = _parts(path)
+    if not parts:
+        return 0
+    images = read_emissions(parts[-1], columns=['image file'])['image file']
+    return max(image_number(image) for image in images) if len(images) else 0
+
+
+def read_emissions(path='emissions.csv', columns=None):
+    """
+    Reads the emissions table (or a single part of it) into a DataFrame.
+
+    :param columns: Only read these columns
+    """
+    if os.path.isfile(path) and path.endswith('.csv'):
+        return pd.read_csv(path, usecols=columns)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns or COLUMNS)
+
+    import pyarrow as pa
+    paths = [path] if os.path.isfile(path) else _parts(path)
+    if table_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(part, columns=columns) for part in paths]
+    else:
+        tables = []
+        for part in paths:
+            with pa.memory_map(part, 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            tables.append(table.select(columns) if columns else table)
+    if not tables:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    # Parts written before the schema was fixed may have inferred column types
+    tables = [table.cast(table_schema(table.column_names)) for table in tables]
+    return pa.concat_tables(tables).to_pandas()
+
+
+def compact(path):
+    """
+    Rewrites a Parquet/Arrow table directory as a single part.
+    """
+    parts = _parts(path)
+    if len(parts) < 2:
+        return
+    df = read_emissions(path)
+    with EmissionsWriter(path, flush_rows=len(df) + 1, columns=df.columns) as writer:
+        writer.extend(df.to_dict('records'))
+    for part in parts:
+        os.remove(part)
+
+
+if __name__ == "__main__":
+    # Example usage: python emissions_log.py emissions.csv emissions.parquet
+    # (converts a table between formats)
+    source = sys.argv[1] if len(sys.argv) > 1 else 'emissions.csv'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'emissions.parquet'
+    df = read_emissions(source)
+    with EmissionsWriter(target, flush_rows=len(df) + 1) as writer:
+        for row in df.to_dict('records'):
+            writer.append(row)
+    print(f"Wrote {len(df)} rows to {target}, next image {writer.next_image_index()}")
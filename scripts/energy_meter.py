@@ -0,0 +1,186 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from power_sampler import DEFAULT_RATE_HZ, CounterUnsupported, FakeNvml, NvmlBackend, PowerSampler
+
+# Energy of a block of work, per device. Two modes:
+#
+#   'counter'   reads NVML's cumulative energy counter
+#               (nvmlDeviceGetTotalEnergyConsumption) before and after; the
+#               difference is the exact energy in millijoules and nothing runs
+#               in between
+#   'sampling'  integrates power samples from a PowerSampler
+#
+# 'auto' uses the counter when every device has one and falls back to
+# sampling otherwise.
+
+MODES = ('auto', 'counter', 'sampling')
+
+
+class Measurement:
+    """
+    Result of one EnergyMeter.measure() block; filled in when the block exits.
+    """
+
+    def __init__(self, mode, start, devices):
+        self.mode = mode
+        self.start = start
+        self.end = None
+        self.devices = devices  # backend indices of the measured devices
+        self.energy_j = None    # per measured device
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @property
+    def mean_power(self):
+        """
+        Mean power per device in watts.
+        """
+        return self.energy_j / self.duration
+
+
+class EnergyMeter:
+    """
+    Measures the energy of code blocks on all devices of a backend.
+
+    :param backend: Device backend (default: NvmlBackend)
+    :param mode: 'auto', 'counter' or 'sampling'
+    :param rate_hz: Sampling rate of the sampling mode
+    """
+
+    def __init__(self, backend=None, mode='auto', rate_hz=DEFAULT_RATE_HZ, clock=time.perf_counter):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        self.backend = backend if backend is not None else NvmlBackend()
+        self.clock = clock
+        self.backend.init()
+        self.devices = self.backend.device_count()
+        self.sampler = None
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+        if mode != 'sampling':
+            try:
+                self.read_counters()
+                mode = 'counter'
+            except CounterUnsupported as e:
+                if mode == 'counter':
+                    raise
+                print(f"Energy counter unavailable ({e}), sampling power at {rate_hz} Hz")
+                mode = 'sampling'
+        if mode == 'sampling':
+            self.sampler = PowerSampler(self.backend, rate_hz=rate_hz, clock=clock)
+        self.mode = mode
+
+    def device_names(self):
+        return [self.backend.device_name(i) for i in range(self.devices)]
+
+    def read_counters(self, devices=None):
+        """
+        Cumulative energy of the devices (default: all) in millijoules.
+        """
+        devices = range(self.devices) if devices is None else devices
+        return np.array([self.backend.energy_mj(i) for i in devices], dtype=np.int64)
+
+    @contextmanager
+    def measure(self, devices=None):
+        """
+        Measures the energy used while the block runs:
+
+            with meter.measure() as m:
+                work()
+            print(m.energy_j, m.duration)
+
+        Blocks may run concurrently in several threads, e.g. one generation
+        per GPU, each measuring only its own devices.
+
+        :param devices: Backend indices of the devices to attribute the energy
+                        to (default: all)
+        """
+        devices = list(range(self.devices)) if devices is None else list(devices)
+        if self.mode == 'counter':
+            before = self.read_counters(devices)
+            measurement = Measurement(self.mode, self.clock(), devices)
+            try:
+                yield measurement
+            finally:
+                measurement.end = self.clock()
+                measurement.energy_j = (self.read_counters(devices) - before) / 1000.0
+        else:
+            # The sampler runs while any measurement is active
+            with self._active_lock:
+                self._active += 1
+                self.sampler.start()
+            measurement = Measurement(self.mode, self.clock(), devices)
+            try:
+                yield measurement
+            finally:
+                measurement.end = self.clock()
+                # Closing sample, so the window's end is covered
+                self.sampler.sample()
+                with self._active_lock:
+                    self._active -= 1
+                    if not self._active:
+                        self.sampler.stop()
+                measurement.energy_j = self.sampler.energy(measurement.start, measurement.end)[devices]
+
+    def close(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.backend.shutdown()
+
+
+def compare_modes(backend, work, rate_hz=DEFAULT_RATE_HZ, runs=3):
+    """
+    Measures `work` with the energy counter and with power sampling at the
+    same time, so both modes see identical windows.
+
+    :param backend: Device backend with an energy counter
+    :param work: Callable run once per measurement
+    :return: List of dicts per run with both energies in joules (per device)
+             and the relative difference of sampling against the counter
+    """
+    counter = EnergyMeter(backend, mode='counter')
+    sampler = PowerSampler(backend, rate_hz=rate_hz, clock=counter.clock)
+    results = []
+    for _ in range(runs):
+        sampler.start()
+        with counter.measure() as m:
+            work()
+        sampler.stop()
+        sampled = sampler.energy(m.start, m.end)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            difference = (sampled - m.energy_j) / m.energy_j
+        results.append({
+            "duration": m.duration,
+            "counter_j": m.energy_j,
+            "sampling_j": sampled,
+            "relative_difference": difference,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    # Example usage: python energy_meter.py (compares the modes on the simulated device)
+    fake = FakeNvml(idle_w=60.0, load_w=150.0, ripple_w=10.0, ripple_hz=3.0)
+
+    def work():
+        with fake.busy():
+            time.sleep(1.0)
+
+    for rate in (10, 50, 100):
+        for result in compare_modes(fake, work, rate_hz=rate, runs=2):
+            print(f"{rate:>3} Hz: counter {result['counter_j'][0]:.3f} J, "
+                  f"sampling {result['sampling_j'][0]:.3f} J, "
+                  f"difference {100 * result['relative_difference'][0]:+.3f}%")
+
+    # Devices without a counter fall back to sampling
+    meter = EnergyMeter(FakeNvml(energy_counter=False), mode='auto')
+    with meter.measure() as m:
+        time.sleep(0.2)
+    print(f"fallback mode '{meter.mode}': {m.energy_j[0]:.3f} J over {m.duration:.3f} s")
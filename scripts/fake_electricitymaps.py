@@ -0,0 +1,164 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the Electricity Maps endpoints used by data.py (zones,
+# latest, history and past-range), so the collector can be benchmarked and
+# its failure handling and backfill exercised offline.
+
+DEFAULT_ZONES = [f"Z{i:03d}" for i in range(228)]
+
+
+def fake_intensity(zone, timestamp):
+    """
+    Deterministic carbon intensity for a zone at a unix timestamp, with a daily
+    cycle so hourly aggregates look plausible.
+    """
+    seed = int(hashlib.md5(zone.encode()).hexdigest()[:8], 16)
+    base = 50 + seed % 600
+    hour = (timestamp // 3600) % 24
+    return int(base * (1 + 0.25 * ((hour - 12) / 12) ** 2))
+
+
+def format_iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+def parse_iso(text):
+    return int(datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp())
+
+
+class FakeElectricityMapsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path == '/v3/zones':
+            etag = server.zones_etag
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_json(200, {zone: {"zoneName": zone} for zone in server.zones}, {'ETag': etag})
+            return
+
+        if server.rng_failure():
+            self.send_json(server.failure_status(), {"error": "injected failure"})
+            return
+
+        if url.path == '/v3/carbon-intensity/latest':
+            zone = query.get('zone')
+            if zone not in server.zones:
+                self.send_json(404, {"error": f"Zone '{zone}' does not exist"})
+                return
+            now = int(server.clock())
+            self.send_json(200, {
+                "zone": zone,
+                "carbonIntensity": fake_intensity(zone, now),
+                "datetime": format_iso(now // 3600 * 3600),
+            })
+            return
+
+        if url.path in ('/v3/carbon-intensity/history', '/v3/carbon-intensity/past-range'):
+            zone = query.get('zone')
+            if zone not in server.zones:
+                self.send_json(404, {"error": f"Zone '{zone}' does not exist"})
+                return
+            current_hour = int(server.clock()) // 3600 * 3600
+            if url.path.endswith('/history'):
+                # The 24 hours up to and including the current one
+                start, end = current_hour - 23 * 3600, current_hour + 3600
+            else:
+                start, end = parse_iso(query['start']), min(parse_iso(query['end']), current_hour + 3600)
+            hours = range((start + 3599) // 3600 * 3600, end, 3600)
+            self.send_json(200, {"zone": zone, "data" if url.path.endswith('range') else "history": [
+                {"zone": zone, "carbonIntensity": fake_intensity(zone, hour), "datetime": format_iso(hour)}
+                for hour in hours
+            ]})
+            return
+
+        self.send_json(404, {"error": f"Unknown endpoint {url.path}"})
+
+
+class FakeElectricityMapsServer(ThreadingHTTPServer):
+    """
+    :param zones: Zone codes served by /v3/zones
+    :param latency: Seconds to sleep before every response
+    :param failure_rate: Fraction of intensity requests answered with 429/5xx
+    :param clock: Callable returning the server's notion of "now" (unix seconds)
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), zones=None, latency=0.0, failure_rate=0.0,
+                 clock=time.time, seed=0):
+        super().__init__(address, FakeElectricityMapsHandler)
+        self.zones = list(zones or DEFAULT_ZONES)
+        self.zones_etag = '"' + hashlib.md5(','.join(self.zones).encode()).hexdigest() + '"'
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.clock = clock
+        self.requests_served = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests_served += 1
+
+    def rng_failure(self):
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+    def failure_status(self):
+        with self._lock:
+            return self._rng.choice([429, 500, 503])
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v3'
+
+
+def start_server(**kwargs):
+    """
+    Starts a stand-in server on a background thread.
+
+    :return: The running FakeElectricityMapsServer; call shutdown() when done
+    """
+    server = FakeElectricityMapsServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = FakeElectricityMapsServer(('127.0.0.1', 8765))
+    print(f"Serving fake Electricity Maps API at {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,269 @@
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from intensity_query import IntensityQuery, calendar_keys
+
+# Offline carbon intensity forecasts for every zone at once, trained on the
+# local history. The history is put on an hourly grid (the last sample of each
+# hour, NaN where nothing was collected), and every model maps the trailing
+# `train_hours` of that grid, a zones × hours matrix, to a zones × horizon
+# forecast:
+#
+#   seasonal_naive   the last observed value at the same hour of the day
+#                    (season=24) or week (season=168)
+#   smoothing        additive seasonal exponential smoothing, one pass over
+#                    the window updating all zones per step; missing hours
+#                    leave the state unchanged
+#   ridge            ridge regression on hour-of-day and weekday indicators
+#                    with recency weights; the features are shared by all
+#                    zones, so the normal equations of every zone are formed
+#                    with one matrix product and solved as one batch
+#
+# backtest() replays forecasts from rolling origins over the history and
+# reports the error per zone and model, plus forecast throughput.
+
+HORIZON = 24
+TRAIN_HOURS = 28 * 24
+FORECAST_FILE = 'carbon_intensity_forecast.json'
+COLLECTED = 'collected'
+
+
+def hourly_grid(frame):
+    """
+    Puts a frame on an hourly grid.
+
+    :param frame: IntensityFrame
+    :return: (datetime64[h] hours, float64 matrix (zones, hours) with the last
+             sample of each zone in each hour, NaN where there is none)
+    """
+    mask = np.asarray(frame.mask)
+    # Timestamps without any sample (failed collections) do not extend the grid
+    collected = mask.any(axis=0)
+    hours = np.asarray(frame.times, dtype='datetime64[s]').astype('datetime64[h]')
+    if not collected.any():
+        return hours[:0], np.zeros((len(frame.zones), 0))
+    grid_hours = np.arange(hours[collected][0], hours[collected][-1] + 1, dtype='datetime64[h]')
+    # Cells of the samples in row-major order, so within a (zone, hour) cell
+    # the samples follow in time order and the last one is kept
+    rows, cols = np.nonzero(mask)
+    cells = rows * len(grid_hours) + (hours[cols] - grid_hours[0]).astype(np.intp)
+    last = np.r_[cells[1:] != cells[:-1], True]
+    grid = np.full((len(frame.zones), len(grid_hours)), np.nan)
+    grid.flat[cells[last]] = np.asarray(frame.values)[rows[last], cols[last]]
+    return grid_hours, grid
+
+
+def future_hours(hours, horizon):
+    return hours[-1] + np.arange(1, horizon + 1)
+
+
+def seasonal_naive(history, hours, horizon=HORIZON, season=24):
+    """
+    Repeats the last observed value of each phase of the season.
+    """
+    n_zones, n_hours = history.shape
+    # Align the window so that its last column is the last phase of a cycle
+    pad = (-n_hours) % season
+    cycles = np.concatenate([np.full((n_zones, pad), np.nan), history], axis=1).reshape(n_zones, -1, season)
+    observed = ~np.isnan(cycles)
+    latest = np.maximum.accumulate(np.where(observed, np.arange(cycles.shape[1])[None, :, None], -1), axis=1)[:, -1]
+    last_values = np.take_along_axis(cycles, np.maximum(latest, 0)[:, None, :], axis=1)[:, 0]
+    last_values = np.where(latest >= 0, last_values, np.nan)
+    return last_values[:, np.arange(horizon) % season]
+
+
+def smoothing(history, hours, horizon=HORIZON, alpha=0.2, gamma=0.3, season=24):
+    """
+    Additive seasonal exponential smoothing (no trend), initialised from the
+    first week of the window.
+    """
+    phases = ((hours - hours[0]).astype(np.int64)) % season
+    first = history[:, :7 * 24]
+    with warnings.catch_warnings():
+        # Zones without samples in the window (all-NaN slices) get NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        level = np.nanmean(first, axis=1)
+        seasonal = np.stack([np.nanmean(first[:, phases[:first.shape[1]] == p], axis=1) for p in range(season)],
+                            axis=1) - level[:, None]
+        level = np.where(np.isnan(level), np.nanmean(history, axis=1), level)
+    seasonal = np.nan_to_num(seasonal)
+
+    for t in range(history.shape[1]):
+        y = history[:, t]
+        observed = ~np.isnan(y)
+        p = phases[t]
+        new_level = alpha * (y - seasonal[:, p]) + (1 - alpha) * level
+        level = np.where(observed, new_level, level)
+        seasonal[:, p] = np.where(observed, gamma * (y - level) + (1 - gamma) * seasonal[:, p], seasonal[:, p])
+
+    future_phases = (phases[-1] + np.arange(1, horizon + 1)) % season
+    return level[:, None] + seasonal[:, future_phases]
+
+
+def calendar_features(hours):
+    """
+    Design matrix (hours, 1 + 24 + 7): intercept, hour-of-day and weekday indicators.
+    """
+    hour_of_day, weekday, _, _ = calendar_keys(hours)
+    features = np.zeros((len(hours), 32))
+    features[:, 0] = 1.0
+    features[np.arange(len(hours)), 1 + hour_of_day] = 1.0
+    features[np.arange(len(hours)), 25 + weekday] = 1.0
+    return features
+
+
+def ridge(history, hours, horizon=HORIZON, alpha=1.0, half_life=7 * 24):
+    """
+    Ridge regression on calendar features, fitted per zone with weights that
+    halve every `half_life` hours back from the forecast origin.
+    """
+    features = calendar_features(hours)
+    observed = ~np.isnan(history)
+    age = len(hours) - 1 - np.arange(len(hours))
+    weights = np.where(observed, 0.5 ** (age / half_life), 0.0)           # (zones, hours)
+    targets = np.where(observed, history, 0.0)
+
+    n_features = features.shape[1]
+    outer = (features[:, :, None] * features[:, None, :]).reshape(len(hours), -1)
+    gram = (weights @ outer).reshape(-1, n_features, n_features)           # X^T W X per zone
+    moment = (weights * targets) @ features                                # X^T W y per zone
+    penalty = np.full(n_features, alpha)
+    penalty[0] = 1e-9                                                      # leave the intercept free
+    coefficients = np.linalg.solve(gram + np.diag(penalty), moment[:, :, None])[:, :, 0]
+
+    prediction = coefficients @ calendar_features(future_hours(hours, horizon)).T
+    return np.where(observed.any(axis=1)[:, None], prediction, np.nan)
+
+
+MODELS = {
+    'seasonal_naive': seasonal_naive,
+    'weekly_naive': lambda history, hours, horizon=HORIZON: seasonal_naive(history, hours, horizon, season=168),
+    'smoothing': smoothing,
+    'ridge': ridge,
+}
+
+
+def forecast(frame, model='ridge', horizon=HORIZON, train_hours=TRAIN_HOURS):
+    """
+    Forecasts every zone of a frame for the `horizon` hours after its last sample.
+
+    :return: (datetime64[h] forecast hours, matrix (zones, horizon))
+    """
+    hours, grid = hourly_grid(frame)
+    hours, grid = hours[-train_hours:], grid[:, -train_hours:]
+    return future_hours(hours, horizon), MODELS[model](grid, hours, horizon)
+
+
+def load_frame(path=COLLECTED):
+    """
+    Everything data.py has collected (intensity_log.load_collected()), or
+    the history at `path`.
+    """
+    if path == COLLECTED:
+        from intensity_log import load_collected
+        return load_collected()
+    return IntensityQuery.open(path).frame
+
+
+def forecast_records(zones, hours, values):
+    """
+    Forecast as entries in the carbon_intensity.json layout.
+    """
+    times = [str(hour.astype('datetime64[s]')).replace('T', ' ') for hour in hours]
+    return [{"time": time_str, "data": {zone: round(float(value), 1) for zone, value in zip(zones, values[:, col])
+                                        if not np.isnan(value)}}
+            for col, time_str in enumerate(times)]
+
+
+def backtest(frame, models=tuple(MODELS), horizon=HORIZON, train_hours=TRAIN_HOURS, step=24, min_history=7 * 24):
+    """
+    Forecasts from every `step`-th hour that has at least `min_history` hours
+    of grid before it and an observation in the horizon after it, and scores
+    the forecasts against the samples actually collected.
+
+    :return: {model: {"mae", "rmse", "mape" (per zone arrays, NaN where never
+             scored), "scored" (per zone counts), "seconds", "forecasts_per_s"}}
+    """
+    hours, grid = hourly_grid(frame)
+    observed = ~np.isnan(grid)
+    origins = [origin for origin in range(min_history, len(hours), step) if observed[:, origin:origin + horizon].any()]
+
+    results = {}
+    n_zones = grid.shape[0]
+    for name in models:
+        model = MODELS[name]
+        abs_error = np.zeros(n_zones)
+        sq_error = np.zeros(n_zones)
+        pct_error = np.zeros(n_zones)
+        pct_count = np.zeros(n_zones)
+        scored = np.zeros(n_zones, dtype=np.int64)
+        seconds = 0.0
+        for origin in origins:
+            start = max(0, origin - train_hours)
+            began = time.perf_counter()
+            predicted = model(grid[:, start:origin], hours[start:origin], horizon)
+            seconds += time.perf_counter() - began
+
+            actual = grid[:, origin:origin + horizon]
+            predicted = predicted[:, :actual.shape[1]]
+            valid = ~np.isnan(actual) & ~np.isnan(predicted)
+            error = np.where(valid, predicted - actual, 0.0)
+            abs_error += np.abs(error).sum(axis=1)
+            sq_error += (error ** 2).sum(axis=1)
+            relative = valid & (actual > 0)
+            pct_error += np.where(relative, np.abs(error) / np.where(relative, actual, 1.0), 0.0).sum(axis=1)
+            pct_count += relative.sum(axis=1)
+            scored += valid.sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            results[name] = {
+                "mae": np.where(scored > 0, abs_error / scored, np.nan),
+                "rmse": np.where(scored > 0, np.sqrt(sq_error / np.maximum(scored, 1)), np.nan),
+                "mape": np.where(pct_count > 0, 100 * pct_error / np.maximum(pct_count, 1), np.nan),
+                "scored": scored,
+                "origins": len(origins),
+                "seconds": seconds,
+                "forecasts_per_s": n_zones * len(origins) / seconds if seconds else float('nan'),
+            }
+    return results
+
+
+def print_backtest(zones, results, top=10):
+    baseline = results.get('seasonal_naive')
+    print(f"{'model':<16}{'MAE':>8}{'RMSE':>8}{'MAPE':>8}{'skill':>8}{'zone forecasts/s':>18}")
+    for name, result in results.items():
+        scored = result["scored"] > 0
+        mae = np.nanmean(result["mae"][scored]) if scored.any() else np.nan
+        skill = 1 - mae / np.nanmean(baseline["mae"][scored]) if baseline is not None and scored.any() else np.nan
+        print(f"{name:<16}{mae:>8.1f}{np.nanmean(result['rmse'][scored]) if scored.any() else np.nan:>8.1f}"
+              f"{np.nanmean(result['mape'][scored]) if scored.any() else np.nan:>7.1f}%{skill:>8.2f}"
+              f"{result['forecasts_per_s']:>18.0f}")
+    best = min(results, key=lambda name: np.nanmean(results[name]["mae"]))
+    print(f"\nLargest errors of '{best}' (MAE per zone):")
+    mae = results[best]["mae"]
+    for row in np.argsort(np.where(np.isnan(mae), -np.inf, mae))[::-1][:top]:
+        print(f"{zones[row]:<15}{mae[row]:>8.1f}")
+
+
+if __name__ == "__main__":
+    # Example usage: python forecast.py collected ridge 48
+    #                python forecast.py backtest carbon_intensity.json 24
+    # ('collected' reads everything data.py has collected, in either storage mode)
+    if len(sys.argv) > 1 and sys.argv[1] == 'backtest':
+        path = sys.argv[2] if len(sys.argv) > 2 else COLLECTED
+        horizon = int(sys.argv[3]) if len(sys.argv) > 3 else HORIZON
+        frame = load_frame(path)
+        print_backtest(frame.zones, backtest(frame, horizon=horizon))
+    else:
+        path = sys.argv[1] if len(sys.argv) > 1 else COLLECTED
+        model = sys.argv[2] if len(sys.argv) > 2 else 'ridge'
+        horizon = int(sys.argv[3]) if len(sys.argv) > 3 else HORIZON
+        frame = load_frame(path)
+        hours, values = forecast(frame, model, horizon)
+        with open(FORECAST_FILE, 'w') as f:
+            json.dump(forecast_records(frame.zones, hours, values), f, indent=4)
+        print(f"Wrote a {horizon} h '{model}' forecast of {len(frame.zones)} zones to {FORECAST_FILE}")
@@ -0,0 +1,225 @@
+import itertools
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from device_attribution import process_devices
+from emissions_log import BENCHMARK_COLUMNS, EmissionsWriter
+from energy_meter import EnergyMeter
+from power_sampler import FakeNvml
+from prompts import PROMPTS
+
+# Benchmark of image generation energy: sweeps batch size, inference steps
+# and resolution over the standard prompts and records images/s, J/image and
+# gCO2/image per configuration.
+#
+# Pipelines implement a small interface:
+#
+#   load()            load the model weights (host memory)
+#   to_device()       move them to the accelerator
+#   generate(prompts, steps, height, width) -> list of images
+#   ready             True once the pipeline is on the device
+#
+# DiffusersPipeline wraps a diffusers model on CUDA; StubPipeline is a CPU
+# stand-in with a deterministic cost model that keeps a FakeNvml device busy,
+# so the harness runs without a GPU.
+
+SDXL_MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+BATCH_SIZES = (1, 2, 4, 8)
+STEPS = (20, 30, 50)
+RESOLUTIONS = ((768, 768), (1024, 1024))
+
+
+class DiffusersPipeline:
+    """
+    A diffusers text-to-image pipeline in fp16.
+    """
+
+    def __init__(self, model=SDXL_MODEL, device='cuda', **kwargs):
+        self.name = model
+        self.device = device
+        self.kwargs = kwargs
+        self.pipe = None
+        self.ready = False
+
+    def _synchronize(self):
+        import torch
+        if self.device.startswith('cuda'):
+            torch.cuda.synchronize()
+
+    def load(self):
+        import torch
+        from diffusers import DiffusionPipeline
+        kwargs = {"torch_dtype": torch.float16, "use_safetensors": True, "variant": "fp16", **self.kwargs}
+        self.pipe = DiffusionPipeline.from_pretrained(self.name, **kwargs)
+
+    def to_device(self):
+        self.pipe.to(self.device)
+        self._synchronize()
+        self.ready = True
+
+    def generate(self, prompts, steps, height, width):
+        images = self.pipe(prompt=list(prompts), num_inference_steps=steps, height=height, width=width).images
+        self._synchronize()
+        return images
+
+
+class StubPipeline:
+    """
+    CPU stand-in for a diffusion pipeline. A batch takes
+
+        batch_overhead_s + step_s * steps * megapixels * batch ** batch_exponent
+
+    seconds (plus `warmup_s` on the first call), during which the FakeNvml
+    device draws load power. batch_exponent < 1 models the better GPU
+    utilization of larger batches. Images are small deterministic arrays.
+    """
+
+    def __init__(self, device=None, device_index=0, load_s=0.05, transfer_s=0.02, warmup_s=0.05,
+                 batch_overhead_s=0.01, step_s=0.0005, batch_exponent=0.7, name='stub'):
+        self.device = device if device is not None else FakeNvml()
+        self.device_index = device_index
+        self.load_s = load_s
+        self.transfer_s = transfer_s
+        self.warmup_s = warmup_s
+        self.batch_overhead_s = batch_overhead_s
+        self.step_s = step_s
+        self.batch_exponent = batch_exponent
+        self.name = name
+        self.loaded = False
+        self.ready = False
+        self.warm = False
+
+    def cost_seconds(self, batch, steps, height, width):
+        megapixels = height * width / (1024 * 1024)
+        return self.batch_overhead_s + self.step_s * steps * megapixels * batch ** self.batch_exponent
+
+    def _work(self, seconds, busy=True):
+        if busy:
+            with self.device.busy(self.device_index):
+                time.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def load(self):
+        # Reading weights from disk leaves the GPU idle
+        self._work(self.load_s, busy=False)
+        self.loaded = True
+
+    def to_device(self):
+        if not self.loaded:
+            raise RuntimeError("load() the pipeline before moving it to the device")
+        self._work(self.transfer_s)
+        self.ready = True
+
+    def generate(self, prompts, steps, height, width):
+        if not self.ready:
+            raise RuntimeError("Move the pipeline to the device before generating")
+        seconds = self.cost_seconds(len(prompts), steps, height, width)
+        if not self.warm:
+            seconds += self.warmup_s
+            self.warm = True
+        self._work(seconds)
+        return [np.full((height // 64, width // 64, 3), zlib.crc32(prompt.encode()) % 256, dtype=np.uint8)
+                for prompt in prompts]
+
+
+def batches(prompts, batch_size):
+    return [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+
+
+def run_config(pipeline, meter, prompts, batch_size, steps, height, width, intensity, warmup=1, devices=None):
+    """
+    Generates every prompt once in batches of `batch_size` and measures it.
+
+    :param warmup: Untimed batches run first, so autotuning for the new shape
+                   is not counted
+    :param intensity: Carbon intensity in gCO2eq/kWh
+    :param devices: Backend indices of the devices to attribute energy to (default: all)
+    :return: Row of BENCHMARK_COLUMNS
+    """
+    groups = batches(list(prompts), batch_size)
+    for group in groups[:warmup]:
+        pipeline.generate(group, steps, height, width)
+    with meter.measure(devices) as m:
+        for group in groups:
+            pipeline.generate(group, steps, height, width)
+
+    images = len(prompts)
+    energy = float(np.sum(m.energy_j))
+    return {
+        'model': pipeline.name,
+        'batch size': batch_size,
+        'steps': steps,
+        'height': height,
+        'width': width,
+        'images': images,
+        'duration': m.duration,
+        'images/s': images / m.duration,
+        'energy': energy,
+        'joules/image': energy / images,
+        'gCO2/image': energy / 3.6e6 / images * intensity,
+        'carbon intensity': intensity,
+        'measurement': meter.mode,
+        'time': datetime.now(),
+    }
+
+
+def sweep(pipeline, meter, intensity, batch_sizes=BATCH_SIZES, steps=STEPS, resolutions=RESOLUTIONS,
+          prompts=PROMPTS, writer=None, zone=None, gpu=None, devices=None):
+    """
+    Runs every (batch size, steps, resolution) configuration.
+
+    :param writer: EmissionsWriter with BENCHMARK_COLUMNS to record the rows (optional)
+    :return: List of rows
+    """
+    if not pipeline.ready:
+        pipeline.load()
+        pipeline.to_device()
+    rows = []
+    for batch_size, n_steps, (height, width) in itertools.product(batch_sizes, steps, resolutions):
+        row = run_config(pipeline, meter, prompts, batch_size, n_steps, height, width, intensity,
+                         devices=devices)
+        row.update({'zone': zone, 'gpu': gpu})
+        print(f"batch {batch_size:>2}, {n_steps:>3} steps, {width}x{height}: {row['images/s']:.2f} images/s, "
+              f"{row['joules/image']:.1f} J/image, {row['gCO2/image']:.4f} gCO2/image")
+        if writer is not None:
+            writer.append(row)
+        rows.append(row)
+    if writer is not None:
+        writer.flush()
+    return rows
+
+
+if __name__ == "__main__":
+    # Example usage: python generation_bench.py stub benchmarks.csv 250
+    #                python generation_bench.py stabilityai/stable-diffusion-xl-base-1.0 benchmarks.csv
+    model = sys.argv[1] if len(sys.argv) > 1 else 'stub'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'benchmarks.csv'
+
+    if model == 'stub':
+        device = FakeNvml()
+        pipeline = StubPipeline(device)
+        meter = EnergyMeter(device)
+    else:
+        pipeline = DiffusersPipeline(model)
+        meter = EnergyMeter(mode='auto')
+    if len(sys.argv) > 3:
+        intensity, zone = float(sys.argv[3]), None
+    else:
+        from intensity_lookup import IntensityLookup
+        lookup = IntensityLookup(default_zone='US-CAL-CISO')
+        intensity, zone, _ = lookup.lookup(wait=5)
+        lookup.close()
+
+    pipeline.load()
+    pipeline.to_device()
+    devices = [pipeline.device_index] if model == 'stub' else process_devices(meter.backend)
+    writer = EmissionsWriter(output_path, columns=BENCHMARK_COLUMNS)
+    sweep(pipeline, meter, intensity, writer=writer, zone=zone, gpu=meter.device_names()[devices[0]],
+          devices=devices)
+    writer.close()
+    meter.close()
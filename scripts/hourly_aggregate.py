@@ -0,0 +1,262 @@
+import json
+import os
+
+import numpy as np
+
+from collector_scheduler import BACKFILL_WINDOW
+from intensity_query import calendar_keys
+from intensity_store import IntensityFrame
+
+# Group-by sums and counts of carbon intensity per (bucket, zone) for
+# hour-of-day, day-of-week, hour-of-week and month buckets, computed with one
+# bincount per bucket kind over the zone × time matrix. The running sums and counts are
+# persisted with a high-water mark, the newest timestamp folded in, so a
+# refresh only reads the samples after it. CollectorScheduler backfills hours
+# up to BACKFILL_WINDOW hours older than its latest sample, so the timestamps
+# folded in within that window before the mark are kept as well, and samples
+# in the window that are not among them are folded in too.
+#
+# The JSON files list hours, and zones within an hour, in the order they were
+# first collected, as the files written by iterating over the history did, so
+# a refresh only changes the values that moved.
+BUCKET_SIZES = {'hour': 24, 'weekday': 7, 'weekday_hour': 7 * 24, 'month': 12}
+STATE_FILE = 'hourly_average_state.npz'
+NEVER = np.iinfo(np.int64).max
+LATE_WINDOW = np.timedelta64(BACKFILL_WINDOW, 'h')
+
+
+def bucket_codes(times):
+    """
+    Returns {bucket kind: integer bucket code per timestamp}.
+    """
+    hours, weekdays, months, _ = calendar_keys(times)
+    return {'hour': hours, 'weekday': weekdays, 'weekday_hour': weekdays * 24 + hours, 'month': months - 1}
+
+
+def group_sums(values, mask, codes, n_buckets):
+    """
+    Sums and counts the masked values of a zone × time matrix per bucket.
+
+    :param values: Matrix of shape (zones, times)
+    :param mask: Boolean matrix of the same shape, True where a value exists
+    :param codes: Bucket code per timestamp
+    :param n_buckets: Number of buckets
+    :return: (sums, counts), both of shape (n_buckets, zones)
+    """
+    n_zones = values.shape[0]
+    cells = (np.asarray(codes)[None, :] * n_zones + np.arange(n_zones)[:, None])[mask]
+    sums = np.bincount(cells, weights=np.asarray(values)[mask], minlength=n_buckets * n_zones)
+    counts = np.bincount(cells, minlength=n_buckets * n_zones)
+    return sums.reshape(n_buckets, n_zones), counts.reshape(n_buckets, n_zones)
+
+
+class HourlyAggregate:
+    """
+    Running per-bucket sums and counts for every zone.
+
+    :param zones: Zone codes, one per column of the sum/count matrices
+    :param recent_times: Sorted datetime64[s] timestamps folded in so far
+                         within LATE_WINDOW of the newest one
+    :param json_offset: Byte offset in carbon_intensity.json after the last
+                        entry folded in by update_json
+    """
+
+    def __init__(self, zones=(), recent_times=None, json_offset=0):
+        self.zones = list(zones)
+        self.recent_times = np.array([], dtype='datetime64[s]') if recent_times is None else \
+            np.asarray(recent_times, dtype='datetime64[s]')
+        self.json_offset = json_offset
+        self.sums = {kind: np.zeros((size, len(self.zones))) for kind, size in BUCKET_SIZES.items()}
+        self.counts = {kind: np.zeros((size, len(self.zones)), dtype=np.int64) for kind, size in BUCKET_SIZES.items()}
+        # Unix seconds of the first sample per (hour of day, zone), NEVER if none
+        self.first_seen = np.full((24, len(self.zones)), NEVER, dtype=np.int64)
+
+    def _add_zones(self, zones):
+        known = set(self.zones)
+        new_zones = [zone for zone in zones if zone not in known]
+        if not new_zones:
+            return
+        self.zones += new_zones
+        for kind in BUCKET_SIZES:
+            pad = ((0, 0), (0, len(new_zones)))
+            self.sums[kind] = np.pad(self.sums[kind], pad)
+            self.counts[kind] = np.pad(self.counts[kind], pad)
+        self.first_seen = np.pad(self.first_seen, ((0, 0), (0, len(new_zones))), constant_values=NEVER)
+
+    @property
+    def last_time(self):
+        """
+        datetime64 of the newest sample folded in so far (the high-water
+        mark), or None.
+        """
+        return self.recent_times[-1] if len(self.recent_times) else None
+
+    def update(self, frame):
+        """
+        Folds in the samples of `frame` after the high-water mark, and those
+        within LATE_WINDOW before it that have not been folded in yet. The
+        older columns are never read, so a memory-mapped store costs only
+        the new samples.
+
+        :param frame: IntensityFrame sorted by time
+        :return: Number of timestamps added
+        """
+        times = np.asarray(frame.times, dtype='datetime64[s]')
+        start = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time - LATE_WINDOW, 'right'))
+        new_cols = start + np.flatnonzero(~np.isin(times[start:], self.recent_times))
+        if not len(new_cols):
+            return 0
+        if new_cols[0] == len(times) - len(new_cols):
+            # The usual case, only samples after the last update: keep views
+            new = frame.slice(int(new_cols[0]), len(times))
+        else:
+            new = IntensityFrame(times[new_cols], frame.zones, np.asarray(frame.values)[:, new_cols],
+                                 np.asarray(frame.mask)[:, new_cols])
+
+        self._add_zones(new.zones)
+        zone_columns = {zone: col for col, zone in enumerate(self.zones)}
+        columns = np.array([zone_columns[zone] for zone in new.zones], dtype=np.intp)
+        codes = bucket_codes(new.times)
+        for kind, kind_codes in codes.items():
+            sums, counts = group_sums(new.values, new.mask, kind_codes, BUCKET_SIZES[kind])
+            self.sums[kind][:, columns] += sums
+            self.counts[kind][:, columns] += counts
+
+        # Columns are in time order, so the first masked cell of each
+        # (hour, zone) in row-major order is its earliest sample
+        n_zones = len(new.zones)
+        mask = np.asarray(new.mask)
+        cells = (codes['hour'][None, :] * n_zones + np.arange(n_zones)[:, None])[mask]
+        seconds = np.broadcast_to(np.asarray(new.times, dtype='datetime64[s]').astype(np.int64), mask.shape)[mask]
+        unique, first = np.unique(cells, return_index=True)
+        first_seen = np.full(24 * n_zones, NEVER, dtype=np.int64)
+        first_seen[unique] = seconds[first]
+        self.first_seen[:, columns] = np.minimum(self.first_seen[:, columns], first_seen.reshape(24, n_zones))
+
+        recent = np.union1d(self.recent_times, np.asarray(new.times, dtype='datetime64[s]'))
+        self.recent_times = recent[recent > recent[-1] - LATE_WINDOW]
+        return len(new.times)
+
+    def update_records(self, records, batch_size=1024):
+        """
+        Folds in a stream of {"time", "data"} entries, e.g. from
+        stream_json.iter_records, in bounded-size batches.
+
+        :return: Number of timestamps added
+        """
+        from stream_json import iter_frames
+        return sum(self.update(frame) for frame in iter_frames(records, batch_size))
+
+    def update_json(self, path, batch_size=1024):
+        """
+        Folds in the entries appended to a carbon_intensity.json file since
+        the last call, reading on from the byte offset where that call
+        stopped. If the file does not continue there (it was replaced), it is
+        streamed from the start and the high-water mark skips what was
+        already folded in.
+
+        :return: Number of timestamps added
+        """
+        from stream_json import entry_boundary, iter_records
+        offset = self.json_offset if entry_boundary(path, self.json_offset) else 0
+        end = [offset]
+
+        def records():
+            for record, record_end in iter_records(path, offset=offset, with_offsets=True):
+                end[0] = record_end
+                yield record
+
+        added = self.update_records(records(), batch_size)
+        self.json_offset = end[0]
+        return added
+
+    def means(self, kind='hour'):
+        """
+        :return: Matrix (buckets, zones) of averages, NaN where nothing was collected
+        """
+        counts = self.counts[kind]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, self.sums[kind] / np.maximum(counts, 1), np.nan)
+
+    def save(self, path=STATE_FILE):
+        arrays = {f'sums_{kind}': self.sums[kind] for kind in BUCKET_SIZES}
+        arrays.update({f'counts_{kind}': self.counts[kind] for kind in BUCKET_SIZES})
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, zones=np.array(self.zones, dtype=str), recent_times=self.recent_times,
+                 json_offset=self.json_offset, first_seen=self.first_seen, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with np.load(path) as state:
+            required = ['first_seen'] + [f'sums_{kind}' for kind in BUCKET_SIZES]
+            if any(name not in state.files for name in required) or \
+                    'recent_times' not in state.files and 'seen_times' not in state.files:
+                # Written before a bucket kind or the folded timestamps were
+                # added: fold the history in again
+                print(f"{path} is from an older version, rebuilding the aggregate")
+                return cls()
+            if 'recent_times' in state.files:
+                aggregate = cls(state['zones'].tolist(), state['recent_times'], int(state['json_offset']))
+            else:
+                # Every timestamp folded in was kept; only the late window is needed
+                seen = state['seen_times']
+                aggregate = cls(state['zones'].tolist(), seen[seen > seen[-1] - LATE_WINDOW] if len(seen) else seen)
+            aggregate.first_seen = state['first_seen']
+            for kind in BUCKET_SIZES:
+                aggregate.sums[kind] = state[f'sums_{kind}']
+                aggregate.counts[kind] = state[f'counts_{kind}']
+        return aggregate
+
+
+def collection_order(aggregate):
+    """
+    Hours with samples, and the zone columns of each hour, in the order they
+    were first collected (ties by zone code, the order of a collected entry).
+
+    :return: List of (hour, zone columns)
+    """
+    counts = aggregate.counts['hour']
+    first_seen = aggregate.first_seen
+    zones = np.array(aggregate.zones, dtype=str)
+    hours = sorted((hour for hour in range(24) if counts[hour].any()), key=lambda hour: (first_seen[hour].min(), hour))
+    order = []
+    for hour in hours:
+        columns = np.lexsort((zones, first_seen[hour]))
+        order.append((hour, columns[counts[hour, columns] > 0].tolist()))
+    return order
+
+
+def hourly_average_dict(aggregate):
+    """
+    Returns {"HH": {zone: average}} in the layout of hourly_average.json.
+    """
+    means = aggregate.means('hour')
+    return {
+        f"{hour:02d}": {aggregate.zones[col]: float(means[hour, col]) for col in columns}
+        for hour, columns in collection_order(aggregate)
+    }
+
+
+def hourly_ordinal_dict(aggregate):
+    """
+    Ranks the hours of each zone from cleanest (1) to dirtiest, ties sharing
+    the lowest rank, in the layout of hourly_average_ordinal.json.
+    """
+    means = aggregate.means('hour')
+    # Rank = 1 + number of strictly cleaner hours; comparisons with NaN are
+    # False, so hours without data never push down the ranks of real ones
+    ranks = (means[:, None, :] < means[None, :, :]).sum(axis=0) + 1
+    # Hours in collection order like hourly_average.json, zones by code
+    return {
+        f"{hour:02d}": {aggregate.zones[col]: int(ranks[hour, col])
+                        for col in sorted(columns, key=aggregate.zones.__getitem__)}
+        for hour, columns in collection_order(aggregate)
+    }
+
+
+def write_json(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        json.dump(data, out, indent=4)
+    os.replace(tmp_path, path)
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from intensity_store import frame_from_records, load_history, load_store, merge_frames, store_exists, write_store
+
+# Append-only JSON Lines log written by data.py: one {"time", "data"} entry per
+# line. Each entry is written with a single O_APPEND write and fsync'd, so an
+# hourly sample costs O(zones) bytes instead of rewriting the whole history. A
+# crash can at worst leave a torn last line, which the reader skips.
+LOG_FILE = 'carbon_intensity.jsonl'
+STORE_DIR = 'carbon_intensity_store'
+# History written in data.py's 'json' mode; it seeds the store on the first
+# compaction, so samples collected before switching to 'log' mode are kept
+HISTORY_JSON = 'carbon_intensity.json'
+
+# While compacting, the log is moved aside so the collector can keep appending
+# to a fresh file. A leftover file from an interrupted compaction is folded in
+# on the next run; write_store swaps in a new store generation atomically, so
+# the store is either the old or the merged one at that point.
+COMPACTING_SUFFIX = '.compacting'
+
+
+def append_entry(log_path, entry):
+    """
+    Appends one {"time": ..., "data": {...}} entry to the log and fsyncs it.
+
+    :param log_path: Path to the JSON Lines log
+    :param entry: Entry in the carbon_intensity.json layout
+    """
+    line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+    fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = os.write(fd, line)
+        if written != len(line):
+            raise OSError(f"Short write to {log_path}: {written} of {len(line)} bytes")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_log(log_path):
+    """
+    Yields the entries of a log, skipping a torn or corrupt trailing line.
+
+    :param log_path: Path to the JSON Lines log
+    """
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # torn write from a crash; the entry was never committed
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print(f"Skipping corrupt log line in {log_path}: {line[:80]!r}")
+
+
+def _pending_logs(log_path):
+    return [path for path in (log_path + COMPACTING_SUFFIX, log_path) if os.path.exists(path)]
+
+
+def pending_entries(log_path=LOG_FILE):
+    """
+    Yields the entries not compacted into the store yet: those of a log left
+    over from an interrupted compaction, then those of the log.
+    """
+    for path in _pending_logs(log_path):
+        yield from read_log(path)
+
+
+def _base_frame(store_path, seed_path, mmap):
+    if store_exists(store_path):
+        return load_store(store_path, mmap=mmap)
+    if seed_path is not None and os.path.exists(seed_path):
+        return load_history(seed_path, mmap=mmap)
+    return None
+
+
+def compact(log_path=LOG_FILE, store_path=STORE_DIR, seed_path=None):
+    """
+    Folds the log into the columnar store and starts a fresh log.
+    Samples whose timestamp is already in the store are not duplicated, so
+    re-running after an interrupted compaction is safe.
+
+    :param log_path: Path to the JSON Lines log
+    :param store_path: Path of the store directory
+    :param seed_path: History the store starts from if it does not exist yet,
+                      e.g. HISTORY_JSON (optional)
+    :return: Number of entries folded into the store
+    """
+    compacting_path = log_path + COMPACTING_SUFFIX
+    if not os.path.exists(compacting_path):
+        if not os.path.exists(log_path):
+            return 0
+        os.replace(log_path, compacting_path)
+
+    entries = list(read_log(compacting_path))
+    if entries:
+        extra = frame_from_records(entries)
+        base = _base_frame(store_path, seed_path, mmap=False)
+        write_store(extra if base is None else merge_frames(base, extra), store_path)
+
+    os.remove(compacting_path)
+    return len(entries)
+
+
+def load_dataset(store_path=STORE_DIR, log_path=LOG_FILE, mmap=True, seed_path=None):
+    """
+    Loads the compacted store and any entries still in the log as one frame.
+
+    :param store_path: Path of the store directory
+    :param log_path: Path to the JSON Lines log
+    :param mmap: Memory-map the store when there is nothing to merge
+    :param seed_path: History used in place of the store while it does not
+                      exist yet, e.g. HISTORY_JSON (optional)
+    :return: IntensityFrame
+    """
+    entries = list(pending_entries(log_path))
+    frame = _base_frame(store_path, seed_path, mmap)
+    if frame is None:
+        return frame_from_records(entries)
+    if entries:
+        frame = merge_frames(frame, frame_from_records(entries))
+    return frame
+
+
+def collected_times(store_path=STORE_DIR, log_path=LOG_FILE, seed_path=None):
+    """
+    Timestamps of everything in the store and log, without loading any
+    values: the store's times matrix plus the times of the pending log
+    entries (and of the seed history while the store does not exist yet).
+
+    :return: Sorted unique datetime64[s] array
+    """
+    if store_exists(store_path):
+        times = [np.asarray(load_store(store_path).times, dtype='datetime64[s]')]
+    elif seed_path is not None and seed_path.endswith('.json') and os.path.exists(seed_path):
+        # Streamed, so only one entry of the history is decoded at a time
+        from stream_json import iter_records
+        times = [np.array([record["time"] for record in iter_records(seed_path)], dtype='datetime64[s]')]
+    elif seed_path is not None and os.path.exists(seed_path):
+        times = [np.asarray(load_history(seed_path).times, dtype='datetime64[s]')]
+    else:
+        times = []
+    times.append(np.array([entry["time"] for entry in pending_entries(log_path)], dtype='datetime64[s]'))
+    return np.unique(np.concatenate(times))
+
+
+def has_log_data(store_path=STORE_DIR, log_path=LOG_FILE):
+    """
+    True once data.py has written a log or store in 'log' mode.
+    """
+    return store_exists(store_path) or bool(_pending_logs(log_path))
+
+
+def load_collected(mmap=True):
+    """
+    Loads everything data.py has collected, in either storage mode: the store
+    and log of 'log' mode (with carbon_intensity.json until the first
+    compaction has folded it into the store), or carbon_intensity.json alone.
+    """
+    return load_dataset(STORE_DIR, LOG_FILE, mmap=mmap, seed_path=HISTORY_JSON)
+
+
+if __name__ == "__main__":
+    # Example usage: python intensity_log.py carbon_intensity.jsonl carbon_intensity_store
+    log_path = sys.argv[1] if len(sys.argv) > 1 else LOG_FILE
+    store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_DIR
+    print(f"Compacted {compact(log_path, store_path)} entries into {store_path}")
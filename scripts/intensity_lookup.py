@@ -0,0 +1,213 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from intensity_log import LOG_FILE, STORE_DIR, load_dataset
+from zone_fetcher import ZoneFetcher
+
+# Carbon intensity for calc_emissions without a network round trip per image.
+#
+#   - The machine's location (ipinfo.io) is looked up once per process.
+#   - Live intensity is cached per zone until the end of the current hour,
+#     since Electricity Maps publishes hourly values.
+#   - prefetch() refreshes the cache in a background thread, so a lookup made
+#     after a generation finds the value already resolved. After a failed
+#     refresh the zone is not tried again for REFRESH_RETRY seconds, so an
+#     offline run does not wait for a network timeout on every lookup.
+#   - Without network, the latest sample of the zone in the local history is
+#     used if it is recent, otherwise the zone's hourly average.
+#
+# Timestamps follow data.py, which records local time.
+
+GEO_URL = 'https://ipinfo.io/json'
+AVERAGES_FILE = 'hourly_average.json'
+HISTORY_JSON = 'carbon_intensity.json'
+HISTORY_MAX_AGE = 2 * 3600      # seconds a history sample stands in for live data
+REFRESH_RETRY = 300             # seconds before a failed refresh is tried again
+
+_location = None
+_location_lock = threading.Lock()
+
+
+def geolocate(timeout=5):
+    """
+    Returns the machine's (lat, lon) as strings, looked up once per process.
+    """
+    global _location
+    with _location_lock:
+        if _location is None:
+            _location = tuple(requests.get(GEO_URL, timeout=timeout).json()["loc"].split(","))
+        return _location
+
+
+def end_of_hour(now=None):
+    now = time.time() if now is None else now
+    return (now // 3600 + 1) * 3600
+
+
+class IntensityLookup:
+    """
+    Cached carbon intensity lookups with an offline fallback.
+
+    :param fetcher: ZoneFetcher for the Electricity Maps API
+    :param default_zone: Zone used when the location cannot be resolved
+    :param store_path: Store directory of the local history (see intensity_log.py)
+    :param log_path: Append log of the local history
+    :param history_json: carbon_intensity.json, used until the first compaction creates the store
+    :param averages_path: hourly_average.json
+    """
+
+    def __init__(self, fetcher=None, default_zone=None, store_path=STORE_DIR, log_path=LOG_FILE,
+                 history_json=HISTORY_JSON, averages_path=AVERAGES_FILE):
+        self.fetcher = fetcher if fetcher is not None else ZoneFetcher(max_workers=1, retries=1)
+        self.default_zone = default_zone
+        self.store_path = store_path
+        self.log_path = log_path
+        self.history_json = history_json
+        self.averages_path = averages_path
+        # zone -> (intensity, expires); None -> (intensity, zone, expires) for the local zone
+        self._cache = {}
+        self._local = None
+        self._history = None
+        self._profile = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = {}
+        self._retry_at = {}     # zone -> unix time after which a failed refresh may run again
+
+    def _fetch(self, zone):
+        """
+        Live lookup; zone None means the machine's own zone.
+
+        :return: (intensity, zone)
+        """
+        if zone is None:
+            lat, lon = geolocate()
+            response = self.fetcher.get_json('carbon-intensity/latest', {"lat": lat, "lon": lon})
+        else:
+            response = self.fetcher.get_json('carbon-intensity/latest', {"zone": zone})
+        return float(response["carbonIntensity"]), response["zone"]
+
+    def _refresh(self, zone):
+        try:
+            intensity, resolved = self._fetch(zone)
+        except Exception:
+            with self._lock:
+                self._retry_at[zone] = time.time() + REFRESH_RETRY
+            raise
+        expires = end_of_hour()
+        with self._lock:
+            self._cache[resolved] = (intensity, expires)
+            if zone is None:
+                self._local = (intensity, resolved, expires)
+        return intensity, resolved
+
+    def _cached(self, zone):
+        now = time.time()
+        with self._lock:
+            if zone is None:
+                if self._local is not None and self._local[2] > now:
+                    return self._local[0], self._local[1]
+            elif zone in self._cache and self._cache[zone][1] > now:
+                return self._cache[zone][0], zone
+        return None
+
+    def prefetch(self, zone=None):
+        """
+        Starts refreshing `zone` (default: the local zone) in the background
+        unless a fresh value is cached, a refresh is already running, or the
+        last one failed less than REFRESH_RETRY seconds ago.
+        """
+        if self._cached(zone) is not None:
+            return
+        with self._lock:
+            future = self._pending.get(zone)
+            if (future is None or future.done()) and time.time() >= self._retry_at.get(zone, 0):
+                self._pending[zone] = self._executor.submit(self._refresh, zone)
+
+    def lookup(self, zone=None, wait=None):
+        """
+        Returns (intensity, zone, source) with the intensity as a float and
+        source 'cache', 'live', 'history' or 'average'.
+
+        :param zone: Zone code (default: the machine's zone)
+        :param wait: Seconds to wait for a running refresh before falling back
+                     (None waits until it completes)
+        """
+        cached = self._cached(zone)
+        if cached is not None:
+            return cached + ('cache',)
+        self.prefetch(zone)
+        try:
+            # While backing off, this is the failed refresh, which raises at once
+            return self._pending[zone].result(timeout=wait) + ('live',)
+        except Exception as e:
+            print(f"Live carbon intensity unavailable ({type(e).__name__}: {e}), using local data")
+        return self.offline(zone)
+
+    def _offline_zone(self, zone):
+        if zone is not None:
+            return zone
+        if self._local is not None:
+            return self._local[1]
+        if self.default_zone is None:
+            raise LookupError("Zone unknown offline; pass a zone or set default_zone")
+        return self.default_zone
+
+    def _load_history(self):
+        if self._history is None:
+            self._history = load_dataset(self.store_path, self.log_path, seed_path=self.history_json)
+        return self._history
+
+    def _load_profile(self):
+        if self._profile is None and os.path.exists(self.averages_path):
+            from request_join import profile_from_averages
+            self._profile = profile_from_averages(self.averages_path)
+        return self._profile
+
+    def offline(self, zone=None, now=None):
+        """
+        Intensity from local data: the zone's latest history sample if it is
+        at most HISTORY_MAX_AGE old, else its average for the current hour.
+
+        :return: (intensity, zone, source)
+        """
+        zone = self._offline_zone(zone)
+        now = datetime.now() if now is None else now
+        frame = self._load_history()
+        row = frame.zone_index(zone) if frame is not None else None
+        if row is not None:
+            present = np.flatnonzero(frame.mask[row])
+            if len(present):
+                col = present[-1]
+                age = (np.datetime64(now.replace(microsecond=0)) - frame.times[col]) / np.timedelta64(1, 's')
+                if 0 <= age <= HISTORY_MAX_AGE:
+                    return float(frame.values[row, col]), zone, 'history'
+
+        profile = self._load_profile()
+        if profile is not None and profile.zone_index(zone) >= 0:
+            value = profile.values[profile.zone_index(zone), now.hour]
+            if not np.isnan(value):
+                return float(value), zone, 'average'
+        raise LookupError(f"No local carbon intensity for {zone}")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.fetcher.close()
+
+
+if __name__ == "__main__":
+    # Example usage: python intensity_lookup.py US-CAL-CISO
+    lookup = IntensityLookup(default_zone='US-CAL-CISO')
+    zone = sys.argv[1] if len(sys.argv) > 1 else None
+    for _ in range(2):
+        start = time.perf_counter()
+        intensity, resolved, source = lookup.lookup(zone, wait=5)
+        print(f"{resolved}: {intensity} gCO2eq/kWh from {source} in {1000 * (time.perf_counter() - start):.1f} ms")
+    lookup.close()
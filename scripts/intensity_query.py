@@ -0,0 +1,175 @@
+import numpy as np
+
+from intensity_store import IntensityFrame, frame_from_records, load_history
+
+# Time-indexed selections over an IntensityFrame. Timestamps are parsed once
+# into the frame's sorted datetime64 array; date and date-range selections are
+# binary searches returning frame slices (views of the underlying matrix).
+# Hour-of-day, day-of-week and month-day selections are not contiguous in
+# time, so each key keeps a stable argsort of the columns and a bounds table:
+# the matching columns are found with one lookup and gathered in time order.
+
+
+def _as_day(date):
+    return np.datetime64(date, 'D')
+
+
+def calendar_keys(times):
+    """
+    Returns integer calendar keys for an array of timestamps.
+
+    :param times: datetime64 array
+    :return: (hours 0-23, weekdays with Monday == 0, months 1-12, days of month 1-31)
+    """
+    times = np.asarray(times, dtype='datetime64[s]')
+    days = times.astype('datetime64[D]')
+    months = times.astype('datetime64[M]')
+    hours = ((times - days) // np.timedelta64(1, 'h')).astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so that Monday == 0 like datetime.weekday()
+    weekdays = (days.astype(np.int64) + 3) % 7
+    month_numbers = (months.astype(np.int64) % 12) + 1
+    month_days = (days - months).astype(np.int64) + 1
+    return hours, weekdays, month_numbers, month_days
+
+
+class _KeyIndex:
+    """
+    Groups column positions by an integer key in [0, n_keys).
+    """
+
+    def __init__(self, keys, n_keys):
+        self.order = np.argsort(keys, kind='stable')
+        self.bounds = np.searchsorted(keys[self.order], np.arange(n_keys + 1))
+
+    def positions(self, key):
+        return self.order[self.bounds[key]:self.bounds[key + 1]]
+
+
+class TimeIndex:
+    """
+    Sorted timestamp index with precomputed calendar keys.
+
+    :param times: Sorted datetime64 array of sample timestamps
+    """
+
+    def __init__(self, times):
+        self.times = np.asarray(times, dtype='datetime64[s]')
+        self.hours, self.weekdays, months, days = calendar_keys(self.times)
+        self.month_days = months * 32 + days
+        self._hour_index = _KeyIndex(self.hours, 24)
+        self._weekday_index = _KeyIndex(self.weekdays, 7)
+        self._month_day_index = _KeyIndex(self.month_days, 13 * 32)
+
+    def range_bounds(self, start, end):
+        """
+        Returns (lo, hi) such that times[lo:hi] fall within [start, end).
+        """
+        lo = np.searchsorted(self.times, np.datetime64(start, 's'), side='left')
+        hi = np.searchsorted(self.times, np.datetime64(end, 's'), side='left')
+        return int(lo), int(hi)
+
+    def date_bounds(self, start_date, end_date=None):
+        """
+        Returns (lo, hi) for all samples on the dates start_date..end_date inclusive.
+        """
+        end_date = start_date if end_date is None else end_date
+        return self.range_bounds(_as_day(start_date), _as_day(end_date) + np.timedelta64(1, 'D'))
+
+    def hour_positions(self, hour):
+        return self._hour_index.positions(int(hour))
+
+    def weekday_positions(self, weekday):
+        return self._weekday_index.positions(int(weekday))
+
+    def month_day_positions(self, month_day):
+        """
+        :param month_day: 'MM-DD' string, matched in every year of the history
+        """
+        month, day = (int(part) for part in month_day.split('-'))
+        return self._month_day_index.positions(month * 32 + day)
+
+
+class IntensityQuery:
+    """
+    Query layer over a carbon intensity history.
+
+    :param frame: IntensityFrame, e.g. from intensity_store.load_history
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.index = TimeIndex(frame.times)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens a store directory, append log or carbon_intensity.json file, or
+        wraps an already loaded IntensityFrame (e.g. intensity_log.load_collected()).
+        """
+        if isinstance(path, IntensityFrame):
+            return cls(path)
+        return cls(load_history(path))
+
+    @classmethod
+    def from_records(cls, records, start_date=None, end_date=None):
+        """
+        Builds a query over a stream of {"time", "data"} entries, e.g. from
+        stream_json.iter_records, keeping only the entries within the dates
+        so memory is bounded by the selection rather than the whole file.
+
+        :param start_date: 'YYYY-MM-DD', inclusive (optional)
+        :param end_date: 'YYYY-MM-DD', inclusive (optional)
+        """
+        # "YYYY-MM-DD HH:MM:SS" strings order like the dates they start with
+        def wanted(entry):
+            date = entry["time"][:10]
+            return (start_date is None or date >= start_date) and (end_date is None or date <= end_date)
+
+        return cls(frame_from_records(entry for entry in records if wanted(entry)))
+
+    def _take(self, positions):
+        frame = self.frame
+        return IntensityFrame(frame.times[positions], frame.zones,
+                              frame.values[:, positions], frame.mask[:, positions])
+
+    def select_date(self, target_date):
+        """
+        :param target_date: 'YYYY-MM-DD'
+        :return: Frame of views over the samples on that date
+        """
+        return self.frame.slice(*self.index.date_bounds(target_date))
+
+    def select_date_range(self, start_date, end_date):
+        """
+        :param start_date: 'YYYY-MM-DD', inclusive
+        :param end_date: 'YYYY-MM-DD', inclusive
+        :return: Frame of views over the samples within the dates
+        """
+        return self.frame.slice(*self.index.date_bounds(start_date, end_date))
+
+    def select_time_range(self, start, end):
+        """
+        :return: Frame of views over the samples in [start, end)
+        """
+        return self.frame.slice(*self.index.range_bounds(start, end))
+
+    def select_hour(self, hour):
+        """
+        :param hour: Hour of day, 0-23
+        :return: Frame of every sample taken during that hour, in time order
+        """
+        return self._take(self.index.hour_positions(hour))
+
+    def select_weekday(self, weekday):
+        """
+        :param weekday: Day of week, Monday == 0
+        :return: Frame of every sample taken on that weekday, in time order
+        """
+        return self._take(self.index.weekday_positions(weekday))
+
+    def select_month_day(self, month_day):
+        """
+        :param month_day: 'MM-DD', e.g. '07-08'
+        :return: Frame of every sample taken on that calendar day, in time order
+        """
+        return self._take(self.index.month_day_positions(month_day))
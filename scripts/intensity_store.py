@@ -0,0 +1,318 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# Columnar layout of a store directory:
+#
+#   values.N.npy  int32 zones × timestamps, 0 where nothing was collected
+#   mask.N.npy    bool  zones × timestamps, True where a value was collected
+#   times.N.npy   datetime64[s] sorted sample timestamps
+#   zones.json    {"version": 1, "generation": N, "zones": [zone codes, in row order]}
+#
+# Every write puts the matrices into the files of a new generation N and then
+# replaces zones.json, so switching to the new store is a single rename; a
+# crash before it leaves the previous generation intact. Stores written
+# before generations were introduced have no "generation" key and unnumbered
+# files (values.npy, ...).
+#
+# The .npy files are opened memory-mapped, so loading a store only reads the
+# headers; pages are faulted in when a slice of the matrix is actually used.
+STORE_VERSION = 1
+VALUES_FILE = 'values.npy'
+MASK_FILE = 'mask.npy'
+TIMES_FILE = 'times.npy'
+ZONES_FILE = 'zones.json'
+DATA_FILES = (VALUES_FILE, MASK_FILE, TIMES_FILE)
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class IntensityFrame:
+    """
+    Zone × timestamp view of carbon intensity history.
+
+    :param times: Sorted datetime64[s] array of sample timestamps
+    :param zones: Zone codes, one per row of `values`
+    :param values: Integer matrix of shape (len(zones), len(times))
+    :param mask: Boolean matrix of the same shape, True where a value exists
+    """
+
+    def __init__(self, times, zones, values, mask):
+        self.times = times
+        self.zones = list(zones)
+        self.values = values
+        self.mask = mask
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return f"IntensityFrame({len(self.zones)} zones × {len(self.times)} timestamps)"
+
+    def zone_index(self, zone):
+        """
+        Returns the row of `zone` in the matrix, or None if the zone is unknown.
+        """
+        return self._zone_index.get(zone)
+
+    def series(self, zone):
+        """
+        Returns the (times, values) of a zone, restricted to collected samples.
+        """
+        row = self._zone_index[zone]
+        present = self.mask[row]
+        return self.times[present], self.values[row][present]
+
+    def slice(self, start, stop):
+        """
+        Returns the timestamps in positions [start, stop) as a frame of views.
+        """
+        return IntensityFrame(self.times[start:stop], self.zones,
+                              self.values[:, start:stop], self.mask[:, start:stop])
+
+    def select_zones(self, include_zones=None, exclude_zones=None):
+        """
+        Returns a frame restricted to `include_zones`, or without `exclude_zones`.
+        Mirrors the include/exclude semantics of the analysis scripts: when both
+        are given, `include_zones` wins.
+        """
+        if include_zones:
+            wanted = set(include_zones)
+        elif exclude_zones:
+            excluded = set(exclude_zones)
+            wanted = {zone for zone in self.zones if zone not in excluded}
+        else:
+            return self
+        rows = [i for i, zone in enumerate(self.zones) if zone in wanted]
+        return IntensityFrame(self.times, [self.zones[i] for i in rows],
+                              self.values[rows], self.mask[rows])
+
+    def as_float(self):
+        """
+        Returns the values as a float64 matrix with NaN where nothing was collected.
+        """
+        return np.where(self.mask, self.values, np.nan)
+
+    def time_strings(self):
+        """
+        Returns the timestamps formatted like the "time" field of carbon_intensity.json.
+        """
+        return [str(t).replace('T', ' ') for t in self.times.astype('datetime64[s]')]
+
+    def records(self):
+        """
+        Yields entries in the original {"time": ..., "data": {zone: value}} layout.
+        """
+        zones = np.array(self.zones, dtype=object)
+        for col, time_str in enumerate(self.time_strings()):
+            present = self.mask[:, col]
+            yield {
+                "time": time_str,
+                "data": dict(zip(zones[present].tolist(), self.values[present, col].tolist())),
+            }
+
+
+def frame_from_records(records):
+    """
+    Builds an in-memory frame from entries in the carbon_intensity.json layout.
+
+    :param records: Iterable of {"time": "YYYY-MM-DD HH:MM:SS", "data": {zone: value}}
+    :return: IntensityFrame sorted by time
+    """
+    times = []
+    zone_rows = {}
+    cells_zone, cells_time, cells_value = [], [], []
+    for col, entry in enumerate(records):
+        times.append(entry["time"])
+        for zone, value in entry["data"].items():
+            row = zone_rows.setdefault(zone, len(zone_rows))
+            cells_zone.append(row)
+            cells_time.append(col)
+            cells_value.append(value)
+
+    return _frame_from_cells(times, list(zone_rows), cells_zone, cells_time, cells_value)
+
+
+def _frame_from_cells(times, zones, cells_zone, cells_time, cells_value):
+    times = np.array(times, dtype='datetime64[s]')
+    values = np.zeros((len(zones), len(times)), dtype=np.int32)
+    mask = np.zeros((len(zones), len(times)), dtype=bool)
+    cells_zone = np.asarray(cells_zone, dtype=np.intp)
+    cells_time = np.asarray(cells_time, dtype=np.intp)
+    values[cells_zone, cells_time] = np.rint(np.asarray(cells_value, dtype=np.float64)).astype(np.int32)
+    mask[cells_zone, cells_time] = True
+
+    # Sort zones alphabetically and samples chronologically
+    zone_order = np.argsort(np.array(zones, dtype=str), kind='stable')
+    time_order = np.argsort(times, kind='stable')
+    return IntensityFrame(
+        times[time_order],
+        [zones[i] for i in zone_order],
+        values[zone_order][:, time_order],
+        mask[zone_order][:, time_order],
+    )
+
+
+def merge_frames(base, extra):
+    """
+    Returns `base` followed by the samples of `extra` whose timestamps are not
+    already in `base`. Zones missing from either side are masked out.
+
+    :param base: IntensityFrame, e.g. the compacted store
+    :param extra: IntensityFrame, e.g. samples read from the append log
+    :return: New in-memory IntensityFrame sorted by time
+    """
+    new_cols = ~np.isin(extra.times, base.times)
+    zones = sorted(set(base.zones) | set(extra.zones))
+    zone_rows = {zone: i for i, zone in enumerate(zones)}
+    n_base = len(base.times)
+    times = np.concatenate([np.asarray(base.times), np.asarray(extra.times)[new_cols]])
+
+    values = np.zeros((len(zones), len(times)), dtype=np.int32)
+    mask = np.zeros((len(zones), len(times)), dtype=bool)
+    base_rows = [zone_rows[zone] for zone in base.zones]
+    extra_rows = [zone_rows[zone] for zone in extra.zones]
+    values[base_rows, :n_base] = base.values
+    mask[base_rows, :n_base] = base.mask
+    values[np.ix_(extra_rows, np.arange(n_base, len(times)))] = np.asarray(extra.values)[:, new_cols]
+    mask[np.ix_(extra_rows, np.arange(n_base, len(times)))] = np.asarray(extra.mask)[:, new_cols]
+
+    order = np.argsort(times, kind='stable')
+    return IntensityFrame(times[order], zones, values[:, order], mask[:, order])
+
+
+def _atomic_save(path, array):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _generation_file(name, generation):
+    if not generation:
+        return name
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{generation}{ext}"
+
+
+def _read_meta(store_path):
+    with open(os.path.join(store_path, ZONES_FILE), 'r') as f:
+        meta = json.load(f)
+    if meta.get("version") != STORE_VERSION:
+        raise ValueError(f"Unsupported store version {meta.get('version')} in {store_path}")
+    return meta
+
+
+def write_store(frame, store_path):
+    """
+    Writes a frame to a store directory as a new generation. The matrices are
+    written first and zones.json is replaced last, so readers and crashes see
+    either the previous store or the new one, never a mix.
+
+    :param frame: IntensityFrame to persist
+    :param store_path: Path of the store directory (created if missing)
+    """
+    os.makedirs(store_path, exist_ok=True)
+    zones_path = os.path.join(store_path, ZONES_FILE)
+    generation = _read_meta(store_path).get("generation", 0) + 1 if os.path.exists(zones_path) else 1
+    _atomic_save(os.path.join(store_path, _generation_file(TIMES_FILE, generation)),
+                 np.asarray(frame.times, dtype='datetime64[s]'))
+    _atomic_save(os.path.join(store_path, _generation_file(VALUES_FILE, generation)),
+                 np.ascontiguousarray(frame.values, dtype=np.int32))
+    _atomic_save(os.path.join(store_path, _generation_file(MASK_FILE, generation)),
+                 np.ascontiguousarray(frame.mask, dtype=bool))
+
+    with open(zones_path + '.tmp', 'w') as f:
+        json.dump({"version": STORE_VERSION, "generation": generation, "zones": frame.zones}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(zones_path + '.tmp', zones_path)
+
+    # Remove older generations and leftovers of interrupted writes; readers
+    # that still map them keep their pages until they close the files
+    current = {_generation_file(name, generation) for name in DATA_FILES}
+    stems = tuple(os.path.splitext(name)[0] + '.' for name in DATA_FILES)
+    for name in os.listdir(store_path):
+        if name.startswith(stems) and name not in current:
+            os.remove(os.path.join(store_path, name))
+
+
+def store_exists(store_path):
+    """
+    True if a store has been committed at `store_path`; an interrupted first
+    write leaves a directory without zones.json.
+    """
+    return os.path.exists(os.path.join(store_path, ZONES_FILE))
+
+
+def load_store(store_path, mmap=True):
+    """
+    Opens a store directory.
+
+    :param store_path: Path of the store directory
+    :param mmap: Memory-map the matrices instead of reading them into RAM
+    :return: IntensityFrame backed by the store files
+    """
+    mmap_mode = 'r' if mmap else None
+    for attempt in range(3):
+        meta = _read_meta(store_path)
+        generation = meta.get("generation", 0)
+        try:
+            times, values, mask = (np.load(os.path.join(store_path, _generation_file(name, generation)),
+                                           mmap_mode=mmap_mode)
+                                   for name in (TIMES_FILE, VALUES_FILE, MASK_FILE))
+            break
+        except FileNotFoundError:
+            # A concurrent write_store replaced this generation; read the new one
+            if attempt == 2:
+                raise
+    if values.shape != (len(meta["zones"]), len(times)) or mask.shape != values.shape:
+        raise ValueError(f"Inconsistent store shapes in {store_path}")
+
+    return IntensityFrame(times, meta["zones"], values, mask)
+
+
+def convert_json(json_path, store_path):
+    """
+    Converts a carbon_intensity.json file into a store directory.
+
+    :param json_path: Path to the JSON file
+    :param store_path: Path of the store directory to write
+    :return: The converted IntensityFrame
+    """
+    with open(json_path, 'r') as f:
+        frame = frame_from_records(json.load(f))
+    write_store(frame, store_path)
+    return frame
+
+
+def load_history(path, mmap=True):
+    """
+    Loads carbon intensity history from a store directory, an append log
+    (.jsonl, see intensity_log.py) or a carbon_intensity.json file, so scripts
+    can accept all of them.
+
+    :param path: Store directory, JSON Lines log or JSON file
+    :param mmap: Memory-map store matrices (ignored for JSON input)
+    :return: IntensityFrame
+    """
+    if os.path.isdir(path):
+        return load_store(path, mmap=mmap)
+    if path.endswith('.jsonl'):
+        from intensity_log import read_log
+        return frame_from_records(read_log(path))
+    with open(path, 'r') as f:
+        return frame_from_records(json.load(f))
+
+
+if __name__ == "__main__":
+    # Example usage: python intensity_store.py carbon_intensity.json carbon_intensity_store
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'carbon_intensity.json'
+    store_path = sys.argv[2] if len(sys.argv) > 2 else 'carbon_intensity_store'
+    frame = convert_json(json_path, store_path)
+    print(f"Wrote {frame} to {store_path}")
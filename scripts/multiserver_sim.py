@@ -0,0 +1,146 @@
+import heapq
+import os
+import sys
+
+import numpy as np
+
+from emissions_log import read_emissions
+from request_log import load_requests
+
+# Discrete-event simulation of c parallel GPU servers serving requests first
+# come, first served. Servers are kept in a min-heap keyed by the time they
+# become free; each arrival takes the earliest free server, so the simulation
+# costs O(n log c) for n requests. Service times are resampled from measured
+# generation durations (the 'duration' column of emissions.csv).
+
+REQUESTS_PER_RECORD = 30        # one request-log record = 30 individual requests
+SDXL_DURATION = 16.67656        # example SDXL generation time from emissions.py
+
+
+def load_service_times(csv_path='emissions.csv', model=None):
+    """
+    Reads measured generation durations in seconds.
+
+    :param csv_path: Path to the emissions table (.csv, .parquet or .arrow)
+    :param model: Only use rows of this model (optional)
+    """
+    df = read_emissions(csv_path, columns=['model', 'duration'])
+    if model is not None:
+        df = df[df['model'] == model]
+    durations = df['duration'].to_numpy(dtype=np.float64)
+    if not len(durations):
+        raise ValueError(f"No durations found in {csv_path}")
+    return durations
+
+
+def arrival_times(counts_per_second, spread=True):
+    """
+    Expands arrivals per second into sorted arrival timestamps.
+
+    :param counts_per_second: Integer array, arrivals in each second
+    :param spread: Spread the arrivals of a second evenly over it instead of
+                   having them all arrive at the start of the second
+    """
+    counts = np.asarray(counts_per_second, dtype=np.int64)
+    seconds = np.repeat(np.arange(len(counts), dtype=np.float64), counts)
+    if spread and len(seconds):
+        # Position of each arrival within its second: (k + 0.5) / count
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        k = np.arange(len(seconds)) - starts
+        seconds += (k + 0.5) / np.repeat(counts, counts)
+    return seconds
+
+
+def simulate(arrivals, service_times, servers):
+    """
+    Runs the multi-server FCFS queue.
+
+    :param arrivals: Sorted arrival times in seconds
+    :param service_times: Service time of each request, same length as `arrivals`
+    :param servers: Number of parallel servers
+    :return: Array of waiting times (start of service minus arrival)
+    """
+    free_at = [0.0] * servers
+    waits = np.empty(len(arrivals), dtype=np.float64)
+    heapreplace = heapq.heapreplace
+    for i, (arrival, service) in enumerate(zip(arrivals.tolist(), service_times.tolist())):
+        start = free_at[0] if free_at[0] > arrival else arrival
+        heapreplace(free_at, start + service)
+        waits[i] = start - arrival
+    return waits
+
+
+def summarize(arrivals, service_times, waits, servers):
+    """
+    :return: Dict with wait percentiles (seconds) and server utilization
+    """
+    if not len(arrivals):
+        return {"requests": 0, "servers": servers}
+    finish = (arrivals + waits + service_times).max()
+    span = finish - arrivals[0]
+    p50, p95, p99 = np.percentile(waits, [50, 95, 99])
+    return {
+        "requests": len(arrivals),
+        "servers": servers,
+        "mean_wait": float(waits.mean()),
+        "p50_wait": float(p50),
+        "p95_wait": float(p95),
+        "p99_wait": float(p99),
+        "max_wait": float(waits.max()),
+        "utilization": float(service_times.sum() / (servers * span)) if span > 0 else float('nan'),
+    }
+
+
+def run(counts_per_second, durations, servers, seed=0, spread=True):
+    """
+    Simulates one scenario with service times resampled from `durations`.
+    """
+    arrivals = arrival_times(counts_per_second, spread)
+    rng = np.random.default_rng(seed)
+    service_times = rng.choice(np.asarray(durations, dtype=np.float64), size=len(arrivals))
+    waits = simulate(arrivals, service_times, servers)
+    return summarize(arrivals, service_times, waits, servers)
+
+
+def servers_for_target(counts_per_second, durations, p99_target, seed=0, max_servers=1 << 16):
+    """
+    Smallest server count whose p99 wait is at most `p99_target` seconds,
+    found by doubling then bisection (p99 is non-increasing in servers).
+
+    :return: (servers, summary of that run)
+    """
+    lo, hi = 0, 1
+    summary = run(counts_per_second, durations, hi, seed)
+    while summary.get("p99_wait", 0.0) > p99_target:
+        if hi >= max_servers:
+            raise ValueError(f"p99 target {p99_target}s not reachable with {max_servers} servers")
+        lo, hi = hi, hi * 2
+        summary = run(counts_per_second, durations, hi, seed)
+    best = summary
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        summary = run(counts_per_second, durations, mid, seed)
+        if summary["p99_wait"] <= p99_target:
+            hi, best = mid, summary
+        else:
+            lo = mid
+    return hi, best
+
+
+if __name__ == "__main__":
+    # Example usage: python multiserver_sim.py requests_CAISO.txt emissions.csv 1.0
+    log_path = sys.argv[1] if len(sys.argv) > 1 else 'requests_CAISO.txt'
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else 'emissions.csv'
+    p99_target = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+
+    counts = load_requests(log_path).counts_by_second(per_record=REQUESTS_PER_RECORD)
+    if os.path.exists(csv_path):
+        durations = load_service_times(csv_path)
+    else:
+        print(f"{csv_path} not found, using the example SDXL duration of {SDXL_DURATION}s")
+        durations = np.array([SDXL_DURATION])
+
+    servers, summary = servers_for_target(counts, durations, p99_target)
+    print(f"{servers} servers hold p99 wait <= {p99_target}s for {summary['requests']} requests")
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
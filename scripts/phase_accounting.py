@@ -0,0 +1,113 @@
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+
+from energy_meter import EnergyMeter
+from generation_bench import StubPipeline, batches
+from power_sampler import FakeNvml
+from prompts import PROMPTS
+
+# Energy and time of a measurement run split into phases:
+#
+#   load       reading model weights
+#   transfer   moving them to the device
+#   warmup     first generations (kernel autotuning, cache warm-up)
+#   steady     the generations after that
+#
+# The one-off cost of the first three phases can then be amortized over a
+# realistic number of requests instead of being folded into one average.
+
+PHASES = ('load', 'transfer', 'warmup', 'steady')
+
+
+class PhaseRecorder:
+    """
+    Measures code blocks with an EnergyMeter and totals them per phase.
+
+    :param devices: Backend indices of the devices to attribute energy to (default: all)
+    """
+
+    def __init__(self, meter, devices=None):
+        self.meter = meter
+        self.devices = devices
+        self.totals = {phase: {"seconds": 0.0, "joules": 0.0, "runs": 0, "images": 0} for phase in PHASES}
+
+    @contextmanager
+    def phase(self, name, images=0):
+        """
+        Measures the block as part of phase `name`; yields the Measurement.
+
+        :param images: Images generated in the block
+        """
+        if name not in self.totals:
+            raise ValueError(f"Unknown phase '{name}', expected one of {PHASES}")
+        with self.meter.measure(self.devices) as measurement:
+            yield measurement
+        total = self.totals[name]
+        total["seconds"] += measurement.duration
+        total["joules"] += float(np.sum(measurement.energy_j))
+        total["runs"] += 1
+        total["images"] += images
+
+    def report(self):
+        """
+        :return: {phase: {seconds, joules, runs, images}} for phases that ran
+        """
+        return {phase: dict(total) for phase, total in self.totals.items() if total["runs"]}
+
+    def amortized(self, requests):
+        """
+        Energy per image when the one-off phases are shared by `requests`
+        images generated at the steady-state cost.
+
+        :return: (joules per image, share of the one-off phases)
+        """
+        steady = self.totals["steady"]
+        if not steady["images"]:
+            raise ValueError("No steady-state images measured")
+        one_off = sum(self.totals[phase]["joules"] for phase in ('load', 'transfer', 'warmup'))
+        # Warm-up images are requests too; only their excess over steady state is one-off
+        per_image = steady["joules"] / steady["images"]
+        one_off -= per_image * self.totals["warmup"]["images"]
+        total = one_off + per_image * requests
+        return total / requests, one_off / total
+
+    def print_report(self, requests=(1, 10, 100, 1000)):
+        for phase, total in self.report().items():
+            print(f"{phase:>8}: {total['seconds']:.3f} s, {total['joules']:.1f} J over {total['runs']} runs"
+                  + (f", {total['joules'] / total['images']:.1f} J/image" if total['images'] else ""))
+        if self.totals["steady"]["images"]:
+            for count in requests:
+                per_image, share = self.amortized(count)
+                print(f"{count:>8} requests: {per_image:.1f} J/image, {100 * share:.1f}% cold start")
+
+
+def run_phases(pipeline, meter, prompts=PROMPTS, warmup_runs=1, batch_size=1, steps=30, height=1024, width=1024,
+               devices=None):
+    """
+    Loads `pipeline`, moves it to the device and generates `prompts`, the
+    first `warmup_runs` batches as warm-up.
+
+    :param devices: Backend indices of the devices to attribute energy to (default: all)
+    :return: PhaseRecorder
+    """
+    phases = PhaseRecorder(meter, devices)
+    with phases.phase('load'):
+        pipeline.load()
+    with phases.phase('transfer'):
+        pipeline.to_device()
+    for run, group in enumerate(batches(list(prompts), batch_size)):
+        phase = 'warmup' if run < warmup_runs else 'steady'
+        with phases.phase(phase, images=len(group)):
+            pipeline.generate(group, steps, height, width)
+    return phases
+
+
+if __name__ == "__main__":
+    # Example usage: python phase_accounting.py (stub pipeline on a simulated GPU)
+    warmup_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    device = FakeNvml()
+    pipeline = StubPipeline(device, load_s=0.5, transfer_s=0.2, warmup_s=0.3, step_s=0.005)
+    phases = run_phases(pipeline, EnergyMeter(device), warmup_runs=warmup_runs)
+    phases.print_report()
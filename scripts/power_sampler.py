@@ -0,0 +1,325 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# GPU power sampling for the emission measurements. A background thread reads
+# the power of every device at a fixed rate (10-100 Hz) into a preallocated
+# ring buffer of monotonic timestamps, and the energy of a generation is the
+# trapezoidal integral of the samples over exactly its start and end time
+# (boundary values are interpolated). Devices are read through a small
+# backend interface, so FakeNvml can stand in for NVML on machines without a
+# GPU.
+
+DEFAULT_RATE_HZ = 50
+DEFAULT_WINDOW_S = 600      # seconds of history kept in the ring buffer
+
+
+class CounterUnsupported(Exception):
+    """
+    Raised when a device has no cumulative energy counter.
+    """
+
+
+class NvmlBackend:
+    """
+    Reads NVIDIA GPUs through pynvml.
+    """
+
+    def __init__(self):
+        import pynvml
+        self._nvml = pynvml
+        self._handles = []
+
+    def init(self):
+        self._nvml.nvmlInit()
+        self._handles = [self._nvml.nvmlDeviceGetHandleByIndex(i)
+                         for i in range(self._nvml.nvmlDeviceGetCount())]
+
+    def shutdown(self):
+        self._nvml.nvmlShutdown()
+        self._handles = []
+
+    def device_count(self):
+        return len(self._handles)
+
+    def device_name(self, index):
+        name = self._nvml.nvmlDeviceGetName(self._handles[index])
+        return name.decode() if isinstance(name, bytes) else name
+
+    def power_mw(self, index):
+        return self._nvml.nvmlDeviceGetPowerUsage(self._handles[index])
+
+    def device_uuid(self, index):
+        uuid = self._nvml.nvmlDeviceGetUUID(self._handles[index])
+        return uuid.decode() if isinstance(uuid, bytes) else uuid
+
+    def process_pids(self, index):
+        """
+        PIDs of the processes with a compute or graphics context on the device.
+        """
+        handle = self._handles[index]
+        processes = (self._nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+                     + self._nvml.nvmlDeviceGetGraphicsRunningProcesses(handle))
+        return {process.pid for process in processes}
+
+    def energy_mj(self, index):
+        """
+        Energy used since the driver was loaded, in millijoules (Volta and newer).
+        """
+        try:
+            return self._nvml.nvmlDeviceGetTotalEnergyConsumption(self._handles[index])
+        except (self._nvml.NVMLError_NotSupported, self._nvml.NVMLError_FunctionNotFound) as e:
+            raise CounterUnsupported(str(e)) from e
+
+
+class FakeNvml:
+    """
+    Simulated GPUs drawing `idle_w` watts, or `load_w` watts while busy (see
+    `busy`), plus an optional ripple of `ripple_w` watts at `ripple_hz`.
+    Their exact energy use is known in closed form (see `energy_j`).
+
+    :param energy_counter: Simulate NVML's cumulative energy counter
+    :param clock: Time source, must match the sampler's clock
+    """
+
+    def __init__(self, devices=1, idle_w=60.0, load_w=150.0, ripple_w=0.0, ripple_hz=1.0,
+                 name='Fake GPU', energy_counter=True, clock=time.perf_counter):
+        self.devices = devices
+        self.idle_w = idle_w
+        self.load_w = load_w
+        self.ripple_w = ripple_w
+        self.ripple_hz = ripple_hz
+        self.name = name
+        self.energy_counter = energy_counter
+        self.clock = clock
+        self._loaded_at = clock()
+        # Busy intervals per device as [start, end]; end is None while busy
+        self._busy = [[] for _ in range(devices)]
+        # PIDs that have used each device (a CUDA context outlives its work)
+        self._pids = [set() for _ in range(devices)]
+
+    def init(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def device_count(self):
+        return self.devices
+
+    def device_name(self, index):
+        return f"{self.name} {index}"
+
+    def device_uuid(self, index):
+        return f"GPU-00000000-0000-0000-0000-{index:012d}"
+
+    def process_pids(self, index):
+        return set(self._pids[index])
+
+    def power_w(self, index, t=None):
+        t = self.clock() if t is None else t
+        busy = any(start <= t and (end is None or t < end) for start, end in self._busy[index])
+        watts = self.load_w if busy else self.idle_w
+        if self.ripple_w:
+            watts += self.ripple_w * np.sin(2 * np.pi * self.ripple_hz * t)
+        return watts
+
+    def power_mw(self, index):
+        return int(round(self.power_w(index) * 1000))
+
+    def energy_mj(self, index):
+        if not self.energy_counter:
+            raise CounterUnsupported(f"{self.device_name(index)} has no energy counter")
+        return int(self.energy_j(index, self._loaded_at, self.clock()) * 1000)
+
+    def energy_j(self, index, start, end):
+        """
+        Exact energy drawn by device `index` over [start, end] in joules.
+        """
+        busy_s = sum(max(0.0, min(end, stop if stop is not None else end) - max(start, begin))
+                     for begin, stop in self._busy[index])
+        energy = self.idle_w * (end - start) + (self.load_w - self.idle_w) * busy_s
+        if self.ripple_w:
+            w = 2 * np.pi * self.ripple_hz
+            energy += self.ripple_w * (np.cos(w * start) - np.cos(w * end)) / w
+        return energy
+
+    @contextmanager
+    def busy(self, index=0, pid=None):
+        """
+        Runs the block with device `index` at load power, on behalf of
+        process `pid` (default: this process).
+        """
+        self._pids[index].add(os.getpid() if pid is None else pid)
+        interval = [self.clock(), None]
+        self._busy[index].append(interval)
+        try:
+            yield
+        finally:
+            interval[1] = self.clock()
+
+
+def trapezoid_energy(times, watts, start, end):
+    """
+    Integrates power samples over [start, end] with the trapezoidal rule,
+    interpolating the power at both ends of the window.
+
+    :param times: Sorted sample timestamps (n,)
+    :param watts: Power samples (n,) or (n, devices)
+    :return: Energy in joules, a float or one value per device
+    """
+    times = np.asarray(times, dtype=np.float64)
+    watts = np.asarray(watts, dtype=np.float64)
+    if end <= start or not len(times):
+        return np.zeros(watts.shape[1:]) if watts.ndim > 1 else 0.0
+    flat = watts.reshape(len(times), -1)
+    inside = (times > start) & (times < end)
+    grid = np.concatenate([[start], times[inside], [end]])
+    edges = np.array([[np.interp(t, times, flat[:, d]) for d in range(flat.shape[1])] for t in (start, end)])
+    values = np.concatenate([edges[:1], flat[inside], edges[1:]])
+    energy = ((values[1:] + values[:-1]) * 0.5 * np.diff(grid)[:, None]).sum(axis=0)
+    return energy if watts.ndim > 1 else float(energy[0])
+
+
+class PowerSampler:
+    """
+    Samples the power of all devices of a backend in a background thread.
+
+    :param backend: Device backend (default: NvmlBackend)
+    :param rate_hz: Samples per second
+    :param window_s: Seconds of samples kept; older samples are overwritten
+    :param clock: Monotonic time source used for the timestamps
+    """
+
+    def __init__(self, backend=None, rate_hz=DEFAULT_RATE_HZ, window_s=DEFAULT_WINDOW_S, clock=time.perf_counter):
+        self.backend = backend if backend is not None else NvmlBackend()
+        self.rate_hz = rate_hz
+        self.clock = clock
+        self.backend.init()
+        self.devices = self.backend.device_count()
+        capacity = int(np.ceil(rate_hz * window_s)) + 1
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._watts = np.zeros((capacity, self.devices), dtype=np.float64)
+        self._written = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def now(self):
+        return self.clock()
+
+    def device_names(self):
+        return [self.backend.device_name(i) for i in range(self.devices)]
+
+    def sample(self):
+        """
+        Reads every device once and stores the sample. Safe to call from
+        several threads; samples stay in time order.
+        """
+        with self._lock:
+            t = self.clock()
+            row = [self.backend.power_mw(i) / 1000.0 for i in range(self.devices)]
+            slot = self._written % len(self._times)
+            self._times[slot] = t
+            self._watts[slot] = row
+            self._written += 1
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        next_at = self.clock()
+        while not self._stop.is_set():
+            self.sample()
+            # Sleep to the next tick of a fixed grid so the rate does not drift
+            next_at += period
+            delay = next_at - self.clock()
+            if delay < 0:
+                next_at = self.clock()
+                continue
+            self._stop.wait(delay)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        # Closing sample, so a window ending now is covered
+        self.sample()
+
+    def close(self):
+        self.stop()
+        self.backend.shutdown()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def samples(self, start=None, end=None):
+        """
+        Returns the buffered samples in time order, optionally only those in
+        [start, end].
+
+        :return: (timestamps (n,), watts (n, devices))
+        """
+        with self._lock:
+            capacity = len(self._times)
+            if self._written <= capacity:
+                order = np.arange(self._written)
+            else:
+                order = (np.arange(capacity) + self._written) % capacity
+            times = self._times[order]
+            watts = self._watts[order]
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times <= end
+        return times[keep], watts[keep]
+
+    def energy(self, start, end):
+        """
+        Energy per device in joules over [start, end].
+        """
+        times, watts = self.samples()
+        if not len(times):
+            raise ValueError("No power samples recorded")
+        if start < times[0] - 1.0 / self.rate_hz:
+            raise ValueError("Window starts before the oldest buffered sample; increase window_s")
+        return trapezoid_energy(times, watts, start, end)
+
+    def mean_power(self, start, end):
+        """
+        Mean power per device in watts over [start, end].
+        """
+        return self.energy(start, end) / (end - start)
+
+
+if __name__ == "__main__":
+    # Example usage: python power_sampler.py (runs on the simulated device)
+    fake = FakeNvml(idle_w=60.0, load_w=150.0, ripple_w=5.0, ripple_hz=0.7)
+    for rate in (1, 10, 50, 100):
+        sampler = PowerSampler(fake, rate_hz=rate)
+        with sampler:
+            time.sleep(0.5)
+            with fake.busy():
+                start = sampler.now()
+                time.sleep(2.0)
+                end = sampler.now()
+            time.sleep(0.2)
+        energy = sampler.energy(start, end)[0]
+        exact = fake.energy_j(0, start, end)
+        print(f"{rate:>3} Hz: {len(sampler.samples()[0])} samples, {energy:.3f} J, "
+              f"exact {exact:.3f} J, error {100 * (energy - exact) / exact:+.3f}%")
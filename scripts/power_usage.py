@@ -1,5 +1,4 @@
 from diffusers import DiffusionPipeline
-import threading
 import torch
 pipe = DiffusionPipeline.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", torch_dtype=torch.float16, use_safetensors=True, variant="fp16")
 pipe.to("cuda")
@@ -9,49 +8,20 @@ pipe.to("cuda")
 
 prompt = "An astronaut riding a green horse"
 
-import time
-import pynvml
+from energy_meter import EnergyMeter
 
-pynvml.nvmlInit()
-
-def get_gpu_power_usage(interval=1, duration=60):
-    """
-    Logs the power usage of NVIDIA GPUs every `interval` seconds for a `duration` period.
-    
-    Args:
-    interval (int): Measurement interval in seconds.
-    duration (int): Total duration to record power usage in seconds.
-    """
-    # Get number of GPUs
-    device_count = pynvml.nvmlDeviceGetCount()
-    
-    try:
-        for i in range(device_count):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            print(f"Monitoring GPU {i}: {pynvml.nvmlDeviceGetName(handle)}")
-
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            for i in range(device_count):
-                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                try:
-                    power_usage = pynvml.nvmlDeviceGetPowerUsage(handle) / 1000.0  # Convert milliwatts to watts
-                    print(f"GPU {i} Power Usage: {power_usage} Watts")
-                except pynvml.NVMLError as e:
-                    print(f"Failed to get power usage for GPU {i}: {str(e)}")
-            time.sleep(interval)
-    finally:
-        # Shutdown NVML
-        pynvml.nvmlShutdown()
+# Energy counter where the GPU has one, 50 Hz power sampling otherwise
+meter = EnergyMeter(mode='auto', rate_hz=50)
+for i, name in enumerate(meter.device_names()):
+    print(f"Monitoring GPU {i}: {name} ({meter.mode})")
 
 def generate():
-    start = time.time()
-    images = pipe(prompt=prompt).images[0]
-    end = time.time()
-    print(end-start)
+    with meter.measure() as measurement:
+        images = pipe(prompt=prompt).images[0]
+    print(measurement.duration)
+    for i, energy in enumerate(measurement.energy_j):
+        print(f"GPU {i}: {energy:.1f} J, {energy / measurement.duration:.1f} Watts average")
     images.save("image.png")
 
-thread_one = threading.Thread(target=get_gpu_power_usage)
-thread_two = threading.Thread(target=generate)
-thread_one.start()
-thread_two.start()
\ No newline at end of file
+generate()
+meter.close()
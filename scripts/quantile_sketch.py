@@ -0,0 +1,298 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from intensity_store import frame_from_records
+
+# Mergeable per-zone quantile sketches, so medians and percentiles of long
+# histories can be answered without keeping every sample.
+#
+# Values are counted in logarithmic buckets: bucket i > 0 holds the values in
+# (gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), and bucket 0 holds
+# values below MIN_VALUE (zero-carbon hours). Reporting the bucket midpoint
+# 2 gamma^i / (gamma + 1) gives every quantile within a relative error of `a`,
+# independent of the number of samples. All zones share the bucket layout, so
+# a sketch is one zones × buckets count matrix: updates are one bincount per
+# batch, merging two sketches (time windows, collectors) is an addition, and
+# memory per zone is fixed by the value range and `a`.
+#
+# A SketchStore keeps one sketch per calendar month in its directory:
+#
+#   zones.json   {"version": 1, "relative_accuracy": a, "zones": [...],
+#                 "start": earliest sample added, "seeded": history added}
+#   YYYY-MM.npy  int64 counts, one row per zone of zones.json at write time
+#
+# so windows of whole months are merged on query, and an hourly update only
+# rewrites the current month. Samples must be counted once, so history is
+# added with seed(), which only takes the samples older than "start": a store
+# that data.py started with its first collected hour can be seeded with the
+# history collected before it, and seeding again adds nothing twice.
+
+SKETCH_VERSION = 1
+SKETCH_DIR = 'quantile_sketches'
+ZONES_FILE = 'zones.json'
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1.0
+MAX_VALUE = 1e5
+
+
+class BucketLayout:
+    """
+    Logarithmic buckets with relative accuracy `relative_accuracy` over
+    [MIN_VALUE, MAX_VALUE]; larger values fall into the last bucket.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.n_buckets = int(np.ceil(np.log(MAX_VALUE / MIN_VALUE) / self._log_gamma)) + 2
+
+    def index(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            buckets = np.ceil(np.log(np.maximum(values, MIN_VALUE) / MIN_VALUE) / self._log_gamma) + 1
+        return np.where(values < MIN_VALUE, 0, np.minimum(buckets, self.n_buckets - 1)).astype(np.intp)
+
+    def value(self, buckets):
+        buckets = np.asarray(buckets)
+        upper = MIN_VALUE * self.gamma ** (buckets - 1)
+        return np.where(buckets == 0, 0.0, 2 * upper / (self.gamma + 1))
+
+
+class QuantileSketch:
+    """
+    Quantile sketches for a set of zones.
+
+    :param zones: Zone codes, one per row of `counts`
+    :param counts: int64 matrix (zones, layout.n_buckets); zeros if omitted
+    """
+
+    def __init__(self, zones=(), counts=None, layout=None):
+        self.layout = layout if layout is not None else BucketLayout()
+        self.zones = list(zones)
+        self.counts = counts if counts is not None else np.zeros((len(self.zones), self.layout.n_buckets),
+                                                                 dtype=np.int64)
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+
+    def __repr__(self):
+        return f"QuantileSketch({len(self.zones)} zones, {int(self.counts.sum())} samples)"
+
+    def zone_index(self, zone):
+        return self._zone_index.get(zone)
+
+    def _rows(self, zones):
+        """
+        Rows of `zones`, appending the zones not seen yet.
+        """
+        new_zones = [zone for zone in dict.fromkeys(zones) if zone not in self._zone_index]
+        if new_zones:
+            for zone in new_zones:
+                self._zone_index[zone] = len(self.zones)
+                self.zones.append(zone)
+            self.counts = np.pad(self.counts, ((0, len(new_zones)), (0, 0)))
+        return np.array([self._zone_index[zone] for zone in zones], dtype=np.intp)
+
+    def update(self, zones, values, mask=None):
+        """
+        Adds a zone × time matrix of samples.
+
+        :param zones: Zone codes, one per row of `values`
+        :param values: Matrix (zones, times)
+        :param mask: Boolean matrix of the same shape, True where a value exists
+        """
+        values = np.asarray(values)
+        mask = np.ones(values.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        rows = self._rows(zones)
+        n_buckets = self.layout.n_buckets
+        cells = (rows[:, None] * n_buckets + self.layout.index(values))[mask]
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def update_frame(self, frame):
+        self.update(frame.zones, frame.values, frame.mask)
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch with the same layout in place.
+        """
+        if other.layout.n_buckets != self.layout.n_buckets or other.layout.gamma != self.layout.gamma:
+            raise ValueError("Cannot merge sketches with different bucket layouts")
+        rows = self._rows(other.zones)
+        np.add.at(self.counts, rows, other.counts)
+        return self
+
+    def count(self):
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, qs):
+        """
+        :param qs: Quantiles in [0, 1]
+        :return: Matrix (len(qs), zones), NaN for zones without samples
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1]
+        # Lower nearest rank, like np.percentile(..., method='lower')
+        ranks = np.floor(qs[:, None] * np.maximum(total - 1, 0)[None, :])
+        buckets = (cumulative[None, :, :] <= ranks[:, :, None]).sum(axis=2)
+        return np.where(total > 0, self.layout.value(np.minimum(buckets, self.layout.n_buckets - 1)), np.nan)
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def quantile_dict(self, q):
+        """
+        {zone: quantile} for the zones with samples.
+        """
+        values = self.quantile(q)
+        return {zone: float(values[row]) for row, zone in enumerate(self.zones) if not np.isnan(values[row])}
+
+
+class SketchStore:
+    """
+    Monthly quantile sketches persisted in a directory.
+
+    :param path: Directory of the store (created on save)
+    """
+
+    def __init__(self, path=SKETCH_DIR, relative_accuracy=RELATIVE_ACCURACY):
+        self.path = path
+        self.layout = BucketLayout(relative_accuracy)
+        self.zones = []
+        self.months = {}    # 'YYYY-MM' -> counts (rows in self.zones order, maybe fewer)
+        self.start = None   # datetime64[s] of the earliest sample added
+        self.seeded = False
+        self._dirty = set()
+        zones_path = os.path.join(path, ZONES_FILE)
+        if os.path.exists(zones_path):
+            with open(zones_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("version") != SKETCH_VERSION:
+                raise ValueError(f"Unsupported sketch version {meta.get('version')} in {path}")
+            self.layout = BucketLayout(meta["relative_accuracy"])
+            self.zones = meta["zones"]
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.npy'):
+                    # Rows of zones whose entry in zones.json was never
+                    # committed (stores written before save() wrote it first)
+                    # cannot be attributed and are dropped
+                    counts = np.load(os.path.join(path, name), mmap_mode='r')
+                    self.months[name[:-4]] = counts[:len(self.zones)]
+            if meta.get("start") is not None:
+                self.start = np.datetime64(meta["start"], 's')
+            elif self.months:
+                # Written before "start" was recorded: only whole months are known
+                self.start = np.datetime64(min(self.months), 's')
+            self.seeded = meta.get("seeded", False)
+
+    def _sketch(self, counts):
+        padded = np.zeros((len(self.zones), self.layout.n_buckets), dtype=np.int64)
+        padded[:len(counts)] = counts
+        return QuantileSketch(self.zones, padded, self.layout)
+
+    def add_frame(self, frame):
+        """
+        Adds every sample of an IntensityFrame to the sketch of its month.
+        Samples must be added exactly once; the order does not matter.
+        """
+        times = np.asarray(frame.times, dtype='datetime64[s]')
+        if len(times) and (self.start is None or times.min() < self.start):
+            self.start = times.min()
+        months = times.astype('datetime64[M]')
+        for month in np.unique(months):
+            columns = months == month
+            key = str(month)
+            sketch = self._sketch(self.months.get(key, np.zeros((0, self.layout.n_buckets), dtype=np.int64)))
+            sketch.update(frame.zones, np.asarray(frame.values)[:, columns], np.asarray(frame.mask)[:, columns])
+            self.zones = sketch.zones
+            self.months[key] = sketch.counts
+            self._dirty.add(key)
+
+    def seed(self, frames):
+        """
+        Adds the samples of history frames older than every sample added so
+        far (all of them if the store is empty); later samples are taken to
+        be in the store already.
+
+        :param frames: Iterable of IntensityFrames, each sorted by time
+        :return: Number of timestamps added
+        """
+        cutoff = self.start
+        added = 0
+        for frame in frames:
+            times = np.asarray(frame.times, dtype='datetime64[s]')
+            end = len(times) if cutoff is None else int(np.searchsorted(times, cutoff))
+            if end:
+                self.add_frame(frame.slice(0, end))
+                added += end
+        self.seeded = True
+        return added
+
+    def add_entries(self, entries):
+        """
+        Adds entries in the {"time", "data"} layout, e.g. one collected hour.
+        """
+        self.add_frame(frame_from_records(entries))
+
+    def window(self, start=None, end=None):
+        """
+        Merged sketch of the months from `start` to `end` ('YYYY-MM', inclusive;
+        default: all).
+        """
+        total = self._sketch(np.zeros((0, self.layout.n_buckets), dtype=np.int64))
+        for key, counts in self.months.items():
+            if (start is None or key >= start) and (end is None or key <= end):
+                total.counts[:len(counts)] += counts
+        return total
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Zones only ever grow, so writing them first keeps every month file,
+        # old or new, a prefix of the zone list even if a write is interrupted
+        zones_path = os.path.join(self.path, ZONES_FILE)
+        with open(zones_path + '.tmp', 'w') as f:
+            json.dump({"version": SKETCH_VERSION, "relative_accuracy": self.layout.relative_accuracy,
+                       "zones": self.zones, "start": None if self.start is None else str(self.start),
+                       "seeded": self.seeded}, f)
+        os.replace(zones_path + '.tmp', zones_path)
+        for key in sorted(self._dirty):
+            path = os.path.join(self.path, key + '.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, np.asarray(self.months[key], dtype=np.int64))
+            os.replace(path + '.tmp', path)
+        self._dirty.clear()
+
+
+def build_store(history_path, path=SKETCH_DIR, relative_accuracy=RELATIVE_ACCURACY, batch_size=1024):
+    """
+    Builds a sketch store from a history file, streaming JSON input in
+    batches. An existing store is seeded with the part of the history older
+    than its first sample instead (see SketchStore.seed).
+    """
+    from stream_json import iter_frames, iter_records
+    store = SketchStore(path, relative_accuracy)
+    if os.path.isdir(history_path) or history_path.endswith('.jsonl'):
+        from intensity_store import load_history
+        store.seed([load_history(history_path)])
+    else:
+        store.seed(iter_frames(iter_records(history_path), batch_size))
+    store.save()
+    return store
+
+
+if __name__ == "__main__":
+    # Example usage: python quantile_sketch.py build carbon_intensity.json
+    #                python quantile_sketch.py query 0.5 2024-07 2024-08
+    command = sys.argv[1] if len(sys.argv) > 1 else 'query'
+    if command == 'build':
+        store = build_store(sys.argv[2] if len(sys.argv) > 2 else 'carbon_intensity.json')
+        print(f"Sketches of {len(store.zones)} zones over {len(store.months)} months in {store.path}")
+    else:
+        q = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+        start = sys.argv[3] if len(sys.argv) > 3 else None
+        end = sys.argv[4] if len(sys.argv) > 4 else start
+        sketch = SketchStore().window(start, end)
+        for zone, value in sorted(sketch.quantile_dict(q).items(), key=lambda item: item[1]):
+            print(f"{zone}: {value:.1f}")
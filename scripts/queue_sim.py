@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Vectorized version of the fluid queue in "queuing delay.py":
+#
+#   each second t:  wait_sum += q;  q += a[t];  q -= min(q, rate)
+#
+# The queue after second t is a Lindley recursion Q[t] = max(Q[t-1] + a[t] - rate, 0)
+# with the closed form Q[t] = P[t] - min(0, min(P[0..t])), where P is the
+# cumulative sum of (a - rate). That turns the per-second loop into a cumsum
+# and a running minimum, evaluated for a whole block of rates at once. All
+# arithmetic is in int64, so wait sums and served counts equal the loop's
+# exactly and the final division gives bit-identical means.
+
+CHUNK_SECONDS = 8192
+CHUNK_RATES = 256
+
+
+def wait_totals(arrivals, rates, chunk_seconds=CHUNK_SECONDS):
+    """
+    Returns the loop's integer totals for every rate.
+
+    :param arrivals: Arrivals per second (int)
+    :param rates: Service rates (requests per second)
+    :return: (wait_sum, served), int64 arrays shaped like `rates`
+    """
+    arrivals = np.asarray(arrivals, dtype=np.int64)
+    rates = np.asarray(rates, dtype=np.int64)
+    n = len(arrivals)
+
+    p_end = np.zeros(len(rates), dtype=np.int64)    # P at the end of the previous chunk
+    p_min = np.zeros(len(rates), dtype=np.int64)    # min(0, P[0..t]) so far
+    queue = np.zeros(len(rates), dtype=np.int64)    # Q at the end of the previous chunk
+    wait_sum = np.zeros(len(rates), dtype=np.int64)
+
+    for start in range(0, n, chunk_seconds):
+        block = arrivals[start:start + chunk_seconds]
+        steps = np.arange(1, len(block) + 1, dtype=np.int64)
+        p = p_end[:, None] + np.cumsum(block)[None, :] - rates[:, None] * steps[None, :]
+        running_min = np.minimum(np.minimum.accumulate(p, axis=1), p_min[:, None])
+        q = p - running_min
+
+        # wait_sum adds the queue *before* each second's arrivals: Q[t-1]
+        wait_sum += queue + q[:, :-1].sum(axis=1)
+        p_end = p[:, -1]
+        p_min = running_min[:, -1]
+        queue = q[:, -1]
+
+    served = arrivals.sum() - queue
+    return wait_sum, served
+
+
+def avg_wait_grid(arrivals, rates, chunk_rates=CHUNK_RATES, chunk_seconds=CHUNK_SECONDS):
+    """
+    Mean wait for every rate; matches avg_wait(arrivals, rate) exactly.
+
+    :param arrivals: Arrivals per second (int)
+    :param rates: Service rates (requests per second)
+    :return: float64 array of mean waits in seconds, NaN where nothing was served
+    """
+    rates = np.asarray(rates, dtype=np.int64)
+    result = np.empty(len(rates), dtype=np.float64)
+    for start in range(0, len(rates), chunk_rates):
+        block = slice(start, start + chunk_rates)
+        wait_sum, served = wait_totals(arrivals, rates[block], chunk_seconds)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[block] = np.where(served > 0, wait_sum / np.maximum(served, 1), np.nan)
+    return result
+
+
+def sweep_zones(arrivals_by_zone, rates, processes=None):
+    """
+    Runs avg_wait_grid for many zones in a process pool.
+
+    :param arrivals_by_zone: {zone: arrivals per second}
+    :param rates: Service rates shared by all zones
+    :param processes: Worker processes (defaults to the CPU count)
+    :return: {zone: array of mean waits, one per rate}
+    """
+    zones = list(arrivals_by_zone)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(avg_wait_grid, [arrivals_by_zone[zone] for zone in zones],
+                               [rates] * len(zones))
+        return dict(zip(zones, results))
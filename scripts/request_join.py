@@ -0,0 +1,150 @@
+import json
+import sys
+
+import numpy as np
+
+from intensity_query import calendar_keys
+from request_log import BLOCK_SIZE, INTENSITY_INT, format_rows, iter_request_blocks, report_skipped
+
+# Attaches the hourly carbon intensity of a zone to every request of a log.
+# The intensity source is a zone × 24 hourly profile, built either from the
+# samples of a chosen date or from hourly_average.json. Each request is mapped
+# to a profile row (via its region, or the zone already on the row) and its
+# hour of day, and the intensities are fetched with one fancy-indexing gather
+# per block of the log as it is parsed; each block is written out before the
+# next one is read, so the join runs in memory bounded by the block size.
+
+
+class HourlyProfile:
+    """
+    Carbon intensity per zone and hour of day.
+
+    :param zones: Zone codes, one per row of `values`
+    :param values: float64 matrix (zones, 24), NaN where no value is known
+    """
+
+    def __init__(self, zones, values):
+        self.zones = list(zones)
+        self.values = values
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+
+    def zone_index(self, zone):
+        return self._zone_index.get(zone, -1)
+
+
+def profile_from_frame(frame, how='last'):
+    """
+    Builds a profile from the samples of a frame, e.g. one date selected with
+    IntensityQuery.
+
+    :param frame: IntensityFrame
+    :param how: 'last' keeps the latest sample of each hour, 'mean' averages them
+    """
+    hours = calendar_keys(frame.times)[0]
+    values = np.full((len(frame.zones), 24), np.nan)
+    if how == 'last':
+        for col, hour in enumerate(hours.tolist()):
+            present = frame.mask[:, col]
+            values[present, hour] = frame.values[present, col]
+    elif how == 'mean':
+        from hourly_aggregate import group_sums
+        sums, counts = group_sums(frame.values, frame.mask, hours, 24)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).T
+    else:
+        raise ValueError(f"Unknown aggregation '{how}'")
+    return HourlyProfile(frame.zones, values)
+
+
+def profile_from_averages(path='hourly_average.json'):
+    """
+    Builds a profile from an hourly_average.json file ({"HH": {zone: value}}).
+    """
+    with open(path, 'r') as f:
+        averages = json.load(f)
+    zones = sorted({zone for by_zone in averages.values() for zone in by_zone})
+    zone_rows = {zone: i for i, zone in enumerate(zones)}
+    values = np.full((len(zones), 24), np.nan)
+    for hour, by_zone in averages.items():
+        rows = [zone_rows[zone] for zone in by_zone]
+        values[rows, int(hour)] = list(by_zone.values())
+    return HourlyProfile(zones, values)
+
+
+def annotate(rows, log, profile, region_to_zone=None, use_row_zone=True):
+    """
+    Looks up the hourly intensity of every row.
+
+    :param rows: Structured array of request_log.REQUEST_DTYPE
+    :param log: RequestLog whose code tables the rows use
+    :param profile: HourlyProfile
+    :param region_to_zone: {region name: zone} overriding the zone of those regions
+    :param use_row_zone: Use the zone already on the row for unmapped regions
+    :return: (intensity, profile row, found) arrays, one entry per row
+    """
+    region_to_zone = region_to_zone or {}
+    region_rows = np.array([profile.zone_index(region_to_zone[region]) if region in region_to_zone else -1
+                            for region in log.regions] or [-1], dtype=np.int64)
+    zone_rows = np.array([profile.zone_index(zone) if use_row_zone else -1
+                          for zone in log.zones] or [-1], dtype=np.int64)
+
+    target = region_rows[rows['region']]
+    target = np.where(target >= 0, target, zone_rows[rows['zone']])
+    second = rows['second']
+    hours = np.clip(second // 3600, 0, 23)
+    valid = (target >= 0) & (second >= 0) & (second < 86_400)
+
+    intensity = np.full(len(rows), np.nan)
+    if len(profile.zones):
+        intensity[valid] = profile.values[target[valid], hours[valid]]
+    found = valid & ~np.isnan(intensity)
+    return intensity, target, found
+
+
+def join_requests(requests_path, profile, output_path, region_to_zone=None, use_row_zone=True,
+                  block_size=BLOCK_SIZE):
+    """
+    Writes the request log with each row's [intensity, zone] replaced by the
+    profile's value for its zone and hour. Rows without a known value are
+    written unchanged; malformed lines are left out and counted. Intensities are rounded to ints, like the collected
+    samples the original lines carry.
+
+    :param requests_path: Path to the request log
+    :param profile: HourlyProfile
+    :param output_path: Path of the annotated log
+    :param region_to_zone: {region name: zone} overriding the zone of those regions
+    :param use_row_zone: Use the zone already on the row for unmapped regions
+    :param block_size: Bytes of the log parsed and written at a time
+    :return: Number of annotated rows
+    """
+    annotated = 0
+    skipped = 0
+    with open(output_path, 'w') as wf:
+        for log in iter_request_blocks(requests_path, block_size):
+            skipped += log.skipped
+            rows = log.rows
+            if not len(rows):
+                continue
+            # Output zone table of the block: its zones, then any profile zones it lacks
+            log_zones = set(log.zones)
+            out_zones = log.zones + [zone for zone in profile.zones if zone not in log_zones]
+            out_zone_index = {zone: i for i, zone in enumerate(out_zones)}
+            profile_to_out = np.array([out_zone_index[zone] for zone in profile.zones] or [0], dtype=np.uint16)
+
+            intensity, target, found = annotate(rows, log, profile, region_to_zone, use_row_zone)
+            rows['intensity'][found] = np.rint(intensity[found])
+            rows['intensity_kind'][found] = INTENSITY_INT
+            rows['zone'][found] = profile_to_out[target[found]]
+            annotated += int(found.sum())
+            wf.write('\n'.join(format_rows(log, rows, out_zones)) + '\n')
+    report_skipped(requests_path, skipped)
+    return annotated
+
+
+if __name__ == "__main__":
+    # Example usage: python request_join.py requests_CAISO.txt hourly_average.json requests_annotated.txt
+    requests_path = sys.argv[1] if len(sys.argv) > 1 else 'requests_CAISO.txt'
+    averages_path = sys.argv[2] if len(sys.argv) > 2 else 'hourly_average.json'
+    output_path = sys.argv[3] if len(sys.argv) > 3 else 'requests_annotated.txt'
+    count = join_requests(requests_path, profile_from_averages(averages_path), output_path)
+    print(f"Annotated {count} requests into {output_path}")
@@ -0,0 +1,332 @@
+import json
+import os
+import re
+import sys
+from ast import literal_eval
+
+import numpy as np
+
+# Parser for request logs such as requests_CAISO.txt, one Python-literal list
+# per line:
+#
+#   ['placeholder', 'California', 67172, 'default prompt', [221, 'US-CAL-CISO']]
+#
+# Lines are matched in large blocks with one compiled regex and converted to
+# a NumPy structured array. The string fields become codes into tables of
+# their distinct values and the intensity is kept as float64 plus its literal
+# kind (int, float or None), so format_rows() reproduces every line as
+# str(ast.literal_eval(line)) would. A block with lines the regex cannot
+# match falls back to ast.literal_eval for those lines; lines that are not
+# requests are skipped and counted in RequestLog.skipped. The result is cached
+# next to the log as a .npy sidecar plus a JSON file with the code tables,
+# keyed by the log's mtime and size; later runs memory-map the sidecar
+# instead of re-parsing the text.
+
+REQUEST_DTYPE = np.dtype([
+    ('placeholder', np.uint16),
+    ('region', np.uint16),
+    ('second', np.int64),
+    ('prompt', np.uint32),
+    ('intensity', np.float64),
+    ('intensity_kind', np.uint8),
+    ('zone', np.uint16),
+])
+SIDECAR_VERSION = 3
+BLOCK_SIZE = 16 << 20
+
+# Values of the 'intensity_kind' field
+INTENSITY_INT = 0
+INTENSITY_FLOAT = 1
+INTENSITY_NONE = 2
+
+# Code tables of the string fields, in the order they are stored in the sidecar
+STRING_FIELDS = ('placeholder', 'region', 'prompt', 'zone')
+
+_STRING = r"""('(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")"""
+LINE_RE = re.compile(
+    rf"""^[ \t]*\[[ \t]*{_STRING}[ \t]*,                  # group 1: placeholder
+        [ \t]*{_STRING}[ \t]*,                            # group 2: region
+        [ \t]*(-?\d{1,18})[ \t]*,                         # group 3: second of day (fits int64)
+        [ \t]*{_STRING}[ \t]*,                            # group 4: prompt
+        [ \t]*\[[ \t]*(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|None)[ \t]*,   # group 5: carbon intensity
+        [ \t]*{_STRING}[ \t]*\][ \t]*\][ \t]*\r?$          # group 6: zone
+    """,
+    re.VERBOSE | re.MULTILINE,
+)
+
+
+class RequestLog:
+    """
+    Parsed request log.
+
+    :param rows: Structured array of REQUEST_DTYPE
+    :param regions: Region names, indexed by the 'region' code
+    :param zones: Zone codes, indexed by the 'zone' code
+    :param placeholders: First fields, indexed by the 'placeholder' code
+    :param prompts: Prompts, indexed by the 'prompt' code
+    :param skipped: Number of malformed lines left out of `rows`
+    """
+
+    def __init__(self, rows, regions, zones, placeholders=(), prompts=(), skipped=0):
+        self.rows = rows
+        self.regions = list(regions)
+        self.zones = list(zones)
+        self.placeholders = list(placeholders)
+        self.prompts = list(prompts)
+        self.skipped = skipped
+
+    def __len__(self):
+        return len(self.rows)
+
+    def region_code(self, region):
+        """
+        Returns the code of `region`, or None if it does not occur in the log.
+        """
+        return self.regions.index(region) if region in self.regions else None
+
+    def zone_code(self, zone):
+        """
+        Returns the code of `zone`, or None if it does not occur in the log.
+        """
+        return self.zones.index(zone) if zone in self.zones else None
+
+    def counts_by_second(self, zone=None, per_record=1, seconds=86_400):
+        """
+        Returns arrivals per second of the day, optionally for one zone only.
+
+        :param per_record: Requests represented by one log record
+        """
+        rows = self.rows
+        if zone is not None:
+            code = self.zone_code(zone)
+            if code is None:
+                return np.zeros(seconds, dtype=np.int64)
+            rows = rows[rows['zone'] == code]
+        second = rows['second']
+        second = second[(second >= 0) & (second < seconds)]
+        return np.bincount(second, minlength=seconds).astype(np.int64) * per_record
+
+
+class _CodeTable(dict):
+    """
+    Literal text -> code of its value, decoding every distinct text once.
+    Texts with equal values ('a' and "a") share a code.
+    """
+
+    def __init__(self, values=()):
+        super().__init__()
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def __missing__(self, text):
+        value = literal_eval(text)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        self[text] = code
+        return code
+
+
+class _IntensityTable(dict):
+    """
+    Literal text -> (value, kind), decoding every distinct text once.
+    """
+
+    def __missing__(self, text):
+        value = literal_eval(text)
+        if value is None:
+            decoded = (np.nan, INTENSITY_NONE)
+        elif isinstance(value, float):
+            decoded = (value, INTENSITY_FLOAT)
+        else:
+            decoded = (float(value), INTENSITY_INT)
+        self[text] = decoded
+        return decoded
+
+
+def _is_text(value):
+    return value is None or isinstance(value, str)
+
+
+def _is_number(value):
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def _line_fields(line):
+    """
+    Field texts of one line in LINE_RE's group order, via ast.literal_eval if
+    the regex does not match, or None if the line is not a request.
+    """
+    match = LINE_RE.match(line)
+    if match:
+        return match.groups()
+    try:
+        row = literal_eval(line.strip())
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    if not (type(row) is list and len(row) == 5 and type(row[4]) is list and len(row[4]) == 2
+            and _is_text(row[0]) and _is_text(row[1]) and _is_text(row[3]) and _is_text(row[4][1])
+            and type(row[2]) is int and _is_number(row[4][0])):
+        return None
+    placeholder, region, second, prompt, (intensity, zone) = row
+    if not np.iinfo(np.int64).min <= second <= np.iinfo(np.int64).max:
+        return None
+    return repr(placeholder), repr(region), str(second), repr(prompt), repr(intensity), repr(zone)
+
+
+def _parse_block(text, tables, intensities):
+    """
+    :return: (structured array of the requests, number of skipped lines)
+    """
+    matches = LINE_RE.findall(text)
+    lines = [line for line in text.split('\n') if line.strip()]
+    if len(matches) != len(lines):
+        # Some lines need the slow path; parse the block line by line to keep their order
+        matches = [fields for fields in map(_line_fields, lines) if fields is not None]
+    skipped = len(lines) - len(matches)
+    rows = np.empty(len(matches), dtype=REQUEST_DTYPE)
+    if not matches:
+        return rows, skipped
+    placeholders, regions, seconds, prompts, intensity_texts, zones = zip(*matches)
+    rows['second'] = np.array(seconds, dtype=np.int64)
+    values, kinds = zip(*map(intensities.__getitem__, intensity_texts))
+    rows['intensity'] = values
+    rows['intensity_kind'] = kinds
+    for field, texts in zip(STRING_FIELDS, (placeholders, regions, prompts, zones)):
+        table = tables[field]
+        codes = np.fromiter(map(table.__getitem__, texts), dtype=np.int64, count=len(texts))
+        if len(table.values) > np.iinfo(REQUEST_DTYPE[field]).max + 1:
+            raise ValueError(f"Too many distinct values of '{field}' for {REQUEST_DTYPE[field]} codes")
+        rows[field] = codes
+    return rows, skipped
+
+
+def _text_blocks(path, block_size):
+    with open(path, 'r') as f:
+        while True:
+            text = f.read(block_size)
+            if not text:
+                return
+            # Extend the block to the end of the current line
+            yield text + f.readline()
+
+
+def _new_tables():
+    return {field: _CodeTable() for field in STRING_FIELDS}, _IntensityTable()
+
+
+def _log(rows, tables, skipped):
+    return RequestLog(rows, tables['region'].values, tables['zone'].values,
+                      tables['placeholder'].values, tables['prompt'].values, skipped)
+
+
+def report_skipped(path, skipped):
+    if skipped:
+        print(f"Skipped {skipped} malformed lines in {path}")
+
+
+def iter_request_blocks(path, block_size=BLOCK_SIZE):
+    """
+    Yields the log as one RequestLog per block of about `block_size` bytes.
+    Every block has its own code tables, so memory is bounded by the block
+    size however long the log is. Malformed lines are counted in each
+    block's `skipped`.
+    """
+    for text in _text_blocks(path, block_size):
+        tables, intensities = _new_tables()
+        rows, skipped = _parse_block(text, tables, intensities)
+        yield _log(rows, tables, skipped)
+
+
+def parse_requests(path, block_size=BLOCK_SIZE):
+    """
+    Parses a request log into a RequestLog (no caching). Blank lines and
+    lines that are not requests are skipped; the latter are counted and
+    reported.
+    """
+    tables, intensities = _new_tables()
+    blocks, skipped = [], 0
+    for text in _text_blocks(path, block_size):
+        rows, block_skipped = _parse_block(text, tables, intensities)
+        blocks.append(rows)
+        skipped += block_skipped
+    report_skipped(path, skipped)
+    rows = np.concatenate(blocks) if blocks else np.empty(0, dtype=REQUEST_DTYPE)
+    return _log(rows, tables, skipped)
+
+
+def sidecar_paths(path):
+    return path + '.requests.npy', path + '.requests.json'
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def load_requests(path, use_cache=True):
+    """
+    Returns the parsed log, memory-mapping the sidecar when it matches the
+    log's current mtime and size, and (re)writing it otherwise.
+
+    :param path: Path to the request log
+    :param use_cache: Read and write the sidecar files
+    """
+    if not use_cache:
+        return parse_requests(path)
+
+    rows_path, meta_path = sidecar_paths(path)
+    key = _source_key(path)
+    if os.path.exists(meta_path) and os.path.exists(rows_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get("version") == SIDECAR_VERSION and meta.get("source") == key:
+            return RequestLog(np.load(rows_path, mmap_mode='r'), meta["regions"], meta["zones"],
+                              meta["placeholders"], meta["prompts"], meta["skipped"])
+
+    log = parse_requests(path)
+    with open(rows_path + '.tmp', 'wb') as f:
+        np.save(f, log.rows)
+    os.replace(rows_path + '.tmp', rows_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump({"version": SIDECAR_VERSION, "source": key,
+                   "regions": log.regions, "zones": log.zones,
+                   "placeholders": log.placeholders, "prompts": log.prompts, "skipped": log.skipped}, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return log
+
+
+def _intensity_repr(value, kind):
+    if kind == INTENSITY_NONE:
+        return 'None'
+    return repr(value) if kind == INTENSITY_FLOAT else str(int(value))
+
+
+def format_rows(log, rows, zones=None):
+    """
+    Formats rows back into the request-log line layout, as str() of the
+    parsed list.
+
+    :param log: RequestLog whose code tables the rows use
+    :param rows: Structured array of REQUEST_DTYPE
+    :param zones: Zone names for the 'zone' codes, if different from log.zones
+    :return: List of lines without trailing newlines
+    """
+    placeholder_reprs = [repr(placeholder) for placeholder in log.placeholders]
+    region_reprs = [repr(region) for region in log.regions]
+    prompt_reprs = [repr(prompt) for prompt in log.prompts]
+    zone_reprs = [repr(zone) for zone in (log.zones if zones is None else zones)]
+    return [
+        f"[{placeholder_reprs[placeholder]}, {region_reprs[region]}, {second}, {prompt_reprs[prompt]}, "
+        f"[{_intensity_repr(intensity, kind)}, {zone_reprs[zone]}]]"
+        for placeholder, region, second, prompt, intensity, kind, zone in zip(
+            rows['placeholder'].tolist(), rows['region'].tolist(), rows['second'].tolist(), rows['prompt'].tolist(),
+            rows['intensity'].tolist(), rows['intensity_kind'].tolist(), rows['zone'].tolist())
+    ]
+
+
+if __name__ == "__main__":
+    # Example usage: python request_log.py requests_CAISO.txt
+    log = load_requests(sys.argv[1] if len(sys.argv) > 1 else 'requests_CAISO.txt')
+    print(f"{len(log)} requests, {len(log.regions)} regions, {len(log.zones)} zones")
@@ -0,0 +1,240 @@
+import sys
+
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix
+
+from request_join import profile_from_averages
+from request_log import load_requests
+from temporal_scheduler import ENERGY_PER_REQUEST_KWH, REQUESTS_PER_RECORD
+from zone_groups import zone_continent, zone_country
+
+# Spatial shifting: requests are routed from their origin zone (the zone on
+# each request-log row) to candidate datacenter zones, hour by hour, so that
+# total gCO2 is minimal. Each candidate serves at most `capacity` requests per
+# hour and a request may only move to a zone whose added network latency is
+# within `max_latency_ms`; an optional budget bounds the mean added latency.
+# Requests that cannot be placed run in their origin zone, as they do today.
+#
+# This is a transportation LP over (hour, origin, candidate) triples. Costs
+# are built for all 24 hours at once by broadcasting, only feasible triples
+# with demand become variables, and all hours are solved as one sparse LP
+# with HiGHS.
+
+# Added round-trip latency in ms by how far apart two zones are
+LATENCY_MS = {
+    'zone': 0.0,
+    'country': 10.0,
+    'continent': 40.0,
+    'intercontinental': 150.0,
+}
+
+
+def latency_matrix(origins, candidates, latency_ms=None):
+    """
+    Added latency of moving a request from each origin to each candidate zone.
+
+    :param latency_ms: Overrides for LATENCY_MS
+    :return: float64 matrix (origins, candidates) in ms
+    """
+    latency_ms = {**LATENCY_MS, **(latency_ms or {})}
+    origins, candidates = list(origins), list(candidates)
+    zones = origins + candidates
+    zone_codes = np.unique(zones, return_inverse=True)[1]
+    country_codes = np.unique([zone_country(zone) for zone in zones], return_inverse=True)[1]
+    # Zones of unknown continent only share a continent with their own country
+    continent_codes = np.unique([zone_continent(zone) or '?' + zone_country(zone) for zone in zones],
+                                return_inverse=True)[1]
+
+    def same(codes):
+        return codes[:len(origins), None] == codes[None, len(origins):]
+
+    latency = np.full((len(origins), len(candidates)), latency_ms['intercontinental'])
+    latency[same(continent_codes)] = latency_ms['continent']
+    latency[same(country_codes)] = latency_ms['country']
+    latency[same(zone_codes)] = latency_ms['zone']
+    return latency
+
+
+def demand_by_hour(logs, per_record=REQUESTS_PER_RECORD):
+    """
+    Counts requests per origin zone and hour of day over one or more logs.
+
+    :param logs: RequestLog or list of RequestLogs
+    :return: (zones, int64 matrix (24, zones))
+    """
+    logs = logs if isinstance(logs, (list, tuple)) else [logs]
+    zones = sorted({zone for log in logs for zone in log.zones})
+    zone_index = {zone: i for i, zone in enumerate(zones)}
+    demand = np.zeros((len(zones), 24), dtype=np.int64)
+    for log in logs:
+        codes = np.array([zone_index[zone] for zone in log.zones] or [0], dtype=np.int64)
+        second = log.rows['second']
+        valid = (second >= 0) & (second < 86_400)
+        keys = codes[log.rows['zone'][valid]] * 24 + second[valid] // 3600
+        demand += np.bincount(keys, minlength=len(zones) * 24).reshape(len(zones), 24)
+    return zones, demand.T * per_record
+
+
+def hourly_intensity(profile, zones):
+    """
+    Returns the (24, zones) intensity of `zones` from an HourlyProfile. Hours
+    without a value take the zone's mean; unknown zones are all NaN.
+    """
+    rows = np.array([profile.zone_index(zone) for zone in zones], dtype=np.int64)
+    values = np.full((len(zones), 24), np.nan)
+    known = rows >= 0
+    values[known] = profile.values[rows[known]]
+    counts = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nansum(values, axis=1) / counts
+    values = np.where(np.isnan(values), means[:, None], values)
+    return values.T
+
+
+def cost_matrix(candidate_intensity, latency, max_latency_ms, energy_per_request=ENERGY_PER_REQUEST_KWH,
+                latency_weight=0.0):
+    """
+    gCO2 per request for every (hour, origin, candidate), inf where the move
+    exceeds `max_latency_ms` or the candidate has no intensity.
+
+    :param candidate_intensity: (24, candidates) gCO2/kWh
+    :param latency: (origins, candidates) added latency in ms
+    :param latency_weight: Extra cost in g per request and ms of added latency
+    """
+    cost = candidate_intensity[:, None, :] * energy_per_request + latency_weight * latency[None, :, :]
+    cost = np.where(latency[None, :, :] <= max_latency_ms, cost, np.inf)
+    return np.where(np.isnan(cost), np.inf, cost)
+
+
+def optimize(demand, origin_intensity, candidate_intensity, capacity, latency, max_latency_ms,
+             latency_budget_ms=None, energy_per_request=ENERGY_PER_REQUEST_KWH, latency_weight=0.0):
+    """
+    Routes the requests of a day with minimal total gCO2.
+
+    :param demand: (24, origins) requests per hour and origin zone
+    :param origin_intensity: (24, origins) intensity where the requests arise
+    :param candidate_intensity: (24, candidates) intensity of the candidate zones
+    :param capacity: Requests per hour each candidate serves (scalar, (candidates,) or (24, candidates))
+    :param latency: (origins, candidates) added latency in ms
+    :param max_latency_ms: Largest added latency allowed for a single request
+    :param latency_budget_ms: Largest mean added latency over all requests (optional)
+    :return: (flow (24, origins, candidates), local (24, origins)) request counts
+    """
+    demand = np.asarray(demand, dtype=np.float64)
+    n_hours, n_origins = demand.shape
+    n_candidates = candidate_intensity.shape[1]
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=np.float64), (n_hours, n_candidates))
+    # Unlimited capacity: no candidate can take more than the hour's demand
+    capacity = np.minimum(capacity, demand.sum(axis=1, keepdims=True))
+
+    cost = cost_matrix(candidate_intensity, latency, max_latency_ms, energy_per_request, latency_weight)
+    # Origin intensity unknown: keeping the request local costs nothing we can count
+    local_cost = np.nan_to_num(origin_intensity * energy_per_request)
+    # A move that is not cheaper than running locally never helps (local has
+    # no capacity limit), so only cheaper moves become variables
+    feasible = (cost < local_cost[:, :, None]) & (demand[:, :, None] > 0) & (capacity[:, None, :] > 0)
+    hour, origin, candidate = np.nonzero(feasible)
+    active_h, active_o = np.nonzero(demand > 0)
+    n_moves, n_local = len(hour), len(active_h)
+    c = np.concatenate([cost[hour, origin, candidate], local_cost[active_h, active_o]])
+
+    # Every (hour, origin) with demand is fully served: moved + local == demand
+    eq_row = np.full((n_hours, n_origins), -1, dtype=np.int64)
+    eq_row[active_h, active_o] = np.arange(n_local)
+    a_eq = coo_matrix((np.ones(n_moves + n_local),
+                       (np.concatenate([eq_row[hour, origin], np.arange(n_local)]),
+                        np.arange(n_moves + n_local))),
+                      shape=(n_local, n_moves + n_local))
+    b_eq = demand[active_h, active_o]
+
+    # Each candidate serves at most its capacity per hour
+    ub_rows = hour * n_candidates + candidate
+    ub_data = np.ones(n_moves)
+    b_ub = capacity.ravel()
+    ub_cols = np.arange(n_moves)
+    n_ub = n_hours * n_candidates
+    if latency_budget_ms is not None:
+        ub_rows = np.concatenate([ub_rows, np.full(n_moves, n_ub)])
+        ub_data = np.concatenate([ub_data, latency[origin, candidate]])
+        ub_cols = np.concatenate([ub_cols, ub_cols])
+        b_ub = np.append(b_ub, latency_budget_ms * demand.sum())
+        n_ub += 1
+    a_ub = coo_matrix((ub_data, (ub_rows, ub_cols)), shape=(n_ub, n_moves + n_local))
+
+    result = linprog(c, A_ub=a_ub.tocsr(), b_ub=b_ub, A_eq=a_eq.tocsr(), b_eq=b_eq,
+                     bounds=(0, None), method='highs')
+    if not result.success:
+        raise RuntimeError(f"Routing LP failed: {result.message}")
+
+    # Transportation LPs with integer data have integer optimal vertices; the
+    # latency budget can make moves fractional, and their remainders stay local
+    flow = np.zeros((n_hours, n_origins, n_candidates))
+    flow[hour, origin, candidate] = np.floor(result.x[:n_moves] + 1e-6)
+    local = demand - flow.sum(axis=2)
+    return flow, local
+
+
+def report(demand, origin_intensity, candidate_intensity, latency, flow, local,
+           energy_per_request=ENERGY_PER_REQUEST_KWH):
+    """
+    :return: Dict with baseline and routed gCO2, savings and added latency
+    """
+    origin_g = np.nan_to_num(origin_intensity) * energy_per_request
+    baseline_g = float((demand * origin_g).sum())
+    routed_g = float((flow * np.nan_to_num(candidate_intensity)[:, None, :]).sum() * energy_per_request
+                     + (local * origin_g).sum())
+    total = float(demand.sum())
+    added_latency = float((flow * latency[None, :, :]).sum())
+    return {
+        "requests": int(total),
+        "baseline_gCO2": baseline_g,
+        "routed_gCO2": routed_g,
+        "saved_gCO2": baseline_g - routed_g,
+        "saved_pct": 100 * (baseline_g - routed_g) / baseline_g if baseline_g else 0.0,
+        "moved_requests": int(flow.sum()),
+        "local_requests": int(local.sum()),
+        "mean_added_latency_ms": added_latency / total if total else 0.0,
+    }
+
+
+def optimize_logs(requests_paths, candidates=None, capacity=np.inf, max_latency_ms=50.0,
+                  latency_budget_ms=None, averages_path='hourly_average.json', latency_ms=None,
+                  per_record=REQUESTS_PER_RECORD):
+    """
+    Routes the traffic of one or more request logs against the hourly average
+    profile.
+
+    :param candidates: Candidate zones (default: every zone with a complete profile)
+    :return: (origins, candidates, flow, local, report dict)
+    """
+    profile = profile_from_averages(averages_path)
+    if candidates is None:
+        complete = ~np.isnan(profile.values).any(axis=1)
+        candidates = [zone for zone, ok in zip(profile.zones, complete.tolist()) if ok]
+    paths = [requests_paths] if isinstance(requests_paths, str) else requests_paths
+    origins, demand = demand_by_hour([load_requests(path) for path in paths], per_record)
+
+    origin_intensity = hourly_intensity(profile, origins)
+    candidate_intensity = hourly_intensity(profile, candidates)
+    latency = latency_matrix(origins, candidates, latency_ms)
+    flow, local = optimize(demand, origin_intensity, candidate_intensity, capacity, latency,
+                           max_latency_ms, latency_budget_ms)
+    summary = report(demand, origin_intensity, candidate_intensity, latency, flow, local)
+    return origins, candidates, flow, local, summary
+
+
+if __name__ == "__main__":
+    # Example usage: python spatial_optimizer.py requests_CAISO.txt 100000 50
+    requests_path = sys.argv[1] if len(sys.argv) > 1 else 'requests_CAISO.txt'
+    capacity = float(sys.argv[2]) if len(sys.argv) > 2 else np.inf
+    max_latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50.0
+
+    origins, candidates, flow, local, summary = optimize_logs(requests_path, capacity=capacity,
+                                                              max_latency_ms=max_latency_ms)
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
+    served = flow.sum(axis=(0, 1))
+    for i in np.argsort(-served)[:10].tolist():
+        if served[i]:
+            print(f"  {candidates[i]}: {int(served[i])} requests")
@@ -0,0 +1,132 @@
+import codecs
+import json
+import os
+
+import numpy as np
+
+from intensity_store import frame_from_records
+
+# Streaming reader for carbon_intensity.json files in the list-of-dicts layout.
+# The file is read in fixed-size chunks and decoded one {"time", "data"} entry
+# at a time, so memory stays bounded by the chunk size plus a single entry
+# instead of the whole document and its Python object graph.
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = ' \t\r\n'
+
+
+def iter_records(file_path, chunk_size=CHUNK_SIZE, offset=0, with_offsets=False):
+    """
+    Yields the {"time": ..., "data": {...}} entries of a JSON array file.
+
+    :param file_path: Path to a carbon_intensity.json-style file
+    :param chunk_size: Number of bytes read per chunk
+    :param offset: Byte offset to start at: 0, or the end of an entry
+                   reported by an earlier pass with `with_offsets`
+    :param with_offsets: Yield (entry, byte offset just after the entry)
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        buffer = ''
+        pos = 0
+        started = offset > 0
+        eof = False
+        # Byte offset of buffer[counted], advanced lazily when offsets are wanted
+        position = offset
+        counted = 0
+        while True:
+            # Skip separators between entries
+            while pos < len(buffer) and (buffer[pos] in _WHITESPACE or buffer[pos] == ','
+                                         or (not started and buffer[pos] == '[')):
+                started = started or buffer[pos] == '['
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if pos < len(buffer):
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    record = None
+                # An entry ending exactly at the buffer end may still be a
+                # truncated number or literal, so decode it again with more data
+                if record is not None and (end < len(buffer) or eof):
+                    pos = end
+                    if with_offsets:
+                        position += len(buffer[counted:end].encode('utf-8'))
+                        counted = end
+                        yield record, position
+                    else:
+                        yield record
+                    continue
+                if eof:
+                    raise ValueError(f"Truncated or malformed JSON in {file_path} at offset {pos}")
+            if eof:
+                return
+            raw = f.read(chunk_size)
+            eof = not raw
+            if with_offsets:
+                position += len(buffer[counted:pos].encode('utf-8'))
+                counted = 0
+            buffer = buffer[pos:] + text_decoder.decode(raw, final=eof)
+            pos = 0
+
+
+def entry_boundary(file_path, offset):
+    """
+    True if `offset` is the end of an entry of a JSON array file, i.e. the
+    file has a '}' before it and a ',' or ']' after it. data.py rewrites
+    carbon_intensity.json with the same prefix when it appends an entry, so
+    an offset from an earlier iter_records pass stays valid until the file
+    is replaced by a different one.
+    """
+    if offset <= 0 or not os.path.exists(file_path) or os.path.getsize(file_path) <= offset:
+        return False
+    with open(file_path, 'rb') as f:
+        f.seek(offset - 1)
+        tail = f.read(64)
+    return tail[:1] == b'}' and tail[1:].lstrip()[:1] in (b',', b']')
+
+
+def iter_values(records):
+    """
+    Flattens entries into (timestamp, zone, value) tuples.
+
+    :param records: Iterable of entries, e.g. iter_records(file_path)
+    """
+    for record in records:
+        time = np.datetime64(record["time"], 's')
+        for zone, value in record["data"].items():
+            yield time, zone, value
+
+
+def iter_record_arrays(records):
+    """
+    Yields (timestamp, zones, values) per entry, with zones and values as arrays.
+
+    :param records: Iterable of entries, e.g. iter_records(file_path)
+    """
+    for record in records:
+        data = record["data"]
+        yield (np.datetime64(record["time"], 's'),
+               np.array(list(data.keys()), dtype=str),
+               np.fromiter(data.values(), dtype=np.float64, count=len(data)))
+
+
+def iter_frames(records, batch_size=1024):
+    """
+    Groups entries into IntensityFrames of at most `batch_size` timestamps,
+    which the frame-based aggregation and query code consumes batch by batch.
+
+    :param records: Iterable of entries, e.g. iter_records(file_path)
+    :param batch_size: Timestamps per frame
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield frame_from_records(batch)
+            batch = []
+    if batch:
+        yield frame_from_records(batch)
@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://api.electricitymap.org/v3'
+ZONES_CACHE_FILE = 'zones_cache.json'
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting requests to `rate` per second with
+    bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ZoneListCache:
+    """
+    On-disk cache of the zone list, revalidated with ETag after `ttl` seconds.
+    While the API is unreachable the stale list is served.
+    """
+
+    def __init__(self, path=ZONES_CACHE_FILE, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, etag, zones):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"etag": etag, "fetched_at": time.time(), "zones": zones}, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, fetcher, path='zones'):
+        """
+        Returns the cached zone list if still fresh, otherwise revalidates it
+        with a conditional request through `fetcher` (rate limited and
+        retried) and refreshes the cache. If that fails, the stale list is
+        returned; without a cached list the error is raised.
+        """
+        cached = self.load()
+        if cached and time.time() - cached["fetched_at"] < self.ttl:
+            return cached["zones"]
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        try:
+            response = fetcher.request(path, headers=headers)
+        except requests.RequestException as e:
+            if not cached:
+                raise
+            print(f"Zone list refresh failed ({e}), using the cached list")
+            return cached["zones"]
+        if response.status_code == 304 and cached:
+            self.save(cached["etag"], cached["zones"])
+            return cached["zones"]
+        zones = list(response.json().keys())
+        self.save(response.headers.get("ETag"), zones)
+        return zones
+
+
+class ZoneFetcher:
+    """
+    Fetches the latest carbon intensity of many zones concurrently over one
+    pooled session.
+
+    :param api_key: Electricity Maps auth token
+    :param base_url: API root, e.g. a local stand-in server for benchmarks
+    :param max_workers: Maximum number of requests in flight
+    :param rate: Maximum requests per second (token bucket)
+    :param retries: Attempts per zone after the first failure
+    :param backoff: Base delay in seconds, doubled for every retry
+    :param zone_cache: ZoneListCache, or None to always download the zone list
+    """
+
+    def __init__(self, api_key="your-api-key", base_url=API_URL, max_workers=16, rate=50,
+                 retries=3, backoff=0.5, zone_cache=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate)
+        self.zone_cache = zone_cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, path, params=None, headers=None):
+        """
+        GETs `path` under the rate limit, retrying transient failures with
+        exponential backoff and jitter.
+
+        :param headers: Extra request headers, e.g. If-None-Match
+        :return: The response; other error statuses raise requests.HTTPError
+        """
+        url = f'{self.base_url}/{path}'
+        headers = {"auth-token": self.api_key, **(headers or {})}
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=30, headers=headers)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} for {response.url}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+        raise error
+
+    def get_json(self, path, params=None):
+        """
+        GETs `path` like request() and decodes the JSON body.
+        """
+        return self.request(path, params).json()
+
+    def get_zone_ids(self):
+        if self.zone_cache is not None:
+            return self.zone_cache.get(self)
+        return list(self.get_json('zones').keys())
+
+    def get_carbon_intensity(self, zone_id):
+        data = self.get_json('carbon-intensity/latest', params={"zone": zone_id})
+        return data.get('carbonIntensity', None)
+
+    def _fetch_zone(self, zone_id):
+        try:
+            return zone_id, self.get_carbon_intensity(zone_id)
+        except requests.RequestException as e:
+            print(f"Failed to fetch {zone_id}: {e}")
+            return zone_id, None
+
+    def get_zone_carbon_intensity_dict(self, zone_ids=None):
+        """
+        Returns {zone: carbon intensity} for every zone that answered.
+        Zones that still fail after all retries are left out, like before.
+        """
+        if zone_ids is None:
+            zone_ids = self.get_zone_ids()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(self._fetch_zone, zone_ids)
+            return {zone_id: value for zone_id, value in results if value is not None}
+
+    def get_carbon_intensity_history(self, zone_id, start=None, end=None):
+        """
+        Returns the hourly history of a zone as a list of (UTC ISO datetime,
+        carbon intensity): the last 24 hours, or [start, end) through the
+        past-range endpoint when both are given (ISO datetimes).
+        """
+        if start is None:
+            data = self.get_json('carbon-intensity/history', params={"zone": zone_id})
+            points = data.get('history', [])
+        else:
+            data = self.get_json('carbon-intensity/past-range',
+                                 params={"zone": zone_id, "start": start, "end": end})
+            points = data.get('data', [])
+        return [(point['datetime'], point['carbonIntensity']) for point in points
+                if point.get('carbonIntensity') is not None]
+
+    def _fetch_history(self, zone_id, start, end):
+        try:
+            return zone_id, self.get_carbon_intensity_history(zone_id, start, end)
+        except requests.RequestException as e:
+            print(f"Failed to fetch history of {zone_id}: {e}")
+            return zone_id, []
+
+    def get_zone_history_dict(self, zone_ids=None, start=None, end=None):
+        """
+        Returns {zone: [(UTC ISO datetime, carbon intensity)]} for every zone,
+        fetched concurrently like get_zone_carbon_intensity_dict.
+        """
+        if zone_ids is None:
+            zone_ids = self.get_zone_ids()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda zone_id: self._fetch_history(zone_id, start, end), zone_ids)
+            return {zone_id: points for zone_id, points in results if points}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,40 @@
+# Region groups of Electricity Maps zones, keyed on the country part of the
+# zone code ('US-CAL-CISO' -> 'US'). CONTINENTS covers every country in the
+# collected history; REGION_GROUPS are the groups compared in boxplots.py.
+
+CONTINENTS = {
+    'NA': ['US', 'CA', 'MX', 'AW', 'CR', 'DO', 'GP', 'GT', 'HN', 'MQ', 'NI', 'PA'],
+    'SA': ['AR', 'BO', 'BR', 'CL', 'CO', 'GF', 'PE', 'UY'],
+    'EU': ['AT', 'AX', 'BA', 'BE', 'BG', 'CH', 'CY', 'CZ', 'DE', 'DK', 'EE', 'ES', 'FI', 'FO', 'FR',
+           'GB', 'GE', 'GR', 'HR', 'HU', 'IE', 'IS', 'IT', 'LT', 'LU', 'LV', 'MD', 'ME', 'MK', 'NL',
+           'NO', 'PL', 'PT', 'RO', 'RS', 'RU', 'SE', 'SI', 'SK', 'TR', 'XK'],
+    'APAC': ['AU', 'BD', 'HK', 'ID', 'IN', 'JP', 'KR', 'LK', 'MY', 'NZ', 'PF', 'PH', 'SG', 'TH', 'TW'],
+    'MEA': ['AE', 'BH', 'IL', 'KW', 'NG', 'OM', 'QA', 'RE', 'ZA'],
+}
+
+REGION_GROUPS = {
+    'US': ['US'],
+    'EU': CONTINENTS['EU'],
+    'APAC': CONTINENTS['APAC'],
+}
+
+_COUNTRY_CONTINENT = {country: continent for continent, countries in CONTINENTS.items() for country in countries}
+
+
+def zone_country(zone):
+    return zone.split('-')[0]
+
+
+def zone_continent(zone):
+    """
+    Returns the continent key of a zone, or None if its country is unknown.
+    """
+    return _COUNTRY_CONTINENT.get(zone_country(zone))
+
+
+def zones_in_group(zones, group):
+    """
+    Filters zone codes to those in a REGION_GROUPS or CONTINENTS group.
+    """
+    countries = set(REGION_GROUPS.get(group) or CONTINENTS[group])
+    return [zone for zone in zones if zone_country(zone) in countries]
@@ -0,0 +1,153 @@
+import os
+import sys
+
+import numpy as np
+
+from hourly_aggregate import STATE_FILE, HourlyAggregate
+from zone_groups import CONTINENTS, REGION_GROUPS, zone_country
+
+# Presorted "cleanest zones" index for routing decisions. For every bucket of
+# a kind ('hour': hour of day, 'weekday_hour': weekday * 24 + hour) the zones
+# are sorted by their average carbon intensity once, per zone group, so a
+# top-k query is a slice of a precomputed row:
+#
+#   index.top_k(hour=3, k=5, group='EU')
+#
+# The averages come from an HourlyAggregate. When it folds in new hours,
+# update() re-sorts only the buckets whose averages changed, which for one new
+# sample is one hour and one hour of the week.
+
+INDEX_FILE = 'zone_ranking.npz'
+KINDS = ('hour', 'weekday_hour')
+GROUPS = {**CONTINENTS, **REGION_GROUPS}
+ALL = 'all'
+
+
+class RankingIndex:
+    """
+    Zones sorted by average carbon intensity, per bucket and zone group.
+
+    :param zones: Zone codes, one per column of the means matrices
+    :param means: {kind: matrix (buckets, zones)}, NaN where nothing was collected
+    """
+
+    def __init__(self, zones, means):
+        self.zones = list(zones)
+        self._zone_array = np.array(self.zones, dtype=object)
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+        self.means = {kind: np.array(matrix, dtype=np.float64) for kind, matrix in means.items()}
+        countries = np.array([zone_country(zone) for zone in self.zones], dtype=object)
+        self.members = {ALL: np.ones(len(self.zones), dtype=bool)}
+        self.members.update({group: np.isin(countries, countries_in) for group, countries_in in GROUPS.items()})
+        # order[kind][group]: (buckets, zones) columns, cleanest first; the
+        # first lengths[kind][group][bucket] entries of a row are valid
+        self.order = {kind: {} for kind in self.means}
+        self.lengths = {kind: {} for kind in self.means}
+        for kind in self.means:
+            self._sort(kind, np.arange(self.means[kind].shape[0]))
+
+    @classmethod
+    def from_aggregate(cls, aggregate, kinds=KINDS):
+        return cls(aggregate.zones, {kind: aggregate.means(kind) for kind in kinds})
+
+    def _sort(self, kind, buckets):
+        means = self.means[kind][buckets]
+        # NaN sorts last, so zones without data fall off the end of every row
+        order = np.argsort(means, axis=1, kind='stable')
+        valid = ~np.isnan(np.take_along_axis(means, order, axis=1))
+        n_buckets = self.means[kind].shape[0]
+        for group, member in self.members.items():
+            keep = valid & member[order]
+            lengths = keep.sum(axis=1)
+            # Stable partition of each row: kept columns first, in sorted order
+            grouped = np.take_along_axis(order, np.argsort(~keep, axis=1, kind='stable'), axis=1)
+            if group not in self.order[kind]:
+                self.order[kind][group] = np.zeros((n_buckets, len(self.zones)), dtype=np.intp)
+                self.lengths[kind][group] = np.zeros(n_buckets, dtype=np.intp)
+            self.order[kind][group][buckets] = grouped
+            self.lengths[kind][group][buckets] = lengths
+
+    def update(self, aggregate):
+        """
+        Refreshes the index from an updated aggregate, re-sorting only the
+        buckets whose averages changed.
+
+        :return: {kind: number of re-sorted buckets}
+        """
+        if aggregate.zones != self.zones:
+            rebuilt = RankingIndex.from_aggregate(aggregate, tuple(self.means))
+            self.__dict__.update(rebuilt.__dict__)
+            return {kind: matrix.shape[0] for kind, matrix in self.means.items()}
+        resorted = {}
+        for kind in self.means:
+            means = aggregate.means(kind)
+            changed = np.flatnonzero(~((means == self.means[kind]) | (np.isnan(means) & np.isnan(self.means[kind])))
+                                     .all(axis=1))
+            if len(changed):
+                self.means[kind][changed] = means[changed]
+                self._sort(kind, changed)
+            resorted[kind] = len(changed)
+        return resorted
+
+    def top_k_indices(self, bucket, k, group=ALL, kind='hour'):
+        """
+        Columns of the `k` cleanest zones of `group` in a bucket.
+        """
+        order = self.order[kind][group]
+        return order[bucket, :min(k, self.lengths[kind][group][bucket])]
+
+    def top_k(self, hour, k=5, group=ALL, weekday=None):
+        """
+        The `k` cleanest zones at an hour of day (on a weekday, Monday == 0, if given).
+
+        :param group: 'all', a REGION_GROUPS key ('US', 'EU', 'APAC') or a CONTINENTS key
+        :return: List of (zone, average carbon intensity), cleanest first
+        """
+        if weekday is None:
+            kind, bucket = 'hour', hour
+        else:
+            kind, bucket = 'weekday_hour', weekday * 24 + hour
+        columns = self.top_k_indices(bucket, k, group, kind)
+        return list(zip(self._zone_array[columns].tolist(), self.means[kind][bucket, columns].tolist()))
+
+    def rank_of(self, zone, hour, group=ALL, weekday=None):
+        """
+        1-based rank of a zone within `group` at an hour, or None if it has no data.
+        """
+        kind, bucket = ('hour', hour) if weekday is None else ('weekday_hour', weekday * 24 + hour)
+        row = self.order[kind][group][bucket, :self.lengths[kind][group][bucket]]
+        position = np.flatnonzero(row == self._zone_index[zone])
+        return int(position[0]) + 1 if len(position) else None
+
+    def save(self, path=INDEX_FILE):
+        arrays = {f'means_{kind}': matrix for kind, matrix in self.means.items()}
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, zones=np.array(self.zones, dtype=str), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        # Only the averages are stored; sorting them again takes milliseconds
+        with np.load(path) as state:
+            means = {name[len('means_'):]: state[name] for name in state.files if name.startswith('means_')}
+            return cls(state['zones'].tolist(), means)
+
+
+if __name__ == "__main__":
+    # Example usage: python zone_ranking.py 3 5 EU [weekday]
+    # (after average_carbon_intensity.py has written hourly_average_state.npz)
+    import time
+    hour = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    group = sys.argv[3] if len(sys.argv) > 3 else ALL
+    weekday = int(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    index = RankingIndex.load() if os.path.exists(INDEX_FILE) else RankingIndex.from_aggregate(HourlyAggregate.load(STATE_FILE))
+    for rank, (zone, value) in enumerate(index.top_k(hour, k, group, weekday), start=1):
+        print(f"{rank:>3} {zone:<15} {value:.1f}")
+
+    runs = 100000
+    start = time.perf_counter()
+    for _ in range(runs):
+        index.top_k_indices(hour, k, group)
+    print(f"top-{k} lookup: {1e6 * (time.perf_counter() - start) / runs:.2f} µs")
@@ -0,0 +1,151 @@
+import sys
+
+import numpy as np
+
+# Per-zone summary statistics of a zone × time matrix, computed for all zones
+# at once with axis-wise reductions. Missing samples (mask False or NaN) are
+# left out of every statistic; zones without samples get NaN throughout.
+#
+# Percentiles use the same linear interpolation as np.percentile: each row is
+# sorted once with the missing samples moved to the end, and the two order
+# statistics around (count - 1) * q / 100 are gathered per zone. The
+# below-median mean and the other statistics reuse the same sorted matrix.
+
+DEFAULT_PERCENTILES = (25, 50, 75)
+
+
+class ZoneStats:
+    """
+    Table of statistics, one row per zone.
+
+    :param zones: Zone codes
+    :param columns: {name: array with one value per zone}
+    """
+
+    def __init__(self, zones, columns):
+        self.zones = list(zones)
+        self.columns = columns
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __repr__(self):
+        return f"ZoneStats({len(self.zones)} zones, columns {list(self.columns)})"
+
+    def zone_index(self, zone):
+        return self._zone_index.get(zone)
+
+    def column(self, name):
+        """
+        {zone: value} of a column, without the zones where it is undefined.
+        """
+        values = self.columns[name]
+        valid = ~np.isnan(values)
+        return dict(zip(np.array(self.zones, dtype=object)[valid].tolist(), values[valid].tolist()))
+
+    def combined(self, weights):
+        """
+        Weighted sum of columns, e.g. {'std': 1.0, 'below_median_mean': 0.5}.
+        """
+        return sum(weight * self.columns[name] for name, weight in weights.items())
+
+    def ranked(self, key, descending=False):
+        """
+        (zone, value) pairs sorted by a column name or an array of scores;
+        zones where the score is undefined are left out.
+        """
+        scores = self.columns[key] if isinstance(key, str) else np.asarray(key)
+        valid = np.flatnonzero(~np.isnan(scores))
+        order = valid[np.argsort(-scores[valid] if descending else scores[valid], kind='stable')]
+        return [(self.zones[row], float(scores[row])) for row in order]
+
+
+def _percentile_name(q):
+    return f"p{q:g}"
+
+
+def compute_stats(values, mask=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Statistics of every row of a zone × time matrix.
+
+    :param values: Matrix (zones, times); NaN counts as missing
+    :param mask: Boolean matrix of the same shape, True where a value exists (optional)
+    :param percentiles: Percentiles in [0, 100] to compute, named 'p25', 'p50', ...
+    :return: {name: array per zone} with 'count', 'mean', 'std' (population,
+             like np.std), 'min', 'max', 'cv' (std / mean), the percentiles,
+             'median', 'below_median_mean' (mean of the samples strictly below
+             the median, NaN if there are none) and 'constant' (all samples equal)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    if mask is not None:
+        present &= np.asarray(mask, dtype=bool)
+    data = np.where(present, values, np.nan)
+    n_zones, n_times = data.shape
+
+    count = present.sum(axis=1)
+    has_data = count > 0
+    safe_count = np.maximum(count, 1)
+    zeroed = np.where(present, data, 0.0)
+    mean = np.where(has_data, zeroed.sum(axis=1) / safe_count, np.nan)
+    deviation = np.where(present, data - mean[:, None], 0.0)
+    std = np.where(has_data, np.sqrt((deviation ** 2).sum(axis=1) / safe_count), np.nan)
+
+    # np.sort moves NaN to the end, so the first `count` entries of a row are its samples
+    ordered = np.sort(data, axis=1)
+    rows = np.arange(n_zones)
+    last = np.maximum(count - 1, 0)
+    minimum = np.where(has_data, ordered[:, 0] if n_times else np.nan, np.nan)
+    maximum = np.where(has_data, ordered[rows, last] if n_times else np.nan, np.nan)
+
+    def percentile(q):
+        if not n_times:
+            return np.full(n_zones, np.nan)
+        position = last * (q / 100.0)
+        below = np.floor(position).astype(np.intp)
+        above = np.minimum(below + 1, last)
+        low, high = ordered[rows, below], ordered[rows, above]
+        return np.where(has_data, low + (position - below) * (high - low), np.nan)
+
+    stats = {"count": count, "mean": mean, "std": std, "min": minimum, "max": maximum}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats["cv"] = std / mean
+    for q in percentiles:
+        stats[_percentile_name(q)] = percentile(q)
+    median = stats.get("p50")
+    stats["median"] = median if median is not None else percentile(50)
+
+    below = present & (data < stats["median"][:, None])
+    below_count = below.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats["below_median_mean"] = np.where(below_count > 0, np.where(below, data, 0.0).sum(axis=1) / below_count,
+                                              np.nan)
+    stats["constant"] = has_data & (minimum == maximum)
+    return stats
+
+
+def zone_stats(frame, percentiles=DEFAULT_PERCENTILES):
+    """
+    Statistics table of an IntensityFrame (uses the frame's mask).
+    """
+    return ZoneStats(frame.zones, compute_stats(frame.values, frame.mask, percentiles))
+
+
+def print_stats(stats, key='std', descending=True, top=20):
+    print(f"{'zone':<14}{'count':>7}{'mean':>9}{'std':>9}{'min':>7}{'p50':>9}{'max':>7}{'cv':>7}")
+    for zone, _ in stats.ranked(key, descending)[:top]:
+        row = stats.zone_index(zone)
+        print(f"{zone:<14}{stats['count'][row]:>7}{stats['mean'][row]:>9.1f}{stats['std'][row]:>9.1f}"
+              f"{stats['min'][row]:>7.0f}{stats['median'][row]:>9.1f}{stats['max'][row]:>7.0f}{stats['cv'][row]:>7.2f}")
+
+
+if __name__ == "__main__":
+    # Example usage: python zone_stats.py carbon_intensity.json std
+    from intensity_query import IntensityQuery
+    path = sys.argv[1] if len(sys.argv) > 1 else 'carbon_intensity.json'
+    key = sys.argv[2] if len(sys.argv) > 2 else 'std'
+    print_stats(zone_stats(IntensityQuery.open(path).frame), key)